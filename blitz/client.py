@@ -2,13 +2,18 @@ __author__ = 'Will Hart'
 
 import logging
 import os.path
+import threading
+import time
 import tornado.httpserver
 import tornado.ioloop
 import tornado.web
 
 from blitz.constants import CommunicationCodes
 from blitz.data.database import DatabaseClient
+from blitz.data.download import DownloadQueue
+from blitz.data.models import Session
 from blitz.communications.boards import BoardManager
+from blitz.communications.client_states import ClientIdleState
 import blitz.communications.signals as sigs
 from blitz.communications.tcp import TcpCommunicationException, TcpBase
 import blitz.web.api as blitz_api
@@ -32,7 +37,14 @@ class Config(object):
             "database_path": os.path.join(os.path.dirname(__file__), "data", "app.db"),
             "port": 8989,
             "autoescape": None,
-            "debug": True
+            "debug": True,
+            "compress_downloads": True,
+            "tcp_host": "127.0.0.1",
+            "tcp_port": 8999,
+            "tcp_asynchronous": False,
+            "download_port": 9000,
+            "prefetch_sessions": False,
+            "session_list_page": 500
         }
 
     def get(self, key):
@@ -77,10 +89,16 @@ class ApplicationClient(object):
     web or desktop type applications
     """
 
+    SESSION_BATCH_SIZE = 50
+
+    # the DOWNLOAD options which do not change the frames that are downloaded
+    TRANSFER_OPTIONS = ("chunk", "window", "offset", "zlib")
+
     def __init__(self):
         """
         Create a new client web application, setting defaults
         """
+        self.started_at = time.time()
 
         # create a file logger and set it up for logging to file
         logging.basicConfig(filename='client_log.txt', level=logging.DEBUG,
@@ -97,22 +115,33 @@ class ApplicationClient(object):
         self.data.clear_errors()
         self.logger.info("Initialised DatabaseClient")
 
-        # create an empty TCP connection
+        # create an empty TCP connection, and an empty connection to the download channel
         self.tcp = None
+        self.download_tcp = None
 
         # create a board manager
         self.board_manager = BoardManager(self.data)
 
+        # sessions waiting to be downloaded in the background
+        self.download_queue = DownloadQueue()
+        self.__prefetch = False
+
         # save variables for later
         self.config['board_manager'] = self.board_manager
 
-        # set up a cache
-        self.cache = self.data.get_cache()
-        self.variable_cache = self.data.get_cache_variables()
+        # set up an empty cache, this is populated in the background by hydrate_async once the UI is shown
+        self.cache = []
+        self.variable_cache = []
+        self.__hydrate_thread = None
 
         # subscribe to signals
         sigs.cache_line_received.connect(self.cache_line_received)
         sigs.client_requested_download.connect(self.send_download_request)
+        sigs.client_requested_preview.connect(self.send_preview_request)
+        sigs.client_requested_missing_sessions.connect(self.download_missing_sessions)
+        sigs.session_download_finished.connect(self.session_download_finished)
+        sigs.logging_stopped.connect(self.logging_stopped)
+        sigs.client_session_list_updated.connect(self.prefetch_sessions)
         sigs.client_requested_session_list.connect(self.request_session_list)
         sigs.board_command_received.connect(self.send_command)
         sigs.force_board_reset.connect(self.force_board_reset)
@@ -125,6 +154,55 @@ class ApplicationClient(object):
         """
         pass
 
+    def hydrate_async(self):
+        """
+        Starts loading the session list and cache from the local database on a background thread.  Should
+        be called by the inheriting class once the interface has been displayed.
+        """
+        self.logger.info("Client interface ready %.3f seconds after start up" % (time.time() - self.started_at))
+
+        self.__hydrate_thread = threading.Thread(target=self.hydrate)
+        self.__hydrate_thread.daemon = True
+        self.__hydrate_thread.start()
+
+    def hydrate(self):
+        """
+        Loads the session list (in batches of SESSION_BATCH_SIZE) and the cached variables from the local
+        database, firing a signal as each part becomes available so the interface can be populated incrementally
+        """
+        hydrate_start = time.time()
+        loaded = 0
+        last_id = None
+
+        # page by logger ID, as the session list may be replaced by one from the logger while it is loaded
+        while True:
+            sessions = self.data.get_sessions(last_id, self.SESSION_BATCH_SIZE)
+            if sessions:
+                sigs.client_sessions_loaded.send(sessions)
+                loaded += len(sessions)
+                last_id = sessions[-1].ref_id
+            if len(sessions) < self.SESSION_BATCH_SIZE:
+                break
+
+        self.variable_cache = self.data.get_cache_variables()
+        self.cache = self.data.get_cache()
+
+        # convert the cache into the format provided by BoardManager.parse_message, oldest first
+        names = dict([(x.id, x.variableName) for x in self.variable_cache])
+        cached_items = []
+        for item in sorted(self.cache, key=lambda x: x.timeLogged):
+            if item.value:
+                cached_items.append({
+                    'categoryName': names.get(item.categoryId, str(item.categoryId)),
+                    'categoryId': item.categoryId,
+                    'timeLogged': item.timeLogged / 1000,
+                    'value': float(item.value)
+                })
+        sigs.client_cache_loaded.send(cached_items)
+
+        self.logger.info("Loaded %s sessions and %s cached values in %.3f seconds (%.3f seconds after start up)" % (
+            loaded, len(self.cache), time.time() - hydrate_start, time.time() - self.started_at))
+
     def cache_line_received(self, message):
         """
         Handles receiving a line of information from the logger,
@@ -133,9 +211,19 @@ class ApplicationClient(object):
         results = self.board_manager.parse_message(message)
         self.update_interface(results)
 
-    def send_download_request(self, session_id):
+    def send_download_request(self, session_id, options=None, resume=True):
         """
-        Sends a request for downloading a given session ID to the data logger
+        Sends a request for downloading a given session ID to the data logger.  If part of the session has
+        already been downloaded with the same options, only the frames which have not been received are
+        requested, so that an interrupted download is continued and a session downloaded while it was logging
+        is topped up
+
+        :param session_id: the ID of the session to download
+        :param options: a dictionary of DOWNLOAD_OPTIONS to filter the session by board timestamp ("start" and
+            "end" in milliseconds) and board ("board" - a list of hex board IDs), or to reduce its resolution
+            ("step" or "points", see :class:`blitz.data.summary.FrameDecimator`) (default None - the whole session)
+        :param resume: False to discard any frames already downloaded and download the session again (default
+            True).  Decimated downloads are never resumed
         """
         self.logger.debug("Handling client download request")
 
@@ -146,9 +234,120 @@ class ApplicationClient(object):
                 "Unable to request download for session #%s as the logger is not connected" % session_id)
             return
 
-        # delete old session data
-        self.data.clear_session_data(session_id)
-        self.tcp.send(CommunicationCodes.composite(CommunicationCodes.Download, session_id))
+        options = dict(options or {})
+        session = self.data.get(Session, {"ref_id": session_id})
+
+        # options which only change how the session is transferred do not change the downloaded copy
+        resolution = CommunicationCodes.with_options("", dict(
+            [(k, v) for k, v in options.items() if k not in self.TRANSFER_OPTIONS])).strip() or None
+
+        if resume and session is not None and session.downloaded and session.resolution == resolution and \
+                "step" not in options and "points" not in options:
+            options["offset"] = session.downloaded
+            self.logger.info("Resuming download of session %s after %s frames" % (session_id, session.downloaded))
+        else:
+            # delete old session data, flagging the copy if it will not be the full session
+            self.data.clear_session_data(session_id)
+            self.data.set_session_resolution(session_id, resolution)
+
+        if self.config["compress_downloads"]:
+            options.setdefault("zlib", True)
+
+        message = CommunicationCodes.composite(CommunicationCodes.Download, session_id)
+        self.download_channel().send(CommunicationCodes.with_options(message, options))
+
+    def download_channel(self):
+        """
+        Gets the connection to send download requests on.  While the logger is logging, downloads are sent on the
+        download channel (connecting to it if required) so that sessions can be downloaded without stopping
+        the logger
+
+        :returns: the TcpBase to send download requests on
+        """
+        if not self.config["download_port"] or not self.tcp.is_logging():
+            return self.tcp
+
+        if self.download_tcp is None:
+            self.logger.debug("Created TCP connection to the download channel")
+            self.download_tcp = TcpBase(
+                self.config["tcp_host"], self.config["download_port"], self.config["tcp_asynchronous"])
+            self.download_tcp.create_client(initial_state=ClientIdleState)
+        return self.download_tcp
+
+    def download_missing_sessions(self, session_ids=None):
+        """
+        Queues every session which has not been downloaded and downloads them one after another in the
+        background.  The UI is not blocked while the queue is downloading
+
+        :param session_ids: the ref_ids of the sessions to check (default None - every session in the session list)
+        """
+        if self.tcp is None:
+            self.logger.debug("Failed to download missing sessions - no TCP connection")
+            self.data.log_error("Unable to download sessions as the logger is not connected")
+            return
+
+        added = self.download_queue.add(self.data.missing_sessions(session_ids))
+        self.logger.info("Queued %s sessions for download" % added)
+        self.download_next_session()
+
+    def download_next_session(self):
+        """
+        Starts downloading the next session in the download queue, unless a queued session is downloading
+        """
+        if self.tcp is None:
+            self.download_queue.clear()
+            return
+
+        session_id = self.download_queue.next()
+        if session_id is not None:
+            self.logger.info("Downloading session %s, %s sessions remaining" % (
+                session_id, len(self.download_queue) - 1))
+            self.send_download_request(session_id)
+
+    def session_download_finished(self, session_id):
+        """
+        Starts the next queued download when a download finishes
+        """
+        if self.download_queue.finished(session_id):
+            self.download_next_session()
+
+    def logging_stopped(self, args=None):
+        """
+        Requests the changes to the session list when logging stops.  New sessions are downloaded once the
+        session list has been updated, if "prefetch_sessions" is set
+        """
+        self.__prefetch = self.config["prefetch_sessions"]
+        self.request_session_list()
+
+    def prefetch_sessions(self, sessions, **kwargs):
+        """
+        Queues the sessions in an updated session list which have not been downloaded, if logging has stopped since
+        the last update and "prefetch_sessions" is set
+
+        :param sessions: the added or changed sessions, a list of [id, timeStarted, timeStopped, numberOfReadings,
+            ...] lists
+        """
+        if not self.__prefetch:
+            return
+
+        self.__prefetch = False
+        self.download_missing_sessions([x[0] for x in sessions])
+
+    def send_preview_request(self, session_id):
+        """
+        Sends a request for the decimated preview of a given session ID to the data logger.  The preview
+        is not saved, so the full session can still be downloaded afterwards
+        """
+        self.logger.debug("Handling client preview request")
+
+        if self.tcp is None:
+            sigs.process_finished.send()
+            self.logger.debug("Failed to handle client preview request - no TCP connection")
+            self.data.log_error(
+                "Unable to request preview for session #%s as the logger is not connected" % session_id)
+            return
+
+        self.tcp.send(CommunicationCodes.composite(CommunicationCodes.Preview, session_id))
 
     def connect_to_logger(self, args=None):
         """
@@ -163,7 +362,7 @@ class ApplicationClient(object):
 
             self.logger.debug("Created TCP connection at client request")
             try:
-                self.tcp = TcpBase("127.0.0.1", 8999)  # TODO get from config
+                self.tcp = TcpBase(self.config["tcp_host"], self.config["tcp_port"], self.config["tcp_asynchronous"])
                 self.tcp.create_client()
             except TcpCommunicationException:
                 self.data.log_error("Communication error with the board - connection closed")
@@ -175,6 +374,11 @@ class ApplicationClient(object):
             self.tcp.stop()
             self.logger.debug("Closed TCP connection at client request")
             self.tcp = None
+
+            if self.download_tcp is not None:
+                self.download_tcp.stop()
+                self.download_tcp = None
+            self.download_queue.clear()
             sigs.process_finished.send()
 
     def start_logging(self, args=None):
@@ -205,9 +409,13 @@ class ApplicationClient(object):
     def request_session_list(self, args=None):
         """
         Gets an update of the session list from the device. Must usually be called when in IDLE state so the
-        UI should prevent calling at other times
+        UI should prevent calling at other times.  Only the sessions which have changed since the version of the
+        list held in the client database are sent, in pages of "session_list_page" sessions
         """
-        self.tcp.send(CommunicationCodes.GetSessions)
+        self.tcp.send(CommunicationCodes.with_options(CommunicationCodes.GetSessions, {
+            "since": self.data.session_list_version(),
+            "limit": self.config["session_list_page"]
+        }))
 
     def update_interface(self, data, replace_existing=False):
         """
@@ -61,6 +61,7 @@ class BoardManager(object):
 
         # perform a single database transaction
         self.data.add_many(decoded_vars)
+        self.data.add_downloaded_frames(session_id, len(messages))
 
         # work out if the session is fully downloaded
         self.data.update_session_availability(session_id)
@@ -177,13 +178,16 @@ class BaseExpansionBoard(Plugin):
         """Override set item to provide access to attributes"""
         self.__attributes[key] = value
 
-    def parse_message(self, raw_message):
+    def parse_message(self, raw_message, notify=True):
         """
         Takes a raw binary message received from an expansion board and breaks
         it up into parts as described in section 4 of TS0002.
 
         This method SHOULD NOT be overridden in derived classes.  Derived classes
         should implement the get_variables function
+
+        :param raw_message: the hex encoded message
+        :param notify: True to send the data_line_processed signal once the message is parsed (default True)
         """
 
         # parse the message
@@ -219,7 +223,8 @@ class BaseExpansionBoard(Plugin):
         ]
 
         # raise the finished event
-        data_line_processed.send(self)
+        if notify:
+            data_line_processed.send(self)
 
     def register_board(self, manager):
         """
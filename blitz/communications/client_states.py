@@ -1,22 +1,30 @@
 __author__ = 'Will Hart'
 
+import json
 import logging
 import threading
 import time
+import zlib
 
 from blitz.constants import *
 import blitz.communications.signals as sigs
+from blitz.data.download import DownloadWindow
 
 
 class BaseState(object):
     """
     A base state diagram which provides a few methods - this should not be directly instantiated.
 
-    All methods return a BaseState derived object which should handle future message processing
+    All methods return a BaseState derived object which should handle future message processing.  Replies to
+    requests which were not sent by the state (for instance the reply to a BOARD command which is still in flight
+    when logging is stopped) are dropped, if the connection knows which request a reply answers
     """
 
     logger = logging.getLogger(__name__)
 
+    # the commands whose replies are passed to receive_message, or None for every reply
+    replies_to = None
+
     def enter_state(self, tcp, state, args=None):
         """Called when entering the state"""
         self.logger.debug("[TCP] Calling base.enter_state >> " + state.__name__)
@@ -27,6 +35,13 @@ class BaseState(object):
         self.logger.debug("[TCP] Calling base.receive_message: " + msg)
         raise NotImplementedError()
 
+    def accepts_reply(self, request):
+        """
+        :param request: the request which the reply answers, or None if it is not known
+        :returns: True if the reply should be passed to receive_message
+        """
+        return request is None or self.replies_to is None or request.split(" ")[0] in self.replies_to
+
     def send_message(self, tcp, msg):
         """
         Send the passed message over TCP and return the current state
@@ -53,6 +68,9 @@ class ClientInitState(BaseState):
     Handles the client starting up - sends a "logging" query
     to the logger and waits for the response
     """
+
+    replies_to = (CommunicationCodes.IsLogging,)
+
     def enter_state(self, tcp, state, args=None):
         """Send a logging query to the logger"""
         self.logger.debug("[TCP] Calling init.enter_state")
@@ -85,6 +103,9 @@ class ClientIdleState(BaseState):
     """
     Handles the client idling, waiting for further commands
     """
+
+    replies_to = (CommunicationCodes.Board, CommunicationCodes.Boards, CommunicationCodes.Reset)
+
     def receive_message(self, tcp, msg):
         # only ACK is acceptable in this state
         if msg[0:6] == CommunicationCodes.Boards:
@@ -101,12 +122,17 @@ class ClientIdleState(BaseState):
         self.logger.debug("[TCP] Calling idle.send_message: " + msg)
         if msg == CommunicationCodes.Start:
             return self.go_to_state(tcp, ClientStartingState)
-        elif msg == CommunicationCodes.GetSessions:
-            return self.go_to_state(tcp, ClientSessionListState)
+        elif msg.split(" ")[0] == CommunicationCodes.GetSessions:
+            return self.go_to_state(tcp, ClientSessionListState, msg)
         elif msg[0:8] == CommunicationCodes.Download:
             tcp.do_send(msg)
-            new_state = self.go_to_state(tcp, ClientDownloadingState, int(msg.split(" ")[1]))
+            msg_parts = msg.split(" ")
+            options = CommunicationCodes.parse_options(msg_parts[2:], DOWNLOAD_OPTIONS) or {}
+            new_state = self.go_to_state(tcp, ClientDownloadingState, (int(msg_parts[1]), options))
             return new_state
+        elif msg[0:7] == CommunicationCodes.Preview:
+            tcp.do_send(msg)
+            return self.go_to_state(tcp, ClientPreviewState, int(msg.split(" ")[1]))
         elif msg[0:5] == CommunicationCodes.Board:
             tcp.do_send(msg)
             return self
@@ -120,15 +146,34 @@ class ClientIdleState(BaseState):
 
 
 class ClientSessionListState(BaseState):
+    """
+    Requests the session list from the logger.  If the request has SESSION_LIST_OPTIONS only the changes since
+    the client's version of the list are received, over as many pages as the server needs, and the changes are
+    sent with the :data:`blitz.communications.signals.client_session_list_updated` signal as keyword arguments
+    """
 
+    replies_to = (CommunicationCodes.GetSessions,)
     sessions = []
+    deleted = []
+    version = None
+    full = True
+    options = None
 
     def enter_state(self, tcp, state, args=None):
-        """Send a logging session list to the logger"""
+        """
+        Send a logging session list to the logger
+
+        :param args: the SESSIONS request to send (default "SESSIONS" - the whole list)
+        """
         self.sessions = []
+        self.deleted = []
+        self.version = None
+        self.full = True
+        request = args or CommunicationCodes.GetSessions
+        self.options = CommunicationCodes.parse_options(request.split(" ")[1:], SESSION_LIST_OPTIONS) or None
         self.logger.debug("[TCP] Calling session_list.enter_state")
         sigs.process_started.send("Downloading session data from the logger")
-        tcp.do_send(CommunicationCodes.GetSessions)
+        tcp.do_send(request)
         return self
 
     def receive_message(self, tcp, msg):
@@ -139,29 +184,58 @@ class ClientSessionListState(BaseState):
 
         if delimiter != CommunicationCodes.Negative:
             self.logger.info("Ignoring session list message with incorrect format [%s]" % msg)
-            self.go_to_state(tcp, ClientIdleState)
-            return self
+            self.sessions = None
+            return self.go_to_state(tcp, ClientIdleState)
+
+        if self.options is not None:
+            header = parts[0].split(" ") if parts else []
+            reply_options = CommunicationCodes.parse_options(header[2:], SESSION_LIST_REPLY_OPTIONS)
+            if header[0:1] != [CommunicationCodes.Version] or len(header) < 2 or reply_options is None:
+                self.logger.info("Ignoring session list changes without a version [%s]" % msg)
+                self.sessions = None
+                return self.go_to_state(tcp, ClientIdleState)
 
-        # process a session message
+            if self.version is None:
+                self.full = reply_options.get("full", False)
+            self.version = int(header[1])
+            parts = parts[1:]
+
+        # process a session message, which may be followed by a JSON summary
         for part in parts:
-            msg_parts = part.split(" ")
-            if len(msg_parts) == 4:
+            msg_parts = part.split(" ", 4)
+            if msg_parts[0] == CommunicationCodes.Deleted and len(msg_parts) == 2:
+                self.deleted.append(msg_parts[1])
+            elif len(msg_parts) >= 4:
                 self.sessions.append(msg_parts)
                 self.logger.debug("Parsed session list message [%s:%s:%s:%s]" % (
                     msg_parts[0], msg_parts[1], msg_parts[2], msg_parts[3]))
-        return self.go_to_state(self, ClientIdleState)
+
+        if self.options is not None and reply_options.get("more", False):
+            # request the next page of changes
+            self.options["since"] = self.version
+            tcp.do_send(CommunicationCodes.with_options(CommunicationCodes.GetSessions, self.options))
+            return self
+
+        return self.go_to_state(tcp, ClientIdleState)
 
     def go_to_state(self, tcp, state, args=None):
         """
         sends a signal to save the session list to database, and then calls super go_to_state
         """
         sigs.process_finished.send()
-        sigs.client_session_list_updated.send(self.sessions)
+        if self.sessions is not None and self.options is None:
+            sigs.client_session_list_updated.send(self.sessions)
+        elif self.sessions is not None:
+            sigs.client_session_list_updated.send(self.sessions, deleted=self.deleted, version=self.version,
+                                                  full=self.full)
         return super(ClientSessionListState, self).go_to_state(tcp, state)
 
 
 class ClientStartingState(BaseState):
     """Handles logging starting - waits for ACK from server"""
+
+    replies_to = (CommunicationCodes.Start,)
+
     def enter_state(self, tcp, state, args=None):
         self.logger.debug("[TCP] Calling starting.enter_state: " + state.__name__)
         tcp.do_send(CommunicationCodes.Start)
@@ -183,10 +257,14 @@ class ClientLoggingState(BaseState):
     """
     Handles the client in logging state - sends periodic status updates
     """
+
+    replies_to = (CommunicationCodes.Update, CommunicationCodes.Board)
+
     def enter_state(self, tcp, state, args=None):
         """sets up a timer which periodically polls the data logger for updates"""
         sigs.logging_started.send()
         self.logger.debug("[TCP] Calling logging.enter_state")
+        self.latest_frames = {}
         self.__stop_updater = threading.Event()
         self.update_thread = threading.Thread(target=self.request_update, args=[self.__stop_updater, tcp])
         self.update_thread.daemon = True
@@ -221,14 +299,21 @@ class ClientLoggingState(BaseState):
         return self
 
     def receive_message(self, tcp, msg):
-        if len(msg) == 4 or len(msg) >= 28:
-            sigs.cache_line_received.send(msg)
-        else:
-            if len(msg) >= 5 and msg[0:5] == CommunicationCodes.Error:
-                self.logger.error("Received error code from logger [%s], stopping logging" % msg)
-                return self.go_to_state(tcp, ClientStoppingState)
-            elif msg != CommunicationCodes.Acknowledge:
-                self.logger.warning("Ignoring unknown message [%s] in logging state" % msg)
+        if len(msg) >= 5 and msg[0:5] == CommunicationCodes.Error:
+            self.logger.error("Received error code from logger [%s], stopping logging" % msg)
+            return self.go_to_state(tcp, ClientStoppingState)
+
+        if msg == CommunicationCodes.Acknowledge or msg == "":
+            return self
+
+        # status updates hold the newest frame from each board, one per line
+        for line in msg.split("\n"):
+            if len(line) < 28:
+                self.logger.warning("Ignoring unknown message [%s] in logging state" % line)
+            elif self.latest_frames.get(line[0:2]) != line:
+                # boards which have not logged since the last update send the same frame again
+                self.latest_frames[line[0:2]] = line
+                sigs.cache_line_received.send(line)
 
         return self
 
@@ -243,6 +328,9 @@ class ClientStoppingState(BaseState):
     """
     Handles waiting for acknowledgement from a client before entering IDLE state
     """
+
+    replies_to = (CommunicationCodes.Stop,)
+
     def enter_state(self, tcp, state, args=None):
         self.logger.debug("[TCP] Calling stopping.enter_state: " + state.__name__)
         tcp.do_send(CommunicationCodes.Stop)
@@ -253,35 +341,59 @@ class ClientStoppingState(BaseState):
         sigs.process_finished.send()
 
         if msg == CommunicationCodes.Acknowledge:
+            # the session list is requested by the subscribers to logging_stopped
             sigs.logging_stopped.send()
-            return self.go_to_state(tcp, ClientSessionListState)
+            return self.go_to_state(tcp, ClientIdleState)
         return self
 
 
 class ClientDownloadingState(BaseState):
     """
-    Handles the client in logging state - sends periodic status updates
+    Receives a session from the server.  Each ACK grants the server a window of chunks to send in the next
+    reply, which is sized from the measured round trip time and throughput (see
+    :class:`blitz.data.download.DownloadWindow`).  Replies are decompressed if the ZLIB flag was sent with the
+    DOWNLOAD request
     """
 
+    replies_to = (CommunicationCodes.Download, CommunicationCodes.Acknowledge)
     session_id = 0
+    window = None
+    requested = 0
+    compressed = False
 
-    def enter_state(self, tcp, state, session_id=None):
+    def enter_state(self, tcp, state, args=None):
+        """
+        :param args: a tuple of (session ID, dictionary of DOWNLOAD_OPTIONS)
+        """
+        session_id, options = args
         self.logger.debug("[TCP] Calling downloading.enter_state with session ID " + str(session_id))
         self.session_id = session_id
+        self.compressed = options.get("zlib", False)
+        self.window = DownloadWindow(options.get("chunk"))
+        self.requested = time.time()
         return self
 
     def receive_message(self, tcp, msg):
-        self.logger.debug("[TCP] Calling downloading.receive_message: " + msg)
+        self.logger.debug("[TCP] Calling downloading.receive_message with %s bytes" % len(msg))
+        elapsed = time.time() - self.requested
 
         # removing the command message and send the remainder off for processing via a signal
-        msg_parts = msg.split("\n")
-        if msg_parts[-1][0:2] != "0x":
-            del msg_parts[-1]
+        try:
+            msg_parts, size = self.read_lines(msg)
+        except zlib.error:
+            tcp.send(CommunicationCodes.Reset)
+            self.logger.warning("Unable to decompress download, forcing server to transition to idle state")
+            return self.go_to_state(tcp, ClientIdleState)
 
+        # measure the reply before the frames are stored
+        window = self.window.reply_received(len(msg_parts), elapsed, len(msg), size)
         sigs.data_line_received.send((msg_parts, self.session_id))
 
         if msg[-4:] == CommunicationCodes.Negative:
             # the data has been received
+            self.logger.info("Downloaded %s frames of session %s at %.0f frames per second, %s bytes (%s on the "
+                             "wire)" % (self.window.frames, self.session_id, self.window.average_rate(),
+                                        self.window.raw_bytes, self.window.wire_bytes))
             return self.go_to_state(tcp, ClientIdleState)
 
         elif msg[0:5] == CommunicationCodes.Error:
@@ -290,10 +402,69 @@ class ClientDownloadingState(BaseState):
             return self.go_to_state(tcp, ClientIdleState)
 
         # and then request the next dump from the server
-        tcp.send(CommunicationCodes.Acknowledge)
+        self.requested = time.time()
+        tcp.send(CommunicationCodes.with_options(CommunicationCodes.Acknowledge, {"window": window}))
         return self
 
+    def read_lines(self, msg):
+        """
+        Reads the frames from a download reply
+
+        :param msg: the reply from the server
+        :returns: a tuple of (the list of frames, the size of the reply once decompressed in bytes)
+        :raises zlib.error: if a compressed reply cannot be decompressed
+        """
+        if self.compressed and msg[0:5] != CommunicationCodes.Error:
+            payload, separator, code = msg.rpartition("\n")
+            if not separator:
+                return [], len(msg)
+
+            payload = zlib.decompress(payload)
+            return payload.split("\n"), len(payload) + len(separator + code)
+
+        msg_parts = msg.split("\n")
+        if msg_parts[-1][0:2] != "0x":
+            del msg_parts[-1]
+        return msg_parts, len(msg)
+
     def go_to_state(self, tcp, state, args=None):
         sigs.process_finished.send()
         self.logger.debug("[TCP] Calling downloading.go_to_state >> " + state.__name__)
-        return super(ClientDownloadingState, self).go_to_state(tcp, state)
+        new_state = super(ClientDownloadingState, self).go_to_state(tcp, state)
+        sigs.session_download_finished.send(self.session_id)
+        return new_state
+
+
+class ClientPreviewState(BaseState):
+    """
+    Waits for the decimated preview of a session from the server
+    """
+
+    replies_to = (CommunicationCodes.Preview,)
+    session_id = 0
+
+    def enter_state(self, tcp, state, session_id=None):
+        self.logger.debug("[TCP] Calling preview.enter_state with session ID " + str(session_id))
+        self.session_id = session_id
+        return self
+
+    def receive_message(self, tcp, msg):
+        self.logger.debug("[TCP] Calling preview.receive_message")
+
+        # the preview is sent as JSON followed by NACK, or just NACK if there is no preview
+        parts = msg.split("\n")
+
+        if parts[-1] == CommunicationCodes.Negative and len(parts) > 1:
+            try:
+                sigs.preview_received.send((self.session_id, json.loads("\n".join(parts[:-1]))))
+            except ValueError:
+                self.logger.warning("Unable to parse preview for session %s" % self.session_id)
+        else:
+            self.logger.info("No preview is available for session %s" % self.session_id)
+
+        return self.go_to_state(tcp, ClientIdleState)
+
+    def go_to_state(self, tcp, state, args=None):
+        sigs.process_finished.send()
+        self.logger.debug("[TCP] Calling preview.go_to_state >> " + state.__name__)
+        return super(ClientPreviewState, self).go_to_state(tcp, state)
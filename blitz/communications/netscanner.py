@@ -173,7 +173,7 @@ class NetScannerManager(object):
                         # scale by 1e6 and offset by 2e6 to avoid negative numbers and encode as int
                         out_message += hex(int(float(r) * 1e6 + 2e6))[2:].rjust(8, "0").upper()
 
-                    self.__data.queue(self.board_id + "50" + delta_t + out_message)
+                    self.__data.queue_many([self.board_id + "50" + delta_t + out_message])
                 else:
                     self.logger.debug("Received {0} variables from the NetScanner device, ignoring".format(len(raw)))
 
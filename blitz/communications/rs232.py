@@ -3,7 +3,6 @@ __author__ = 'Will Hart'
 
 import logging
 import os
-from redis import ConnectionError
 import serial
 from serial.tools.list_ports import comports
 import time
@@ -11,8 +10,8 @@ import threading
 
 from blitz import constants
 from blitz.constants import CommunicationCodes, SerialUpdatePeriod, SerialCommands
-from blitz.data.database import DatabaseServer
-from blitz.communications.signals import board_command_received, logging_started, logging_stopped
+from blitz.communications.signals import board_command_received, burst_triggered, logging_started, \
+    logging_stopped
 
 
 class ExpansionBoardNotFound(BaseException):
@@ -39,22 +38,24 @@ class SerialManager(object):
     logger = logging.getLogger(__name__)
 
     @classmethod
-    def Instance(cls):
+    def Instance(cls, database=None):
         """
         Returns a reference to a single SerialManager instance
 
+        :param database: the DatabaseServer to save serial data to, only used when the instance is first created
         :returns SerialManager: The SerialManager singleton instance
         """
         cls.logger.debug("SerialManager Instance called")
         if cls.__instance is None:
-            return SerialManager()
+            return SerialManager(database)
         else:
             return cls.__instance
 
-    def __init__(self):
+    def __init__(self, database=None):
         """
         Follows a singleton pattern and prevents instantiation of more than one Serial Manager.
 
+        :param database: the DatabaseServer to save serial data to.  If None, logging sessions cannot be started
         :returns: Nothing
         """
 
@@ -68,20 +69,20 @@ class SerialManager(object):
             self.logger.debug("SerialManager __init__")
             SerialManager.__instance = self
 
-        # create a database object
-        try:
-            self.database = DatabaseServer()
-        except ConnectionError as e:
-            self.logger.critical("ConnectionError when attempting to start the DatabaseServer!")
-            self.logger.critical(e)
+        self.database = database
 
         # work out which serial ports are connected
         self.get_available_ports()
 
+        # boards are polled at the burst period until this time
+        self.__burst_period = SerialUpdatePeriod
+        self.__burst_until = 0
+
         # register signals
         logging_started.connect(self.start)
         logging_stopped.connect(self.stop)
         board_command_received.connect(self.handle_board_command)
+        burst_triggered.connect(self.burst_triggered)
 
     def get_available_ports(self):
         """
@@ -199,6 +200,7 @@ class SerialManager(object):
 
         # readlines until no more lines left (will read for the timeout period)
         lines = port.readlines()
+        data_lines = []
 
         for line in lines:
             line = line.replace('\n', '').replace('\r', '')
@@ -216,9 +218,11 @@ class SerialManager(object):
             else:
                 # a data message, save it for later
                 self.logger.debug("Received serial data from board %s: %s" % (board_id, line))
-                self.database.queue(line)
+                data_lines.append(line)
 
-        self.logger.debug("Finished receiving data from board %s" % board_id)
+        # save all the frames from this poll in a single round trip
+        self.database.queue_many(data_lines)
+        self.logger.debug("Finished receiving %s frames from board %s" % (len(data_lines), board_id))
 
     def send_command_with_ack(self, command, board_id):
         """
@@ -268,7 +272,8 @@ class SerialManager(object):
 
     def start(self, tcp):
         """
-        Starts listening on the serial ports and polling for updates every SerialUpdatePeriod seconds
+        Starts listening on the serial ports and polling for updates every SerialUpdatePeriod seconds, or more
+        often during a burst capture
 
         :param tcp: the TCP connection to use for communications
 
@@ -356,6 +361,16 @@ class SerialManager(object):
             self.logger.warning("Received unexpected response {0} when sending command {1} to board {2}. ".format(
                 response, command, signal_args[0]))
 
+    def burst_triggered(self, signal_args):
+        """
+        Polls the boards at the burst period until the burst ends
+
+        :param signal_args: the arguments received from the blinker signal, (trigger name, period, length)
+        """
+        name, self.__burst_period, length = signal_args
+        self.__burst_until = time.time() + length
+        self.logger.debug("Polling every %s seconds for a burst triggered by %s" % (self.__burst_period, name))
+
     def __poll_serial(self, stop_event):
         """
         A thread which periodically polls a serial connection until a stop_event is received
@@ -372,7 +387,7 @@ class SerialManager(object):
             for k in self.serial_mapping.keys():
                 self.receive_serial_data(k)
 
-            time.sleep(SerialUpdatePeriod)
+            time.sleep(self.__burst_period if time.time() < self.__burst_until else SerialUpdatePeriod)
 
         self.logger.debug("Exited poll serial thread")
 
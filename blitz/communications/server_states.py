@@ -1,5 +1,7 @@
 __author__ = 'Will Hart'
 
+import zlib
+
 from blitz.constants import *
 from blitz.communications.client_states import BaseState
 import blitz.communications.signals as sigs
@@ -16,6 +18,19 @@ def validate_command(msg, commands):
         return CommunicationCodes.composite(CommunicationCodes.Error, 2)
 
 
+def parse_download_request(msg):
+    """
+    Helper function which reads the session ID and DOWNLOAD_OPTIONS from a DOWNLOAD request
+
+    :returns: a tuple of (session ID, dictionary of options), or None if the request is invalid
+    """
+    msg_parts = msg.split(" ")
+    options = CommunicationCodes.parse_options(msg_parts[2:], DOWNLOAD_OPTIONS)
+    if len(msg_parts) < 2 or options is None or ("step" in options and "points" in options):
+        return None
+    return msg_parts[1], options
+
+
 class ServerBaseState(BaseState):
     """
     A server base state which also implements commands that can be
@@ -52,17 +67,33 @@ class ServerIdleState(ServerBaseState):
         if msg == CommunicationCodes.Start:
             tcp.do_send(CommunicationCodes.Acknowledge)
             return self.go_to_state(tcp, ServerLoggingState)
-        elif msg == CommunicationCodes.GetSessions:
-            sigs.client_requested_session_list.send()
+        elif msg.split(" ")[0] == CommunicationCodes.GetSessions:
+            # a request without options is answered with the whole list in the original format
+            msg_parts = msg.split(" ")
+            options = CommunicationCodes.parse_options(msg_parts[1:], SESSION_LIST_OPTIONS)
+            if options is None:
+                tcp.do_send(CommunicationCodes.Negative)
+                return self
+
+            sigs.client_requested_session_list.send(options if len(msg_parts) > 1 else None)
             return self
         elif msg[0:8] == CommunicationCodes.Download:
+            request = parse_download_request(msg)
+            if request is None:
+                tcp.do_send(CommunicationCodes.Negative)
+                return self
+
+            return self.go_to_state(tcp, ServerDownloadingState, request)
+        elif msg[0:7] == CommunicationCodes.Preview:
             msg_parts = msg.split(" ")
             if len(msg_parts) != 2:
-                tcp.send(CommunicationCodes.Negative)
+                tcp.do_send(CommunicationCodes.Negative)
                 return self
 
-            return self.go_to_state(tcp, ServerDownloadingState, msg_parts[1])
+            sigs.client_requested_preview.send(msg_parts[1])
+            return self
         elif msg[0:5] == CommunicationCodes.Reset:
+            tcp.do_send(CommunicationCodes.Acknowledge)
             return self
         elif msg == CommunicationCodes.Stop or msg == CommunicationCodes.Update:
             # huh? We are not logging!?
@@ -71,7 +102,9 @@ class ServerIdleState(ServerBaseState):
             self.logger.debug("Responding with NACK, server not currently logging")
             tcp.do_send(CommunicationCodes.Negative)
         elif msg[0:6] == CommunicationCodes.Boards:
-            sigs.board_list_requested.send()
+            # the board list is sent by the application server, so every request is answered even without one
+            if not sigs.board_list_requested.send():
+                tcp.do_send(CommunicationCodes.Negative)
         elif not self.process_standard_messages(tcp, msg):
             tcp.do_send(validate_command(msg, VALID_SERVER_COMMANDS) + "IDLE")
 
@@ -105,6 +138,7 @@ class ServerLoggingState(ServerBaseState):
             tcp.do_send(CommunicationCodes.Acknowledge)
 
         elif msg[0:5] == CommunicationCodes.Reset:
+            tcp.do_send(CommunicationCodes.Acknowledge)
             return self.go_to_state(tcp, ServerIdleState)
 
         elif not self.process_standard_messages(tcp, msg):
@@ -114,61 +148,102 @@ class ServerLoggingState(ServerBaseState):
 
 
 class ServerDownloadingState(ServerBaseState):
+    """
+    Sends a session to the client.  Each reply holds the number of chunks granted by the client in the WINDOW
+    option of the DOWNLOAD request, which can be changed by the WINDOW option of each ACK, e.g. "ACK WINDOW=8".
+    A window of one chunk is used if the client does not grant a window.
 
-    session_data = []
-    send_index = 0
+    If the DOWNLOAD request has the ZLIB flag the frames in each reply are compressed with zlib, and the reply
+    is the compressed frames followed by a newline and ACK or NACK
+    """
+
+    cursor = None
+    window = 1
+    compress = False
+    idle_state = ServerIdleState
 
-    def enter_state(self, tcp, state, session_id=None):
+    def enter_state(self, tcp, state, args=None):
+        """
+        Requests the session data from the server
+
+        :param args: a tuple of (session ID, dictionary of DOWNLOAD_OPTIONS)
+        """
         self.logger.debug("[TCP] Calling ServerDownloadingState.enter_state")
+        session_id, options = args
 
-        self.send_index = 0
-        self.session_data = []
-        sigs.client_requested_download.send(session_id)
+        self.cursor = None
+        self.window = options.get("window", 1)
+        self.compress = options.get("zlib", False)
+        sigs.client_requested_download.send(session_id, options=options, tcp=tcp)
         return self
 
     def send_message(self, tcp, msg):
-
+        """
+        Sends the next chunk of the download.  The first message is the
+        :class:`blitz.data.download.DownloadCursor` which the session is read from
+        """
         self.logger.debug("[TCP] Calling ServerDownloadingState.send_message")
 
         if msg is not None:
-            # this is the first send request, send the first 100 lines
-            self.send_index = 0
-            self.session_data = msg
+            # this is the first send request
+            self.cursor = msg
 
-        if len(self.session_data) == 0:
+        lines = self.cursor.next_chunks(self.window)
+        if not lines:
             # no data to send
             tcp.do_send(CommunicationCodes.Negative)
-            return self.go_to_state(tcp, ServerIdleState)
+            return self.go_to_state(tcp, self.idle_state)
+
+        payload = "\n".join(lines)
+        if self.compress:
+            payload = zlib.compress(payload)
+
+        self.throttle(tcp, len(payload))
 
         # send the next block of messages, appending the correct command code
         #  >> ACK for more to come
         #  >> NACK for transmission complete
-        lines = "\n".join(self.session_data[self.send_index])
-        self.send_index += 1
-
-        if self.send_index == len(self.session_data):
-            lines += "\n" + CommunicationCodes.Negative
-            tcp.do_send(lines)
-            self.session_data = []
-            self.send_index = 0
-            return self.go_to_state(tcp, ServerIdleState)
+        if self.cursor.finished:
+            tcp.do_send(payload + "\n" + CommunicationCodes.Negative)
+            return self.go_to_state(tcp, self.idle_state)
 
-        lines += "\n" + CommunicationCodes.Acknowledge
-        tcp.do_send(lines)
+        tcp.do_send(payload + "\n" + CommunicationCodes.Acknowledge)
         return self
 
+    def throttle(self, tcp, size):
+        """
+        Waits before a reply is sent if the transfer rate is limited.  Downloads on the main channel are not limited
+
+        :param size: the size of the reply in bytes
+        """
+        pass
+
+    def go_to_state(self, tcp, state, args=None):
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+        return super(ServerDownloadingState, self).go_to_state(tcp, state, args)
+
     def receive_message(self, tcp, msg):
 
         self.logger.debug("[TCP] Calling ServerDownloadingState.receive_message")
 
         # ACK signifies part message received and server should continue sending.
         # All other messages are in error
-        if msg == CommunicationCodes.Acknowledge:
+        msg_parts = msg.split(" ")
+        if msg_parts[0] == CommunicationCodes.Acknowledge:
+            options = CommunicationCodes.parse_options(msg_parts[1:], DOWNLOAD_ACK_OPTIONS)
+            if options is None:
+                self.logger.warning("[TCP] Ignoring invalid download window - " + msg)
+            else:
+                self.window = options.get("window", self.window)
+
             self.logger.debug("[TCP] Sending next download part")
-            self.send_message(tcp, None)
+            return self.send_message(tcp, None)
 
         elif msg[0:5] == CommunicationCodes.Reset:
-            return self.go_to_state(tcp, ServerIdleState)
+            tcp.do_send(CommunicationCodes.Acknowledge)
+            return self.go_to_state(tcp, self.idle_state)
 
         elif not self.process_standard_messages(tcp, msg):
             self.logger.warning("[TCP] Unknown message received in download state - " + msg)
@@ -177,6 +252,45 @@ class ServerDownloadingState(ServerBaseState):
         return self
 
 
+class ServerChannelIdleState(ServerBaseState):
+    """
+    The idle state of the download channel, a second TCP server which serves session downloads while the main
+    channel is logging (see :class:`blitz.server.ApplicationServer`).  Only DOWNLOAD requests are accepted
+    """
+
+    def receive_message(self, tcp, msg):
+        self.logger.debug("[TCP] Calling ServerChannelIdleState.receive_message: " + msg)
+
+        if msg[0:8] == CommunicationCodes.Download:
+            request = parse_download_request(msg)
+            if request is None:
+                tcp.do_send(CommunicationCodes.Negative)
+                return self
+
+            return self.go_to_state(tcp, ServerChannelDownloadingState, request)
+
+        elif msg[0:5] == CommunicationCodes.Reset:
+            tcp.do_send(CommunicationCodes.Acknowledge)
+
+        else:
+            tcp.do_send(validate_command(msg, VALID_SERVER_COMMANDS) + " CHANNEL")
+
+        return self
+
+
+class ServerChannelDownloadingState(ServerDownloadingState):
+    """
+    Sends a session on the download channel.  Replies are sent no faster than the rate limiter of the channel
+    allows, so that downloads do not starve data acquisition while logging
+    """
+
+    idle_state = ServerChannelIdleState
+
+    def throttle(self, tcp, size):
+        if tcp.rate_limiter is not None:
+            tcp.rate_limiter.wait(size)
+
+
 class ServerClosedState(ServerBaseState):
     def receive_message(self, tcp, msg):
         self.logger.debug("[TCP] Calling ServerClosedState.receive_message" + msg)
@@ -65,11 +65,41 @@ logging_started = signal('logging_started')
 #:
 #: Subscribers (subscribed in >> subscribed to):
 #:  - :mod:`SerialManager`.__init__ >> SerialManager.stop
+#:  - :mod:`ApplicationClient`.__init__ >> ApplicationClient.logging_stopped
 #:
 #: Sent by:
 #:  - :mod:`ServerLoggingState`.receive_message
+#:  - :mod:`ClientStoppingState`.receive_message
 logging_stopped = signal('logging_stopped')
 
+#: Fired by the server database when a logging session has been stopped, with the session ID as argument
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`SessionArchiver`.__init__ >> SessionArchiver.session_stopped
+#:  - :mod:`PreviewBuilder`.__init__ >> PreviewBuilder.session_stopped
+#:
+#: Sent by:
+#:  - :mod:`DatabaseServer`.stop_session
+session_stopped = signal('session_stopped')
+
+#: Fired on the server when a burst capture trigger fires, with a tuple of (trigger name, burst polling period,
+#: burst length in seconds) as argument
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`SerialManager`.__init__ >> SerialManager.burst_triggered
+#:
+#: Sent by:
+#:  - :mod:`BurstCapture`.process
+#:  - :mod:`BurstCapture`.board_command_received
+burst_triggered = signal('burst_triggered')
+
+#: Fired on the server when a burst capture ends, with the burst segment dictionary as argument
+#:
+#: Sent by:
+#:  - :mod:`BurstCapture`.process
+#:  - :mod:`BurstCapture`.flush
+burst_ended = signal('burst_ended')
+
 #: Fired when the client requests a status update from the server
 #:
 #: Subscribers (subscribed in >> subscribed to):
@@ -79,7 +109,8 @@ logging_stopped = signal('logging_stopped')
 #:  - :mod:`ServerLoggingState`.receive_message
 server_status_request = signal('server_status_request')
 
-#: Fired when the client has requested a status list update, TcpServer as argument
+#: Fired when the client has requested a status list update.  On the server the argument is the dictionary of
+#: SESSION_LIST_OPTIONS sent with the request, or None if the whole list was requested
 #:
 #: Subscribers (subscribed in >> subscribed to):
 #:  - :mod:`ApplicationServer`.__init__ >> ApplicationServer.update_session_list
@@ -90,10 +121,14 @@ server_status_request = signal('server_status_request')
 #:  - :mod:`MainBlitzWindow`.get_session_list
 client_requested_session_list = signal('client_requested_session_list')
 
-#: Fired when the client has a completed session list received from the server
+#: Fired when the client has a completed session list received from the server, with the list of sessions as
+#: argument.  If only the changes since the client's version of the list were requested, the `deleted`,
+#: `version` and `full` keyword arguments hold the deleted session IDs, the new version of the list and whether
+#: the sessions are the whole list
 #:
 #: Subscribers (subscribed in >> subscribed to):
 #:  - :mod:`DatabaseClient`.__init__ >> DatabaseClient.update_session_list
+#:  - :mod:`ApplicationClient`.__init__ >> ApplicationClient.prefetch_sessions
 #:
 #: Sent by:
 #:  - :mod:`ClientSessionListState`.go_to_state
@@ -107,7 +142,10 @@ client_session_list_updated = signal('client_session_list_updated')
 #:  - :mod:`TcpBase`.run_client
 tcp_message_received = signal('tcp_message_received')
 
-#: Fired when a client requests a download of a particular session
+#: Fired when a client requests a download of a particular session, with the session ID as argument.  The
+#: optional `options` keyword argument is a dictionary of DOWNLOAD_OPTIONS which filter the session by board
+#: timestamp and board.  On the server the `tcp` keyword argument is the TcpBase the download was requested on,
+#: which is the download channel if the request was made while logging
 #:
 #: Subscribers (subscribed in >> subscribed to):
 #:  - :mod:`ApplicationServer`.__init__ >> ApplicationServer.serve_client_download
@@ -115,10 +153,51 @@ tcp_message_received = signal('tcp_message_received')
 #:
 #: Sent by:
 #:  - :mod:`ServerDownloadingState`.enter_state
+#:  - :mod:`ServerChannelDownloadingState`.enter_state
 #:  - :mod:`DownloadHandler`.get
 #:  - :mod:`blitz.ui.BlitzSessionWindow`.download_session
 client_requested_download = signal('client_requested_download')
 
+#: Fired when a client requests the decimated preview of a particular session, with the session ID as argument
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`ApplicationServer`.__init__ >> ApplicationServer.serve_client_preview
+#:  - :mod:`ApplicationClient`.__init__ >> ApplicationClient.send_preview_request
+#:
+#: Sent by:
+#:  - :mod:`ServerIdleState`.receive_message
+#:  - :mod:`BlitzSessionTabPane`.preview_session
+client_requested_preview = signal('client_requested_preview')
+
+#: Fired when the client requests a download of every session which has not been downloaded.  The sessions are
+#: downloaded one after another in the background
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`ApplicationClient`.__init__ >> ApplicationClient.download_missing_sessions
+#:
+#: Sent by:
+#:  - :mod:`BlitzSessionTabPane`.download_missing_sessions
+client_requested_missing_sessions = signal('client_requested_missing_sessions')
+
+#: Fired when the client stops downloading a session, whether or not the download completed, with the
+#: session ID as argument
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`ApplicationClient`.__init__ >> ApplicationClient.session_download_finished
+#:
+#: Sent by:
+#:  - :mod:`ClientDownloadingState`.go_to_state
+session_download_finished = signal('session_download_finished')
+
+#: Fired when the client receives a session preview, with a (session ID, preview dictionary) tuple as argument
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - :mod:`GUISignalEmitter`.__init__ >> GUISignalEmitter.trigger_preview_received
+#:
+#: Sent by:
+#:  - :mod:`ClientPreviewState`.receive_message
+preview_received = signal('preview_received')
+
 #: Fired when a command was received from the desktop software for an expansion board
 #:
 #: Subscribers (subscribed in >> subscribed to):
@@ -185,6 +264,24 @@ force_board_reset = signal('force_board_reset')
 #:  - :mod:`TcpBase`.run_client
 lost_tcp_connection = signal('lost_tcp_connection')
 
+#: Fired when the client has loaded a batch of sessions from the local database during start up
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - `GUISignalEmitter`.__init__
+#:
+#: Sent by:
+#:  - :mod:`ApplicationClient`.hydrate
+client_sessions_loaded = signal('client_sessions_loaded')
+
+#: Fired when the client has finished loading the cache from the local database during start up
+#:
+#: Subscribers (subscribed in >> subscribed to):
+#:  - `GUISignalEmitter`.__init__
+#:
+#: Sent by:
+#:  - :mod:`ApplicationClient`.hydrate
+client_cache_loaded = signal('client_cache_loaded')
+
 #: Fired when an asynchronous process starts to allow clients to update the UI
 #:
 #: Subscribers (subscribed in >> subscribed to):
@@ -13,6 +13,22 @@ class TcpCommunicationException(Exception):
 
 
 class TcpBase(object):
+    """
+    A TCP connection between the client and the logger, which passes messages to a :class:`TcpStateMachine`.
+
+    By default the connection uses a ZMQ REQ socket on the client and a REP socket on the server, so the client
+    has exactly one request in flight and the server answers each request before it receives the next.  An
+    asynchronous connection uses a DEALER socket on the client and a ROUTER socket on the server instead.  Each
+    request is sent with a request ID which the reply is sent back with, so several requests (such as UPDATE
+    polls and BOARD commands) can be in flight at once and the server keeps receiving requests while replies are
+    produced.  Replies which are sent while the state machine handles a request (including replies sent by signal
+    subscribers) answer that request, other replies answer the oldest request which has not been answered.  The
+    client passes each reply to the state machine with the request it answers, and replies to requests which were
+    not sent by the current state are dropped (see :meth:`BaseState.accepts_reply`).
+
+    A ROUTER server also answers REQ clients, so the server can be made asynchronous before the clients are.
+    """
+
     REQUEST_TIMEOUT = 3000
     REQUEST_RETRIES = 3
     SERVER_ENDPOINT = "tcp://%s:%s"
@@ -20,9 +36,15 @@ class TcpBase(object):
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, host="localhost", port=None):
+    def __init__(self, host="localhost", port=None, asynchronous=False):
+        """
+        :param host: the host to connect to (clients only)
+        :param port: the port to connect to or bind on
+        :param asynchronous: True to use DEALER / ROUTER sockets with several requests in flight (default False)
+        """
         self.__host = host
         self.__port = port
+        self.asynchronous = asynchronous
         self.send_queue = Queue.Queue()
         self.waiting = False
         self.__poller = zmq.Poller()
@@ -30,22 +52,25 @@ class TcpBase(object):
         self.__thread = None
         self.__state_machine = None
         self.__context = None
+        self.__router = False
+        self.rate_limiter = None
 
-    def create_client(self, autorun=True):
+    def create_client(self, autorun=True, initial_state=ClientInitState):
         self.__context = zmq.Context(1)
-        self.__socket = self.__context.socket(zmq.REQ)
+        self.__socket = self.__context.socket(zmq.DEALER if self.asynchronous else zmq.REQ)
         self.__socket.connect(self.SERVER_ENDPOINT % (self.__host, self.__port))
-        self.__state_machine = TcpStateMachine(self, self.__stop_event, ClientInitState)
+        self.__state_machine = TcpStateMachine(self, self.__stop_event, initial_state)
 
         if autorun:
-            self.__run_thread(self.run_client)
+            self.__run_thread(self.run_dealer_client if self.asynchronous else self.run_client)
 
-    def create_server(self):
+    def create_server(self, initial_state=ServerIdleState):
         self.__context = zmq.Context(1)
-        self.__socket = self.__context.socket(zmq.REP)
+        self.__socket = self.__context.socket(zmq.ROUTER if self.asynchronous else zmq.REP)
         self.__socket.bind(self.SERVER_ENDPOINT % ("*", self.__port))
-        self.__state_machine = TcpStateMachine(self, self.__stop_event, ServerIdleState)
-        self.__run_thread(self.run_server)
+        self.__router = self.asynchronous
+        self.__state_machine = TcpStateMachine(self, self.__stop_event, initial_state)
+        self.__run_thread(self.run_router if self.asynchronous else self.run_server)
 
     def __run_thread(self, thread_target):
         self.__poller.register(self.__socket, zmq.POLLIN)
@@ -68,13 +93,17 @@ class TcpBase(object):
         self.__stop_event.clear()
 
     def do_send(self, message):
-        self.send_queue.put(message)
+        if self.__router:
+            # replies from a ROUTER socket are sent back with the envelope of the request they answer
+            self.send_queue.put((self.__state_machine.current_envelope(), message))
+        else:
+            self.send_queue.put(message)
 
     def send(self, message):
         self.__state_machine.queue_send(message)
 
-    def receive_message(self, message):
-        self.__state_machine.queue_receive(message)
+    def receive_message(self, message, envelope=None, request=None):
+        self.__state_machine.queue_receive(message, envelope, request)
 
     def run_server(self, stop_event):
         self.logger.debug("Starting Server")
@@ -126,6 +155,98 @@ class TcpBase(object):
         self.__state_machine.force_state(ServerClosedState)
         self.logger.info("Server Closed")
 
+    def run_router(self, stop_event):
+        """
+        Runs an asynchronous server.  Requests from DEALER clients are received as [IDENTITY, REQUEST ID, MESSAGE]
+        and requests from REQ clients as [IDENTITY, "", MESSAGE], and each reply is sent back with the envelope
+        (every frame before the message) of the request it answers
+        """
+        self.logger.debug("Starting asynchronous server")
+        pending = []
+
+        while not stop_event.is_set():
+            socks = dict(self.__poller.poll(10))
+
+            if socks.get(self.__socket) == zmq.POLLIN:
+                frames = self.__socket.recv_multipart()
+                envelope, request = frames[:-1], frames[-1]
+                pending.append(envelope)
+                self.receive_message(request, envelope)
+                sigs.tcp_message_received.send([self, request])
+                self.logger.info("Server processed message: %s" % request)
+
+            # send every reply which is ready, without waiting for the rest
+            while True:
+                try:
+                    envelope, response = self.send_queue.get_nowait()
+                except Queue.Empty:
+                    break
+
+                if envelope is None and pending:
+                    envelope = pending[0]
+
+                if envelope not in pending:
+                    self.logger.warning("Ignored reply to a request which has already been answered: %s" % response)
+                    continue
+
+                pending.remove(envelope)
+                self.__socket.send_multipart(envelope + [response])
+
+        self.__socket.close()
+        self.__context.term()
+        self.__state_machine.force_state(ServerClosedState)
+        self.logger.info("Server Closed")
+
+    def run_dealer_client(self, stop_event):
+        """
+        Runs an asynchronous client, which sends each request as soon as it is queued with a new request ID and
+        passes replies to the state machine in the order they arrive, with the request they answer so that states
+        can drop replies to requests they did not send.  The connection is lost if a request is not answered within
+        REQUEST_TIMEOUT * REQUEST_RETRIES milliseconds
+        """
+        self.logger.info("Asynchronous client starting")
+        timeout = self.REQUEST_TIMEOUT * self.REQUEST_RETRIES / 1000.0
+        pending = {}
+        request_id = 0
+
+        while not stop_event.is_set():
+            while True:
+                try:
+                    request = self.send_queue.get_nowait()
+                except Queue.Empty:
+                    break
+
+                request_id += 1
+                pending[str(request_id)] = (request, time.time())
+                self.__socket.send_multipart([str(request_id), request])
+
+            socks = dict(self.__poller.poll(10))
+
+            if socks.get(self.__socket) == zmq.POLLIN:
+                frames = self.__socket.recv_multipart()
+
+                request = pending.pop(frames[0], None) if len(frames) == 2 else None
+                if request is None:
+                    self.logger.warning("Client ignored reply to an unknown request: %s" % frames)
+                    continue
+
+                reply = frames[1]
+                self.receive_message(reply, request=request[0])
+                sigs.tcp_message_received.send([self, reply])
+                self.logger.info("Client processed message: %s" % reply)
+
+            oldest = min([x[1] for x in pending.values()]) if pending else None
+            if oldest is not None and time.time() - oldest > timeout:
+                self.logger.warning("No reply received after %s seconds, %s requests in flight" % (
+                    timeout, len(pending)))
+                sigs.lost_tcp_connection.send()
+                self.__stop_event.set()
+
+        # terminate the context before exiting
+        self.__socket.close(0)
+        self.__context.term()
+        self.logger.info("Client Closed")
+
     def run_client(self, stop_event):
         self.logger.info("Client starting")
         while not stop_event.is_set():
@@ -177,7 +298,7 @@ class TcpBase(object):
                     self.logger.info("Client attempting resend of message %s (#%s)" % (request, retries))
 
             # now handle the reply
-            self.receive_message(reply)
+            self.receive_message(reply, request=request)
             sigs.tcp_message_received.send([self, reply])
             self.logger.info("Client processed message: %s" % reply)
 
@@ -198,9 +319,11 @@ class TcpStateAction(object):
     SEND = 0
     RECEIVE = 1
 
-    def __init__(self, command_type, command):
+    def __init__(self, command_type, command, envelope=None, request=None):
         self.command_type = command_type
         self.command = command
+        self.envelope = envelope
+        self.request = request
 
     def is_send(self):
         """Returns true if this is a send command"""
@@ -216,6 +339,7 @@ class TcpStateMachine(object):
         self.logger = logging.getLogger(__name__)
         self.__current_state = BaseState().go_to_state(tcp, initial_state)
         self.__commands = Queue.Queue()
+        self.__envelope = None
         self.__tcp = tcp
         self.__thread = threading.Thread(target=self.run, args=[stop_event])
 
@@ -224,12 +348,23 @@ class TcpStateMachine(object):
         self.__thread.start()
 
     def queue_send(self, command):
-        """Queues a send message"""
-        self.__commands.put(TcpStateAction(TcpStateAction.SEND, command))
-
-    def queue_receive(self, command):
-        """Queues a receive message"""
-        self.__commands.put(TcpStateAction(TcpStateAction.RECEIVE, command))
+        """Queues a send message, which answers the request being processed when it is queued by a state"""
+        self.__commands.put(TcpStateAction(TcpStateAction.SEND, command, self.current_envelope()))
+
+    def queue_receive(self, command, envelope=None, request=None):
+        """
+        Queues a receive message, with the envelope of the request for asynchronous servers or the request which
+        the message answers for clients
+        """
+        self.__commands.put(TcpStateAction(TcpStateAction.RECEIVE, command, envelope, request))
+
+    def current_envelope(self):
+        """
+        :returns: the envelope of the request being processed, or None if not called by the state machine thread
+        """
+        if threading.current_thread() is not self.__thread:
+            return None
+        return self.__envelope
 
     def run(self, stop_event):
         self.logger.info("Starting TCP state machine")
@@ -242,8 +377,11 @@ class TcpStateMachine(object):
                 continue
 
             # process the request
+            self.__envelope = request.envelope
             if request.is_send():
                 self.__current_state = self.__current_state.send_message(self.__tcp, request.command)
+            elif not self.__current_state.accepts_reply(request.request):
+                self.logger.info("Dropped reply to %s, which was not sent by the current state" % request.request)
             else:
                 self.__current_state = self.__current_state.receive_message(self.__tcp, request.command)
 
@@ -28,7 +28,10 @@ class CommunicationCodes(object):
     Ready = "READY"
     IsLogging = "LOGGING"
     GetSessions = "SESSIONS"
+    Preview = "PREVIEW"
     Reset = "RESET"
+    Version = "VERSION"
+    Deleted = "DELETED"
 
     @classmethod
     def composite(cls, base_code, code_id):
@@ -43,6 +46,56 @@ class CommunicationCodes(object):
         """
         return base_code + " " + str(code_id)
 
+    @classmethod
+    def with_options(cls, message, options):
+        """
+        Appends options to a command in the form ``KEY=VALUE``, with lists of values separated by commas.  Options
+        with a value of True are sent as a flag and options with a value of None or False are omitted.
+
+        Usage:
+
+            >>> CommunicationCodes.with_options("DOWNLOAD 1", {"start": 1000, "board": ["08", "09"]})
+            "DOWNLOAD 1 BOARD=08,09 START=1000"
+        """
+        parts = [message]
+
+        for key, value in sorted(options.items()):
+            if value is None or value is False:
+                continue
+            elif value is True:
+                parts.append(key.upper())
+            elif isinstance(value, (list, tuple)):
+                parts.append("%s=%s" % (key.upper(), ",".join([str(x) for x in value])))
+            else:
+                parts.append("%s=%s" % (key.upper(), value))
+
+        return " ".join(parts)
+
+    @classmethod
+    def parse_options(cls, parts, parsers):
+        """
+        Parses options created by :meth:`with_options`
+
+        :param parts: the list of ``KEY=VALUE`` strings
+        :param parsers: a dictionary of the functions used to convert the value of each allowed KEY, which are
+            passed an empty string for flags
+        :returns: a dictionary of values by lower case key, or None if an option is unknown or invalid
+        """
+        options = {}
+
+        for part in parts:
+            key, separator, value = part.partition("=")
+            parser = parsers.get(key.upper())
+            if parser is None:
+                return None
+
+            try:
+                options[key.lower()] = parser(value)
+            except ValueError:
+                return None
+
+        return options
+
 
 # commands that are valid to send TO the server
 # note only the command up to the space (if there is one) is included
@@ -54,6 +107,7 @@ VALID_SERVER_COMMANDS = [
     CommunicationCodes.Board,
     CommunicationCodes.IsLogging,
     CommunicationCodes.GetSessions,
+    CommunicationCodes.Preview,
     CommunicationCodes.Reset
 ]
 
@@ -71,6 +125,78 @@ VALID_CLIENT_COMMANDS = [
     CommunicationCodes.Reset
 ]
 
+
+def board_id_list(value):
+    """
+    Parses a comma separated list of hex board IDs into a list of two character upper case IDs
+
+    :raises ValueError: if an ID is not valid hex
+    """
+    return ["%02X" % int(x, 16) for x in value.split(",") if x]
+
+
+def positive_int(value):
+    """
+    Parses an integer which must be at least 1
+
+    :raises ValueError: if the value is not a positive integer
+    """
+    result = int(value)
+    if result < 1:
+        raise ValueError("Expected a positive integer, found %s" % value)
+    return result
+
+
+def flag(value):
+    """
+    Parses an option which is sent without a value
+
+    :raises ValueError: if the option has a value
+    """
+    if value:
+        raise ValueError("Unexpected value for flag - %s" % value)
+    return True
+
+
+# the options which can follow DOWNLOAD <session id>, with the function used to parse each value
+#  >> START / END / BOARD filter the session by board timestamp and board
+#  >> STEP / POINTS reduce the resolution of the session (see blitz.data.summary.FrameDecimator)
+#  >> CHUNK / WINDOW set the frames in each chunk and the chunks sent in each reply (see blitz.data.download)
+#  >> OFFSET skips the matching frames the client already has, before any decimation
+#  >> ZLIB compresses the frames in each reply
+DOWNLOAD_OPTIONS = {
+    "START": int,
+    "END": int,
+    "BOARD": board_id_list,
+    "STEP": positive_int,
+    "POINTS": positive_int,
+    "CHUNK": positive_int,
+    "WINDOW": positive_int,
+    "OFFSET": positive_int,
+    "ZLIB": flag
+}
+
+# the options which can follow ACK during a download, which change the chunks sent in each reply
+DOWNLOAD_ACK_OPTIONS = {
+    "WINDOW": positive_int
+}
+
+# the options which can follow SESSIONS, which request the changes to the session list since a version
+#  >> SINCE is the version of the session list the client has (0 for the whole list)
+#  >> LIMIT is the largest number of changes to send in one reply
+SESSION_LIST_OPTIONS = {
+    "SINCE": int,
+    "LIMIT": positive_int
+}
+
+# the options which can follow VERSION <version> at the start of a reply to a SESSIONS request with options
+#  >> FULL if the reply starts the whole list rather than the changes since the client's version
+#  >> MORE if there are more changes, which are requested with SINCE=<version>
+SESSION_LIST_REPLY_OPTIONS = {
+    "FULL": flag,
+    "MORE": flag
+}
+
 MAX_MESSAGE_LENGTH = 112  # max length of message in bits
 PAYLOAD_LENGTH = 64  # min length of payload in bits
 MESSAGE_BYTE_LENGTH = 28  # number of characters in a hex message string (0-f is 4 bytes)
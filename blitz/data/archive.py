@@ -0,0 +1,255 @@
+__author__ = 'Will Hart'
+
+import json
+import logging
+import os
+import Queue
+import struct
+import threading
+import zlib
+
+from blitz.communications.signals import session_stopped
+from blitz.utilities import frame_timestamp
+
+
+class SessionArchive(object):
+    """
+    A compressed, chunk indexed file holding the frames of a single logging session.  The file layout is:
+
+    - the eight byte ARCHIVE_MAGIC header
+    - a series of zlib compressed chunks, each holding up to CHUNK_FRAMES newline separated hex frames
+    - a JSON index with a ``[file offset, compressed length, frames, first timestamp, last timestamp]``
+      entry for each chunk
+    - the file offset of the index as an eight byte big endian unsigned integer
+
+    Individual chunks can be read without decompressing the whole session.
+    """
+
+    ARCHIVE_MAGIC = "BLZARC01"
+    CHUNK_FRAMES = 1000
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        """
+        Opens an existing archive and reads the chunk index
+
+        :param path: the path to the archive file
+        :raises IOError: if the file does not exist or is not a session archive
+        """
+        self.path = path
+
+        with open(path, 'rb') as f:
+            if f.read(len(self.ARCHIVE_MAGIC)) != self.ARCHIVE_MAGIC:
+                raise IOError("%s is not a session archive" % path)
+
+            f.seek(-8, os.SEEK_END)
+            index_end = f.tell()
+            index_offset = struct.unpack(">Q", f.read(8))[0]
+            f.seek(index_offset)
+            self.chunks = json.loads(f.read(index_end - index_offset))
+
+        self.number_of_frames = sum([x[2] for x in self.chunks])
+
+    @classmethod
+    def write(cls, path, frame_lists, chunk_frames=None):
+        """
+        Writes the frames to a new archive.  The archive is written to a temporary file which is renamed once
+        complete, so a partially written archive is never read
+
+        :param path: the path of the archive file to create
+        :param frame_lists: an iterable of lists of hex encoded frames, oldest first
+        :param chunk_frames: the number of frames in each compressed chunk (default CHUNK_FRAMES)
+        :returns: the number of frames that were written
+        """
+        chunk_frames = chunk_frames or cls.CHUNK_FRAMES
+        temp_path = path + ".tmp"
+        index = []
+        pending = []
+
+        with open(temp_path, 'wb') as f:
+            f.write(cls.ARCHIVE_MAGIC)
+
+            for frames in frame_lists:
+                pending += frames
+                while len(pending) >= chunk_frames:
+                    cls.__write_chunk(f, index, pending[:chunk_frames])
+                    pending = pending[chunk_frames:]
+
+            if pending:
+                cls.__write_chunk(f, index, pending)
+
+            index_offset = f.tell()
+            f.write(json.dumps(index))
+            f.write(struct.pack(">Q", index_offset))
+
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+
+        return sum([x[2] for x in index])
+
+    @staticmethod
+    def __write_chunk(f, index, frames):
+        data = zlib.compress("\n".join(frames))
+        index.append([f.tell(), len(data), len(frames), frame_timestamp(frames[0]), frame_timestamp(frames[-1])])
+        f.write(data)
+
+    def read_chunk(self, chunk):
+        """
+        Reads and decompresses a single chunk
+
+        :param chunk: the index of the chunk to read
+        :returns: the list of hex encoded frames in the chunk
+        """
+        offset, length = self.chunks[chunk][0:2]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = zlib.decompress(f.read(length))
+        return data.split("\n") if data else []
+
+    def iterate_chunks(self, start=0):
+        """
+        A generator which yields the frames in the archive one chunk at a time
+
+        :param start: the position of the first frame to yield, chunks before it are not decompressed (default 0)
+        """
+        chunk_start = 0
+
+        for i, chunk in enumerate(self.chunks):
+            chunk_end = chunk_start + chunk[2]
+            if chunk_end > start:
+                yield self.read_chunk(i)[max(0, start - chunk_start):]
+            chunk_start = chunk_end
+
+    def read_all(self):
+        """
+        Reads all frames in the archive
+
+        :returns: the list of hex encoded frames, oldest first
+        """
+        result = []
+        for frames in self.iterate_chunks():
+            result += frames
+        return result
+
+    def read_frames(self, start, count):
+        """
+        Reads frames by their position in the session, only decompressing the chunks that are required
+
+        :param start: the position of the first frame to read (0 is the oldest frame)
+        :param count: the maximum number of frames to read
+        :returns: the list of hex encoded frames
+        """
+        result = []
+        chunk_start = 0
+
+        for i, chunk in enumerate(self.chunks):
+            chunk_end = chunk_start + chunk[2]
+            if chunk_end > start and len(result) < count:
+                frames = self.read_chunk(i)
+                result += frames[max(0, start - chunk_start):]
+            chunk_start = chunk_end
+
+        return result[:count]
+
+    def __len__(self):
+        return self.number_of_frames
+
+
+class SessionArchiver(object):
+    """
+    Moves finished sessions out of the DatabaseServer into compressed :class:`SessionArchive` files on local disk.
+    When a session stops, all but the most recent `hot_sessions` sessions are archived on a background thread
+    and their data is removed from the database.  The DatabaseServer then serves them from the archive.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, hot_sessions=3):
+        """
+        Creates the archiver and starts its background thread
+
+        :param database: the DatabaseServer to archive sessions from.  It must have an archive_path set
+        :param hot_sessions: the number of recent sessions to keep in the database (default 3)
+        :raises ValueError: if fewer than one session is kept in the database
+        """
+        if hot_sessions < 1:
+            raise ValueError("At least one session must be kept in the database, not %s" % hot_sessions)
+
+        self.database = database
+        self.hot_sessions = hot_sessions
+        self.__queue = Queue.Queue()
+        self.__stop_event = threading.Event()
+
+        if not os.path.exists(database.archive_path):
+            os.makedirs(database.archive_path)
+
+        database.add_threads()
+        self.__thread = threading.Thread(target=self.run, args=[self.__stop_event])
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        session_stopped.connect(self.session_stopped)
+
+        # archive anything left over from before the server was started
+        self.session_stopped(None)
+
+    def session_stopped(self, session_id):
+        """
+        Queues every session outside the retention window which is still held in the database.  The session
+        being logged is never archived
+
+        :param session_id: the session which stopped (unused, provided by the blinker signal)
+        """
+        # sessions are listed newest first
+        for old_session in self.database.available_sessions()[self.hot_sessions:]:
+            if str(old_session) == str(self.database.session_id):
+                continue
+            if not self.database.is_archived(old_session):
+                self.__queue.put(old_session)
+
+    def archive_session(self, session_id):
+        """
+        Writes a session to an archive file and evicts its data from the database
+
+        :param session_id: the ID of the session to archive
+        :returns: the number of frames archived
+        """
+        path = self.database.archive_file(session_id)
+        frames = SessionArchive.write(path, self.database.iterate_session(session_id))
+        self.database.evict_session(session_id)
+        self.logger.info("Archived %s frames from session %s to %s" % (frames, session_id, path))
+        return frames
+
+    def run(self, stop_event):
+        """
+        The archiver thread, which archives queued sessions until the stop_event is set
+        """
+        self.logger.debug("Session archiver started")
+
+        while not stop_event.is_set():
+            try:
+                session_id = self.__queue.get(True, 0.5)
+            except Queue.Empty:
+                continue
+
+            # the session may have been queued twice
+            if self.database.is_archived(session_id):
+                continue
+
+            try:
+                self.archive_session(session_id)
+            except Exception as e:
+                self.logger.error("Unable to archive session %s" % session_id)
+                self.logger.error(e)
+
+        self.logger.debug("Session archiver stopped")
+
+    def stop(self):
+        """
+        Stops the archiver thread
+        """
+        session_stopped.disconnect(self.session_stopped)
+        self.__stop_event.set()
+        self.__thread.join()
@@ -0,0 +1,451 @@
+__author__ = 'Will Hart'
+
+import logging
+import mmap
+import struct
+import threading
+
+from blitz.data.summary import LatestValues
+
+
+class FrameRingBuffer(object):
+    """
+    A fixed size ring buffer of hex encoded frames held in a memory map.  The map holds a header with the
+    sequence number of the next frame to be written and the sequence number the writer is writing up to,
+    followed by `slots` fixed size slots, each holding a two byte length and the frame text.  The frame with
+    sequence number N is held in slot ``N % slots``.
+
+    There is a single writer.  Readers do not take a lock - a frame is only visible to readers once the head
+    is updated after the slot has been written.  Before overwriting slots the writer publishes the sequence
+    number it is writing up to, and readers check it after reading to discard any slots which were being
+    overwritten while they were read.
+
+    The map can be backed by a file so that the buffer can be read from another process.
+    """
+
+    HEADER_FORMAT = ">QQ"
+    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    LENGTH_FORMAT = ">H"
+    LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, slots=4096, slot_size=512, path=None):
+        """
+        Creates the ring buffer
+
+        :param slots: the number of frames held in the buffer (default 4096)
+        :param slot_size: the size of each slot in bytes, including the two byte length (default 512)
+        :param path: the file to map, or None to use an anonymous map shared by threads in this process
+        """
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_frame_length = slot_size - self.LENGTH_SIZE
+        size = self.HEADER_SIZE + slots * slot_size
+
+        if path is None:
+            self.__map = mmap.mmap(-1, size)
+        else:
+            with open(path, 'w+b') as f:
+                f.truncate(size)
+                self.__map = mmap.mmap(f.fileno(), size)
+
+        self.__write_header(0, 0)
+
+    def __write_header(self, head, writing):
+        struct.pack_into(self.HEADER_FORMAT, self.__map, 0, head, writing)
+
+    @property
+    def head(self):
+        """
+        The sequence number of the next frame to be written, which is also the number of frames written so far
+        """
+        return struct.unpack_from(self.HEADER_FORMAT, self.__map, 0)[0]
+
+    @property
+    def writing(self):
+        """
+        The sequence number the writer is writing up to.  Slots for the frames from `head` up to this sequence
+        number may be partly written
+        """
+        return struct.unpack_from(self.HEADER_FORMAT, self.__map, 0)[1]
+
+    def fits(self, frame):
+        """
+        Checks if the frame is short enough to be held in a slot
+        """
+        return len(frame) <= self.max_frame_length
+
+    def append_many(self, frames):
+        """
+        Writes frames to the buffer, overwriting the oldest frames once the buffer is full.  Must only be
+        called from one thread at a time
+
+        :param frames: the list of frames to write, oldest first.  Each frame must fit in a slot
+        :returns: the sequence number of the next frame to be written
+        """
+        head = self.head
+        writing = head + len(frames)
+
+        # tell readers which slots are about to be overwritten
+        self.__write_header(head, writing)
+
+        for frame in frames:
+            offset = self.HEADER_SIZE + (head % self.slots) * self.slot_size
+            struct.pack_into(self.LENGTH_FORMAT, self.__map, offset, len(frame))
+            self.__map[offset + self.LENGTH_SIZE:offset + self.LENGTH_SIZE + len(frame)] = frame
+            head += 1
+
+        # publish the frames to readers
+        self.__write_header(head, writing)
+        return head
+
+    def __read_slot(self, sequence):
+        offset = self.HEADER_SIZE + (sequence % self.slots) * self.slot_size
+        length = struct.unpack_from(self.LENGTH_FORMAT, self.__map, offset)[0]
+        return self.__map[offset + self.LENGTH_SIZE:offset + self.LENGTH_SIZE + length]
+
+    def read_since(self, sequence, count=None):
+        """
+        Reads the frames written from the given sequence number onwards.  If the frame with that sequence number
+        has already been overwritten, reading starts from the oldest frame still in the buffer
+
+        :param sequence: the sequence number of the first frame to read
+        :param count: the maximum number of frames to read (default None - all available frames)
+        :returns: a tuple of (list of frames, sequence number of the next frame to read)
+        """
+        head = self.head
+        start = max(sequence, head - self.slots)
+        end = head if count is None else min(head, start + count)
+        frames = [self.__read_slot(x) for x in range(start, end)]
+
+        # drop any frames the writer overwrote, or was overwriting, while they were being read
+        lost = self.writing - self.slots - start
+        if lost > 0:
+            self.logger.warning("Ring buffer reader lost %s frames which were overwritten" % lost)
+            frames = frames[lost:]
+
+        return frames, end
+
+    def latest(self):
+        """
+        Gets the most recently written frame
+
+        :returns: a tuple of (sequence number, frame) or (None, "") if no frames have been written
+        """
+        frames, end = self.read_since(max(0, self.head - 1))
+        if not frames:
+            return None, ""
+        return end - 1, frames[-1]
+
+    def close(self):
+        """
+        Releases the memory map
+        """
+        self.__map.close()
+
+
+def _database_setting(name):
+    """
+    Creates a property which gets and sets a setting on the wrapped database
+    """
+    return property(lambda self: getattr(self.database, name), lambda self, value: setattr(self.database, name, value))
+
+
+class BufferedDatabaseServer(object):
+    """
+    Sits in front of a :class:`blitz.data.database.DatabaseServer`, writing queued frames to a
+    :class:`FrameRingBuffer` which a background thread persists to the database in batches.  The acquisition
+    threads therefore never wait for the database, and the live status and latest readings for the current
+    session are served from the buffer.  The table of the latest frame from each board is updated as frames are
+    written to the buffer rather than when they are persisted.
+
+    Frames in the buffer are always persisted to the session they were logged in, as the buffer is drained
+    before a session starts or stops.  If the database falls so far behind that the buffer is full, writers
+    wait for space rather than overwriting frames which have not been persisted.
+
+    All other methods are passed straight through to the database.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, ring_buffer, batch_size=500):
+        """
+        Creates the buffered database and starts the thread which persists frames
+
+        :param database: the DatabaseServer to persist frames to
+        :param ring_buffer: the FrameRingBuffer to write frames to
+        :param batch_size: the maximum number of frames to persist in each queue_many call (default 500)
+        """
+        self.database = database
+        self.ring_buffer = ring_buffer
+        self.batch_size = batch_size
+        self.__write_lock = threading.Lock()
+        self.__condition = threading.Condition()
+        self.__persisted = ring_buffer.head
+        self.__session_start = ring_buffer.head
+        self.__last_status = None
+        self.__stop_event = threading.Event()
+        self.latest = LatestValues(database.decoder)
+
+        database.add_threads()
+        self.__thread = threading.Thread(target=self.run, args=[self.__stop_event])
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    packed = _database_setting("packed")
+    frames_per_element = _database_setting("frames_per_element")
+    archive_path = _database_setting("archive_path")
+
+    def __getattr__(self, item):
+        return getattr(self.database, item)
+
+    @property
+    def session_id(self):
+        return self.database.session_id
+
+    def start_session(self):
+        """
+        Starts a new session in the database
+
+        :returns: the ID of the newly created session
+        """
+        with self.__write_lock:
+            self.drain()
+            session_id = self.database.start_session()
+            self.__session_start = self.ring_buffer.head
+        self.__last_status = None
+        self.latest.clear()
+        return session_id
+
+    def stop_session(self):
+        """
+        Persists any buffered frames then stops the current session
+        """
+        with self.__write_lock:
+            self.drain()
+            self.database.stop_session()
+        self.__last_status = None
+
+    def queue(self, message):
+        """
+        Queues a new message against the current session. If no session is being run then it
+        logs a warning and does nothing
+
+        :param message: the message to push onto the session data
+        """
+        if self.session_id == -1:
+            self.logger.warning("Attempted to save a logged variable with no session running: %s" % message)
+            return
+        self.queue_many([message])
+        return message
+
+    def queue_many(self, messages):
+        """
+        Writes several messages to the ring buffer to be persisted against the current session.  Messages
+        which are too long for a buffer slot are written straight to the database.  If no session is being
+        run then it logs a warning and does nothing.
+
+        :param messages: the list of messages to queue, oldest first
+        :returns: the list of messages that were queued
+        """
+        if not messages:
+            return []
+
+        if self.session_id == -1:
+            self.logger.warning("Attempted to save %s logged variables with no session running" % len(messages))
+            return []
+
+        if not all([self.ring_buffer.fits(x) for x in messages]):
+            with self.__write_lock:
+                self.drain()
+                self.latest.add_many(messages)
+                return self.database.queue_many(messages)
+
+        with self.__write_lock:
+            for i in range(0, len(messages), self.ring_buffer.slots):
+                batch = messages[i:i + self.ring_buffer.slots]
+
+                with self.__condition:
+                    # wait for space rather than overwriting frames which have not been persisted
+                    while self.ring_buffer.head + len(batch) - self.__persisted > self.ring_buffer.slots:
+                        self.__condition.wait(0.1)
+
+                    self.ring_buffer.append_many(batch)
+                    self.__condition.notify_all()
+
+        self.latest.add_many(messages)
+        return messages
+
+    def drain(self):
+        """
+        Blocks until every frame in the ring buffer has been persisted to the database
+        """
+        with self.__condition:
+            while self.__persisted < self.ring_buffer.head and self.__thread.is_alive():
+                self.__condition.wait(0.1)
+
+    def get_latest_from_session(self, session_id):
+        """
+        Gets the most recent logged variable as a raw message string, reading from the ring buffer for
+        the current session
+
+        :param session_id: The id of the session to return the top variable from
+        :returns: A string containing the last raw serial message received from a board in this session,
+            or an empty string if no message has been received since the last call
+        """
+        if str(session_id) != str(self.session_id):
+            return self.database.get_latest_from_session(session_id)
+
+        sequence, frame = self.ring_buffer.latest()
+        if sequence is None or sequence < self.__session_start or sequence == self.__last_status:
+            # do not return a reading more than once
+            return ""
+
+        self.__last_status = sequence
+        return frame
+
+    def get_latest_frames(self):
+        """
+        Gets the newest frame written by each board in the current session, including frames which have not
+        been persisted yet
+
+        :returns: a list of raw serial messages, one per board, ordered by board ID
+        """
+        return self.latest.frames()
+
+    def get_latest_values(self):
+        """
+        Gets the newest value of each decoded channel in the current session
+
+        :returns: a dictionary of values by variable name
+        """
+        return self.latest.values()
+
+    def get_ten_from_session(self):
+        """
+        Gets the last ten readings from the logging session, reading from the ring buffer
+
+        :returns: the list of raw serial messages
+        """
+        head = self.ring_buffer.head
+        start = max(self.__session_start, head - 10)
+
+        if start < head - self.ring_buffer.slots:
+            # the buffer is too small to hold ten frames
+            self.drain()
+            return self.database.get_ten_from_session()
+
+        frames, end = self.ring_buffer.read_since(start)
+        return frames
+
+    def build_client_session_list(self, session_ids=None):
+        """
+        Builds the session list (see :meth:`blitz.data.database.DatabaseServer.build_client_session_list`)
+        once buffered frames have been persisted, so the current session count is up to date
+        """
+        self.drain()
+        return self.database.build_client_session_list(session_ids)
+
+    def build_session_list_changes(self, since=0, limit=None):
+        """
+        Gets the changes to the session list (see
+        :meth:`blitz.data.database.DatabaseServer.build_session_list_changes`) once buffered frames have been
+        persisted
+        """
+        self.drain()
+        return self.database.build_session_list_changes(since, limit)
+
+    def get_session_metadata(self, session_id):
+        """
+        Gets the metadata for the given session, persisting buffered frames first if the session is being logged
+        """
+        if str(session_id) == str(self.session_id):
+            self.drain()
+        return self.database.get_session_metadata(session_id)
+
+    def get_all_from_session(self, session_id):
+        """
+        Gets all messages logged during the given session ID, persisting buffered frames first if the session
+        is being logged
+
+        :param session_id: the ID of the session to return information for
+        :returns: the readings from the session
+        """
+        if str(session_id) == str(self.session_id):
+            self.drain()
+        return self.database.get_all_from_session(session_id)
+
+    def iterate_session(self, session_id, window=1000, start=None, end=None, boards=None, offset=0):
+        """
+        A generator which yields the messages logged during the given session (see
+        :meth:`blitz.data.database.DatabaseServer.iterate_session`), persisting buffered frames first if the
+        session is being logged
+        """
+        if str(session_id) == str(self.session_id):
+            self.drain()
+        return self.database.iterate_session(session_id, window, start, end, boards, offset)
+
+    def count_frames(self, session_id, start=None, end=None, boards=None):
+        """
+        Counts the messages in a session which may match the given filters (see
+        :meth:`blitz.data.database.DatabaseServer.count_frames`), persisting buffered frames first if the
+        session is being logged
+        """
+        if str(session_id) == str(self.session_id):
+            self.drain()
+        return self.database.count_frames(session_id, start, end, boards)
+
+    def read_frames(self, session_id, position, count):
+        """
+        Reads messages by their position in the session (see
+        :meth:`blitz.data.database.DatabaseServer.read_frames`), persisting buffered frames first if the
+        session is being logged
+        """
+        if str(session_id) == str(self.session_id):
+            self.drain()
+        return self.database.read_frames(session_id, position, count)
+
+    def run(self, stop_event):
+        """
+        The persisting thread, which copies frames from the ring buffer to the database until the
+        stop_event is set and the buffer is empty
+        """
+        self.logger.debug("Buffered database writer started")
+        pending = None
+
+        while True:
+            if pending is None:
+                frames, end = self.ring_buffer.read_since(self.__persisted, self.batch_size)
+                pending = self.database.prepare_frames(frames) if frames else []
+
+            try:
+                self.database.store_frames(pending)
+            except Exception as e:
+                # keep the frames in the buffer and try to store them again, without counting them again
+                self.logger.error("Unable to persist %s buffered frames" % len(frames))
+                self.logger.error(e)
+                stop_event.wait(0.5)
+                continue
+
+            pending = None
+
+            with self.__condition:
+                self.__persisted = end
+                self.__condition.notify_all()
+
+                if not frames:
+                    if stop_event.is_set():
+                        break
+                    self.__condition.wait(0.05)
+
+        self.logger.debug("Buffered database writer stopped")
+
+    def stop(self):
+        """
+        Persists any buffered frames and stops the persisting thread
+        """
+        self.__stop_event.set()
+        with self.__condition:
+            self.__condition.notify_all()
+        self.__thread.join()
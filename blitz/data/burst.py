@@ -0,0 +1,360 @@
+__author__ = 'Will Hart'
+
+from collections import deque
+import logging
+import time
+
+from blitz.communications.signals import board_command_received, burst_ended, burst_triggered
+from blitz.utilities import frame_timestamp
+
+
+class ThresholdTrigger(object):
+    """
+    Fires when a channel crosses a threshold
+    """
+
+    def __init__(self, channel, level, direction="rising", name=None):
+        """
+        :param channel: the variable name of the channel to watch
+        :param level: the threshold level
+        :param direction: "rising", "falling" or "both" (default "rising")
+        :param name: the name of the trigger, which is used to tag burst segments (default "CHANNEL DIRECTION")
+        :raises ValueError: if the direction is unknown
+        """
+        if direction not in ("rising", "falling", "both"):
+            raise ValueError("Unknown threshold direction '%s'" % direction)
+
+        self.channel = channel
+        self.level = float(level)
+        self.direction = direction
+        self.name = name or "%s %s" % (channel, direction)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the previous value from each board
+        """
+        self.__previous = {}
+
+    def check(self, board_id, timestamp, values):
+        """
+        Checks a decoded frame
+
+        :param board_id: the ID of the board which logged the frame
+        :param timestamp: the board timestamp of the frame in milliseconds
+        :param values: the decoded variables in the frame
+        :returns: True if the trigger fired
+        """
+        if self.channel not in values:
+            return False
+
+        value = float(values[self.channel])
+        previous = self.__previous.get(board_id)
+        self.__previous[board_id] = value
+
+        if previous is None:
+            return False
+
+        rising = previous < self.level <= value
+        falling = previous > self.level >= value
+        return (rising and self.direction != "falling") or (falling and self.direction != "rising")
+
+
+class RateTrigger(object):
+    """
+    Fires when a channel changes faster than a given rate, in units per second of board time
+    """
+
+    def __init__(self, channel, rate, name=None):
+        """
+        :param channel: the variable name of the channel to watch
+        :param rate: the rate of change, in either direction, which fires the trigger
+        :param name: the name of the trigger, which is used to tag burst segments (default "CHANNEL rate")
+        """
+        self.channel = channel
+        self.rate = abs(float(rate))
+        self.name = name or "%s rate" % channel
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the previous sample from each board
+        """
+        self.__previous = {}
+
+    def check(self, board_id, timestamp, values):
+        """
+        Checks a decoded frame (see :meth:`ThresholdTrigger.check`)
+        """
+        if self.channel not in values:
+            return False
+
+        value = float(values[self.channel])
+        previous = self.__previous.get(board_id)
+        self.__previous[board_id] = (timestamp, value)
+
+        if previous is None or timestamp <= previous[0]:
+            return False
+
+        return abs(value - previous[1]) * 1000.0 / (timestamp - previous[0]) > self.rate
+
+
+class CommandTrigger(object):
+    """
+    Fires when a BOARD command is sent to a board, for instance a command which starts a motor
+    """
+
+    def __init__(self, board=None, command="", name=None):
+        """
+        :param board: the hex ID of the board, or None to fire for commands to any board
+        :param command: the start of the command to match, or an empty string to match every command
+        :param name: the name of the trigger, which is used to tag burst segments (default "BOARD command")
+        """
+        self.board = board
+        self.command = command.upper()
+        self.name = name or "%s command" % (board or "BOARD")
+
+    def reset(self):
+        pass
+
+    def check(self, board_id, timestamp, values):
+        return False
+
+    def matches(self, board_id, command):
+        """
+        Checks if a BOARD command fires the trigger
+
+        :param board_id: the hex ID of the board the command was sent to
+        :param command: the command sent to the board
+        :returns: True if the trigger fired
+        """
+        return (self.board is None or self.board == board_id) and command.upper().startswith(self.command)
+
+
+#: The trigger classes by the "type" used in the "burst_triggers" setting
+TRIGGER_TYPES = {
+    "threshold": ThresholdTrigger,
+    "rate": RateTrigger,
+    "command": CommandTrigger
+}
+
+
+def create_trigger(settings):
+    """
+    Creates a trigger from a dictionary of settings, for instance
+    ``{"type": "threshold", "channel": "adc_channel_one", "level": 1000}``
+
+    :param settings: the "type" of trigger (see :data:`TRIGGER_TYPES`) and the keyword arguments for the trigger
+    :returns: the trigger
+    :raises ValueError: if the trigger type is unknown
+    """
+    settings = dict(settings)
+    trigger_type = settings.pop("type", None)
+
+    try:
+        return TRIGGER_TYPES[trigger_type](**settings)
+    except KeyError:
+        raise ValueError("Unknown burst trigger type '%s'" % trigger_type)
+
+
+class BurstCapture(object):
+    """
+    Evaluates triggers against frames as they are logged and captures a burst of frames around each event:
+
+    - the last `pre_frames` frames before the trigger are held in a pre-trigger buffer before they are stored,
+      so they can be stored with the burst
+    - every frame logged within `post_seconds` of the latest trigger is stored, bypassing the
+      :class:`blitz.data.compression.FrameCompressor`.  Triggers during a burst extend it
+    - the :data:`blitz.communications.signals.burst_triggered` signal tells the SerialManager to poll at
+      `burst_period` until the burst ends
+
+    Each burst is recorded as a segment of the session in the format::
+
+        {"trigger": NAME, "start": {"08": FIRST TIMESTAMP, ...}, "end": {"08": LAST TIMESTAMP, ...}, "frames": 1200}
+
+    where the timestamps are the board timestamps of the first and last frame from each board in the burst.
+    Frames outside bursts are passed to the compressor (if any) as they leave the pre-trigger buffer.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, decoder, triggers, compressor=None, pre_frames=50, post_seconds=5.0, burst_period=0.05):
+        """
+        Creates the burst capture
+
+        :param decoder: the :class:`blitz.data.summary.BoardDecoder` used to decode frames for channel triggers
+        :param triggers: the list of triggers
+        :param compressor: the FrameCompressor for frames outside bursts, or None to store every frame
+        :param pre_frames: the number of frames stored from before each trigger (default 50)
+        :param post_seconds: the length of the burst after the latest trigger in seconds (default 5)
+        :param burst_period: the serial polling period during a burst in seconds (default 0.05)
+        """
+        self.decoder = decoder
+        self.triggers = triggers
+        self.compressor = compressor
+        self.pre_frames = pre_frames
+        self.post_seconds = post_seconds
+        self.burst_period = burst_period
+        self.__check_channels = any([not isinstance(x, CommandTrigger) for x in triggers])
+        self.reset()
+
+        board_command_received.connect(self.board_command_received)
+
+    def reset(self):
+        """
+        Empties the pre-trigger buffer and forgets the segments, for instance when a new session starts
+        """
+        self.segments = []
+        self.__pre_trigger = deque()
+        self.__segment = None
+        self.__burst_until = 0
+        self.__pending = None
+
+        for trigger in self.triggers:
+            trigger.reset()
+
+    def board_command_received(self, signal_args):
+        """
+        Fires command triggers when a BOARD command is sent.  The burst starts with the next logged frame
+
+        :param signal_args: the arguments received from the blinker signal, in the form ['BOARD ID', 'ARGS', ...]
+        """
+        command = "".join(signal_args[1:])
+
+        for trigger in self.triggers:
+            if isinstance(trigger, CommandTrigger) and trigger.matches(signal_args[0], command):
+                self.__pending = trigger.name
+                self.__fire(trigger.name, time.time())
+                return
+
+    @property
+    def in_burst(self):
+        """
+        True if a burst is being captured
+        """
+        return self.__segment is not None
+
+    @property
+    def uses_channels(self):
+        """
+        True if frames are decoded for the channel triggers or the compressor
+        """
+        return self.__check_channels or (self.compressor is not None and bool(self.compressor.channels))
+
+    def process(self, frames, variables=None):
+        """
+        Evaluates triggers against logged frames
+
+        :param frames: the list of hex encoded frames, oldest first
+        :param variables: the decoded variables of each frame, or None to decode the frames with the decoder
+        :returns: the list of frames to store, oldest first
+        """
+        now = time.time()
+        result = []
+        idle = []
+
+        if variables is None:
+            variables = [self.decoder.decode(x) if self.uses_channels else None for x in frames]
+
+        for frame, values in zip(frames, variables):
+            board_id = frame[0:2]
+            timestamp = frame_timestamp(frame)
+            fired = self.__check(board_id, timestamp, values)
+
+            if fired is not None:
+                self.__fire(fired, now)
+            elif self.__segment is not None and now > self.__burst_until:
+                self.__end_segment()
+
+            if fired is not None and self.__segment is None:
+                # store the frames before the trigger with the burst, after any frames the compressor is holding
+                result += self.__compress(idle) + self.__flush_compressor() + self.__start_segment(fired)
+                idle = []
+
+            if self.__segment is not None:
+                self.__add_to_segment(board_id, timestamp)
+                result.append(frame)
+                continue
+
+            # the decoded variables are held with the frame for the compressor
+            self.__pre_trigger.append((frame, values))
+            while len(self.__pre_trigger) > self.pre_frames:
+                idle.append(self.__pre_trigger.popleft())
+
+        return result + self.__compress(idle)
+
+    def flush(self):
+        """
+        Ends any burst and releases the frames in the pre-trigger buffer, for instance when the session stops
+
+        :returns: the list of frames to store, oldest first
+        """
+        if self.__segment is not None:
+            self.__end_segment()
+
+        idle = list(self.__pre_trigger)
+        self.__pre_trigger.clear()
+        return self.__compress(idle) + self.__flush_compressor()
+
+    def __check(self, board_id, timestamp, values):
+        """
+        :returns: the name of the first trigger which fired, or None
+        """
+        fired, self.__pending = self.__pending, None
+
+        if values and self.__check_channels:
+            for trigger in self.triggers:
+                # every trigger sees every frame so it can track the previous values
+                if trigger.check(board_id, timestamp, values) and fired is None:
+                    fired = trigger.name
+
+        return fired
+
+    def __fire(self, name, now):
+        self.__burst_until = now + self.post_seconds
+        burst_triggered.send((name, self.burst_period, self.post_seconds))
+
+    def __start_segment(self, name):
+        """
+        Starts a new segment with the frames in the pre-trigger buffer
+
+        :returns: the pre-trigger frames, oldest first
+        """
+        self.logger.info("Burst capture triggered by %s" % name)
+        self.__segment = {"trigger": name, "start": {}, "end": {}, "frames": 0}
+
+        pre_trigger = [x[0] for x in self.__pre_trigger]
+        self.__pre_trigger.clear()
+
+        for frame in pre_trigger:
+            self.__add_to_segment(frame[0:2], frame_timestamp(frame))
+        return pre_trigger
+
+    def __add_to_segment(self, board_id, timestamp):
+        self.__segment["start"].setdefault(board_id, timestamp)
+        self.__segment["end"][board_id] = timestamp
+        self.__segment["frames"] += 1
+
+    def __end_segment(self):
+        segment, self.__segment = self.__segment, None
+        self.segments.append(segment)
+        self.logger.info("Captured burst of %s frames triggered by %s" % (segment["frames"], segment["trigger"]))
+
+        # the compressor starts again after the burst, rather than trending across it
+        if self.compressor is not None:
+            self.compressor.reset()
+
+        burst_ended.send(segment)
+
+    def __compress(self, idle):
+        """
+        :param idle: a list of (frame, decoded variables) tuples, oldest first
+        :returns: the frames to store, oldest first
+        """
+        frames = [x[0] for x in idle]
+        if self.compressor is None or not frames:
+            return frames
+        return self.compressor.compress(frames, [x[1] for x in idle])
+
+    def __flush_compressor(self):
+        return [] if self.compressor is None else self.compressor.flush()
@@ -0,0 +1,208 @@
+__author__ = 'Will Hart'
+
+import logging
+
+from blitz.utilities import frame_timestamp
+
+
+#: Keep a frame when a channel moves more than `tolerance` from the last stored value
+DEADBAND = "deadband"
+
+#: Keep a frame when a channel moves more than `tolerance` times the last stored value
+RELATIVE_DEADBAND = "relative"
+
+#: Keep the frames needed to redraw a channel as straight lines which stay within `tolerance` of every sample
+SWINGING_DOOR = "swinging_door"
+
+COMPRESSION_MODES = (DEADBAND, RELATIVE_DEADBAND, SWINGING_DOOR)
+
+
+class FrameCompressor(object):
+    """
+    Drops redundant frames as they are logged, using a tolerance for each configured channel.  Each board is
+    compressed separately and a frame is kept if any of its configured channels requires it:
+
+    - *deadband* channels keep a frame when the value moves more than the tolerance from the last stored value
+    - *relative* deadband channels keep a frame when the value moves more than ``tolerance * abs(last value)``
+    - *swinging_door* channels use swinging door trending, keeping the frames at the corners of a piecewise
+      linear trend which passes within the tolerance of every dropped sample.  The newest frame from each board
+      is held back until a later frame shows whether it is a corner, so :meth:`flush` must be called when the
+      session stops
+
+    Channels which are not configured are ignored when deciding which frames to keep, and frames from boards
+    with no configured channels (or which cannot be decoded) are always kept.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, decoder, channels):
+        """
+        Creates the compressor
+
+        :param decoder: the :class:`blitz.data.summary.BoardDecoder` used to decode frames
+        :param channels: a dictionary of ``{"mode": MODE, "tolerance": TOLERANCE}`` settings by variable name,
+            where MODE is one of COMPRESSION_MODES
+        :raises ValueError: if a channel has an unknown mode or a negative tolerance
+        """
+        self.decoder = decoder
+        self.channels = {}
+
+        for name, settings in channels.iteritems():
+            mode = settings.get("mode", DEADBAND)
+            tolerance = float(settings.get("tolerance", 0))
+
+            if mode not in COMPRESSION_MODES:
+                raise ValueError("Unknown compression mode '%s' for channel %s" % (mode, name))
+            if tolerance < 0:
+                raise ValueError("Compression tolerance for channel %s must not be negative" % name)
+
+            self.channels[name] = (mode, tolerance)
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the stored and held frames, for instance when a new session starts
+        """
+        self.__boards = {}
+
+    def compress(self, frames, variables=None):
+        """
+        Filters logged frames, keeping only the frames which need to be stored
+
+        :param frames: a list of hex encoded frames, oldest first
+        :param variables: the decoded variables of each frame, or None to decode the frames with the decoder
+        :returns: the list of frames to store, oldest first
+        """
+        result = []
+
+        for i, frame in enumerate(frames):
+            if variables is not None:
+                values = self.__channel_values(variables[i])
+            else:
+                values = self.__channel_values(self.decoder.decode(frame) if self.channels else None)
+
+            if not values:
+                result += self.__flush_board(frame[0:2])
+                result.append(frame)
+            else:
+                self.__add(frame, values, result)
+
+        return result
+
+    def flush(self):
+        """
+        Releases the frames held back for swinging door trending, so that the last sample from every board is
+        stored
+
+        :returns: the list of held frames
+        """
+        result = []
+        for board_id in sorted(self.__boards.keys()):
+            result += self.__flush_board(board_id)
+        return result
+
+    def __channel_values(self, variables):
+        if not variables:
+            return None
+
+        values = {}
+        for name in self.channels.keys():
+            try:
+                values[name] = float(variables[name])
+            except (KeyError, TypeError, ValueError):
+                continue
+        return values
+
+    def __flush_board(self, board_id):
+        state = self.__boards.get(board_id)
+        if state is None or state["held"] is None:
+            return []
+
+        frame, timestamp, values = state["held"]
+        self.__store(state, timestamp, values)
+        return [frame]
+
+    @staticmethod
+    def __store(state, timestamp, values):
+        state["stored"] = (timestamp, values)
+        state["held"] = None
+        state["doors"] = {}
+
+    def __add(self, frame, values, result):
+        board_id = frame[0:2]
+        timestamp = frame_timestamp(frame)
+        state = self.__boards.get(board_id)
+        last_timestamp = None
+        if state is not None:
+            last_timestamp = state["stored"][0] if state["held"] is None else state["held"][1]
+
+        if state is None or timestamp <= last_timestamp:
+            # the first frame from a board, or the board timestamp has been reset
+            result += self.__flush_board(board_id)
+            state = self.__boards.setdefault(board_id, {})
+            self.__store(state, timestamp, values)
+            result.append(frame)
+            return
+
+        doors, door_closed = self.__swing_doors(state, timestamp, values)
+
+        if door_closed:
+            # the held frame is a corner of the trend, store it and start new doors from it
+            result += self.__flush_board(board_id)
+            doors, door_closed = self.__swing_doors(state, timestamp, values)
+
+        if self.__outside_deadband(state, values):
+            # the held frame is kept too, as the trend to the new frame may not pass close to it
+            result += self.__flush_board(board_id)
+            self.__store(state, timestamp, values)
+            result.append(frame)
+        elif any([self.channels[x][0] == SWINGING_DOOR for x in values.keys()]):
+            state["doors"] = doors
+            state["held"] = (frame, timestamp, values)
+
+    def __swing_doors(self, state, timestamp, values):
+        """
+        Narrows the doors of each swinging door channel to pass within the tolerance of the held sample, which
+        would be dropped, and checks that the line from the stored frame to the new sample passes through them
+
+        :returns: a tuple of (the new doors, True if the new sample is outside any door)
+        """
+        if state["held"] is None:
+            return {}, False
+
+        stored_timestamp, stored_values = state["stored"]
+        held_timestamp, held_values = state["held"][1:]
+        elapsed = float(timestamp - stored_timestamp)
+        held_elapsed = float(held_timestamp - stored_timestamp)
+        doors = {}
+        closed = False
+
+        for name, value in values.iteritems():
+            mode, tolerance = self.channels[name]
+            if mode != SWINGING_DOOR or name not in stored_values or name not in held_values:
+                continue
+
+            lower, upper = state["doors"].get(name, (float("-inf"), float("inf")))
+            lower = max(lower, (held_values[name] - tolerance - stored_values[name]) / held_elapsed)
+            upper = min(upper, (held_values[name] + tolerance - stored_values[name]) / held_elapsed)
+            doors[name] = (lower, upper)
+            closed = closed or not lower <= (value - stored_values[name]) / elapsed <= upper
+
+        return doors, closed
+
+    def __outside_deadband(self, state, values):
+        stored_values = state["stored"][1]
+
+        for name, value in values.iteritems():
+            mode, tolerance = self.channels[name]
+            if name not in stored_values:
+                # a channel which was missing from the stored frame
+                return True
+
+            if mode == DEADBAND and abs(value - stored_values[name]) > tolerance:
+                return True
+            if mode == RELATIVE_DEADBAND and abs(value - stored_values[name]) > tolerance * abs(stored_values[name]):
+                return True
+
+        return False
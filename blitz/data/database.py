@@ -1,33 +1,144 @@
 __author__ = 'Will Hart'
 
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 import logging
+import os
+import sqlite3
+import threading
 import sqlalchemy as sql
 from sqlalchemy import func as sql_func
 from sqlalchemy.orm import sessionmaker
 import redis
 
+from blitz.data.archive import SessionArchive
+from blitz.data.burst import BurstCapture, create_trigger
+from blitz.data.compression import FrameCompressor
+from blitz.data.index import TimeIndex, frame_filter
+from blitz.data.summary import BoardDecoder, LatestValues, SessionSummary
 from blitz.data.models import *
 from blitz.data.fixtures import *
 import blitz.communications.signals as sigs
-from blitz.utilities import blitz_timestamp
+from blitz.utilities import blitz_timestamp, frame_timestamp, pack_hex_frames, unpack_hex_frames
+
+
+class QueryCache(object):
+    """
+    A bounded, thread safe least recently used cache for query results.  Keys are tuples in the
+    form ``(query type, parameter)``, for instance ``("readings", 3)`` or ``("all", "Session")``.
+    Hit, miss and eviction counts are kept so the effectiveness of the cache can be monitored.
+
+    Queries run outside the lock, so each key has a generation which is increased when the key is invalidated.
+    A result is only cached if its key was not invalidated (or the cache cleared) while the query was running.
+    """
+
+    def __init__(self, max_size=64):
+        """
+        :param max_size: the maximum number of query results to hold before evicting the least recently used
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__items = OrderedDict()
+        self.__generations = {}
+        self.__cleared = 0
+        self.__lock = threading.RLock()
+
+    def get(self, key, loader):
+        """
+        Gets the result for the given key, calling loader to run the query if it is not cached
+
+        :param key: the (query type, parameter) tuple identifying the query
+        :param loader: a callable with no arguments which returns the query result
+        :returns: a copy of the cached result list
+        """
+        with self.__lock:
+            if key in self.__items:
+                self.hits += 1
+                result = self.__items.pop(key)
+                self.__items[key] = result
+                return list(result)
+
+            self.misses += 1
+            generation = (self.__cleared, self.__generations.get(key, 0))
+
+        result = loader()
+
+        with self.__lock:
+            if generation != (self.__cleared, self.__generations.get(key, 0)):
+                # the key was invalidated while the query was running, so the result may be stale
+                return list(result)
+
+            self.__items[key] = result
+            while len(self.__items) > self.max_size:
+                self.__items.popitem(last=False)
+                self.evictions += 1
+
+        return list(result)
+
+    def invalidate(self, query_type, parameter):
+        """
+        Removes a single query result from the cache if it is present
+
+        :param query_type: the type of query, e.g. "readings"
+        :param parameter: the query parameter, e.g. the session id
+        :returns: nothing
+        """
+        key = (query_type, parameter)
+        with self.__lock:
+            self.__items.pop(key, None)
+            self.__generations[key] = self.__generations.get(key, 0) + 1
+
+    def clear(self):
+        """
+        Removes all query results from the cache (the counters are retained)
+
+        :returns: nothing
+        """
+        with self.__lock:
+            self.__items.clear()
+            self.__generations.clear()
+            self.__cleared += 1
+
+    def stats(self):
+        """
+        Gets the cache counters
+
+        :returns: a dictionary of hits, misses, evictions and the current size
+        """
+        with self.__lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.__items)
+            }
+
+    def __len__(self):
+        return len(self.__items)
 
 
 class DatabaseClient(object):
     """
-    Provides database operations for the client using SqlAlchemy
+    Provides database operations for the client using SqlAlchemy.  Frequently repeated queries (session
+    readings, session variables and model listings) are held in a :class:`QueryCache` which is invalidated
+    whenever the underlying session data or model table changes.
     """
 
     _database = None
     _baseClass = None
     logger = logging.getLogger(__name__)
 
-    def __init__(self, verbose=False, path=":memory:"):
+    def __init__(self, verbose=False, path=":memory:", cache_size=64):
         """
         Instantiates a connection and creates an in memory database by default.
 
         :param verbose: if True, SqlAlchemy will emit verbose debug messages (default False)
         :param path: the path to the database file (default ":memory:")
+        :param cache_size: the maximum number of query results held in the query cache (default 64)
         """
+        self.query_cache = QueryCache(cache_size)
 
         # allow loading from memory for testing
         self._database = sql.create_engine('sqlite:///' + path, echo=verbose)
@@ -49,7 +160,52 @@ class DatabaseClient(object):
         #SQL_BASE is defined in blitz.data.models
         if force_drop:
             SQL_BASE.metadata.drop_all(self._database)
+            self.query_cache.clear()
         SQL_BASE.metadata.create_all(self._database)
+        self.upgrade_tables()
+
+    def upgrade_tables(self):
+        """
+        Adds any columns which have been added to the models since an existing database file was created.
+        New columns must be nullable
+
+        :returns: a list of the "table.column" names which were added
+        """
+        added = []
+        inspector = sql.inspect(self._database)
+
+        for table in SQL_BASE.metadata.sorted_tables:
+            existing = [x["name"] for x in inspector.get_columns(table.name)]
+
+            for column in table.columns:
+                if column.name not in existing:
+                    self._database.execute("ALTER TABLE %s ADD COLUMN %s %s" % (
+                        table.name, column.name, column.type.compile(self._database.dialect)))
+                    added.append("%s.%s" % (table.name, column.name))
+
+        if added:
+            self.logger.info("Upgraded database tables, added columns %s" % ", ".join(added))
+        return added
+
+    def invalidate_session(self, session_id):
+        """
+        Removes cached query results which depend on the data for the given session
+
+        :param session_id: the ref_id of the session which has changed
+        :returns: nothing
+        """
+        self.query_cache.invalidate("readings", session_id)
+        self.query_cache.invalidate("variables", session_id)
+        self.query_cache.invalidate("all", Session.__name__)
+
+    def invalidate_model(self, model):
+        """
+        Removes cached query results which list all records of the given model
+
+        :param model: the model class which has changed
+        :returns: nothing
+        """
+        self.query_cache.invalidate("all", model.__name__)
 
     def add(self, item):
         """
@@ -72,6 +228,13 @@ class DatabaseClient(object):
         for r in items:
             sess.add(r)
         sess.commit()
+
+        # invalidate any cached queries that this insert touched
+        for model in set([type(r) for r in items]):
+            self.invalidate_model(model)
+        for session_id in set([r.sessionId for r in items if isinstance(r, Reading)]):
+            self.invalidate_session(session_id)
+
         return items
 
     def get(self, model, query):
@@ -97,9 +260,7 @@ class DatabaseClient(object):
         :param model: The model to return all records for
         :return: A list of all records for a given model
         """
-
-        sess = self._session()
-        return sess.query(model).all()
+        return self.query_cache.get(("all", model.__name__), lambda: self._session().query(model).all())
 
     def find(self, model, query):
         """
@@ -127,6 +288,56 @@ class DatabaseClient(object):
         # check all lines were received and set "available" accordingly
         session.available = count > 0
         sess.commit()
+        self.invalidate_model(Session)
+
+    def set_session_resolution(self, session_id, resolution):
+        """
+        Records whether the downloaded copy of a session is the full session
+
+        :param session_id: the ref_id of the session
+        :param resolution: the DOWNLOAD options used for a decimated or filtered copy, or None for the full session
+        :returns: nothing
+        """
+        sess = self._session()
+        session = sess.query(Session).filter_by(**{'ref_id': session_id}).first()
+        if session is None:
+            return
+
+        session.resolution = resolution
+        sess.commit()
+        self.invalidate_model(Session)
+
+    def add_downloaded_frames(self, session_id, count):
+        """
+        Adds to the number of frames received while downloading a session
+
+        :param session_id: the ref_id of the session
+        :param count: the number of frames received
+        :returns: nothing
+        """
+        sess = self._session()
+        session = sess.query(Session).filter_by(**{'ref_id': session_id}).first()
+        if session is None:
+            return
+
+        session.downloaded = (session.downloaded or 0) + count
+        sess.commit()
+        self.invalidate_model(Session)
+
+    def missing_sessions(self, session_ids=None):
+        """
+        Finds the sessions which have not been downloaded.  Readings are checked directly, so the result does not
+        depend on the "available" flag of the session list being up to date
+
+        :param session_ids: the ref_ids of the sessions to check (default None - every session in the session list)
+        :returns: the list of ref_ids of the sessions with no downloaded readings, oldest first
+        """
+        sess = self._session()
+        if session_ids is None:
+            session_ids = [x[0] for x in sess.query(Session.ref_id)]
+
+        return [x for x in sorted([int(y) for y in session_ids])
+                if not sess.query(sql.exists().where(Reading.sessionId == x)).scalar()]
 
     def get_session_variables(self, session_id):
         """
@@ -134,16 +345,18 @@ class DatabaseClient(object):
         :param session_id: the ref_id of the session to get variables for.
         :returns: a list of Reading objects
         """
-        res = set()
-        qry = self._session().query(Category, Reading). \
-            filter(Category.id == Reading.categoryId). \
-            filter(Reading.sessionId == session_id). \
-            order_by(Reading.id). \
-            all()
-        for c, r in qry:
-            res.add(c)
+        def load():
+            res = set()
+            qry = self._session().query(Category, Reading). \
+                filter(Category.id == Reading.categoryId). \
+                filter(Reading.sessionId == session_id). \
+                order_by(Reading.id). \
+                all()
+            for c, r in qry:
+                res.add(c)
+            return list(res)
 
-        return list(res)
+        return self.query_cache.get(("variables", session_id), load)
 
     def get_cache_variables(self):
         """
@@ -164,8 +377,26 @@ class DatabaseClient(object):
         :param session_id: the ref_id of the session to get variables for.
         :returns: a list of Reading objects for the session ID
         """
-        sess = self._session()
-        return sess.query(Reading).filter(Reading.sessionId == session_id).all()
+        return self.query_cache.get(
+            ("readings", session_id),
+            lambda: self._session().query(Reading).filter(Reading.sessionId == session_id).all())
+
+    def get_sessions(self, after=None, limit=None):
+        """
+        Gets a page of sessions ordered by their logger (ref) id, allowing the session list to be loaded
+        incrementally rather than in one large query.  Pages start after a logger id rather than an offset, so
+        sessions which are added or removed between pages are not skipped or repeated
+
+        :param after: the logger id of the last session in the previous page, or None for the first page
+        :param limit: the maximum number of sessions to return, or None to return all remaining sessions
+        :returns: a list of Session objects
+        """
+        qry = self._session().query(Session).order_by(Session.ref_id)
+        if after is not None:
+            qry = qry.filter(Session.ref_id > after)
+        if limit is not None:
+            qry = qry.limit(limit)
+        return qry.all()
 
     def get_cache(self, since=0):
         """
@@ -196,19 +427,33 @@ class DatabaseClient(object):
 
         return res
 
-    def update_session_list(self, sessions_list):
+    def update_session_list(self, sessions_list, deleted=None, version=None, full=True):
         """
         Session list comes in [session_id, start_timestamp, end_timstamp] format
-        This replaces the existing session list
+        This replaces the existing session list, or if `full` is False only adds or updates the given sessions
+        and removes the deleted sessions
 
         :param sessions_list: a list of lists of session information [id, timeStarted, timeStopped, numberOfReadings]
+            optionally followed by the JSON session summary
+        :param deleted: the list of IDs of sessions which have been deleted from the logger (default None)
+        :param version: the version of the session list on the logger, or None if the list is not versioned
+        :param full: False if the list only holds the sessions which have changed (default True)
         :returns: nothing
         """
         self.logger.debug("Updating session list")
 
         sess = self._session()
-        sess.query(Session).delete()
-        sess.commit()
+
+        # keep the resolution and progress of sessions which have been downloaded
+        downloads = {}
+        ref_ids = [int(x[0]) for x in sessions_list] + [int(x) for x in deleted or []]
+
+        if full or ref_ids:
+            query = sess.query(Session) if full else sess.query(Session).filter(Session.ref_id.in_(ref_ids))
+            downloads = dict([(x.ref_id, (x.resolution, x.downloaded)) for x in query])
+            query.delete(synchronize_session=False)
+            sess.commit()
+            self.invalidate_model(Session)
 
         sessions = []
 
@@ -220,11 +465,24 @@ class DatabaseClient(object):
             blitz_session.timeStarted = session[1]
             blitz_session.timeStopped = session[2]
             blitz_session.numberOfReadings = session[3]
+            blitz_session.summary = session[4] if len(session) > 4 else None
             blitz_session.available = count > 0
+            blitz_session.resolution, blitz_session.downloaded = downloads.get(int(session[0]), (None, 0)) \
+                if count else (None, 0)
             sessions.append(blitz_session)
 
         self.add_many(sessions)
 
+        if version is not None:
+            self.set_config("session_list_version", str(version))
+
+    def session_list_version(self):
+        """
+        :returns: the version of the logger session list held in the database, or 0 if the list is not versioned
+        """
+        config = self.get_config("session_list_version")
+        return int(config.value) if config is not None else 0
+
     def load_fixtures(self, testing=False):
         """
         Loads fixtures from blitz.data.fixtures
@@ -263,8 +521,10 @@ class DatabaseClient(object):
         if config is None:
             self.add(Config(key=key, value=value))
         elif do_update:
-            config.value = value
-            self._session().commit()
+            sess = self._session()
+            sess.query(Config).filter(Config.key == key).update({"value": value})
+            sess.commit()
+            self.invalidate_model(Config)
 
     def get_or_create_category(self, key):
         """
@@ -308,6 +568,7 @@ class DatabaseClient(object):
         sess = self._session()
         sess.query(Notification).delete()
         sess.commit()
+        self.invalidate_model(Notification)
 
     def handle_error(self, err_id):
         """
@@ -318,6 +579,7 @@ class DatabaseClient(object):
         sess = self._session()
         sess.query(Notification).filter(Notification.id == err_id).delete()
         sess.commit()
+        self.invalidate_model(Notification)
 
     def add_reading(self, session_id, time_logged, category_id, value):
         """
@@ -364,6 +626,7 @@ class DatabaseClient(object):
         sess = self._session()
         sess.query(Cache).delete()
         sess.commit()
+        self.invalidate_model(Cache)
 
     def clear_session_data(self, session_id):
         """
@@ -374,7 +637,10 @@ class DatabaseClient(object):
         """
         sess = self._session()
         sess.query(Reading).filter(Reading.sessionId == session_id).delete()
+        sess.query(Session).filter(Session.ref_id == session_id).update({"downloaded": 0})
         sess.commit()
+        self.invalidate_session(session_id)
+        self.invalidate_model(Reading)
 
         # now update the session availability to reflect the cleared data
         self.update_session_availability(session_id)
@@ -382,40 +648,160 @@ class DatabaseClient(object):
 
 class DatabaseServer(object):
     """
-    The redis database server - retains several documents:
+    The interface for the server side session store, which the acquisition threads log raw frames to and the
+    TCP server reads sessions from.  Implementations provide the storage, this class provides the session state,
+    packing of frames (see :func:`blitz.utilities.pack_hex_frames`) and reading of archived sessions.
 
-    - **session**  the id of the current session
-    - **session_N_start**  the timestamp when the logging session N began
-    - **session_N_end**  the timestamp when logging session N ended
-    - **sessions**  a list of session in the database
-    - **session_N**  a queue of raw session data for session_id N
+    Each session has a metadata record with the fields:
+
+    - *start* the timestamp when the logging session began
+    - *end* the timestamp when the logging session ended ("None" while logging)
+    - *count* the number of messages logged in the session
+    - *boards* a space separated list of the board IDs which have logged in the session
+
+    Frames can optionally be stored as packed bytes rather than hex strings, with several frames from the same
+    poll packed into one stored element.  Packed frames are re-encoded as hex when read so clients still receive
+    the text protocol.
+
+    A :class:`blitz.data.index.TimeIndex` of each session is kept up to date as frames are stored, so that a time
+    window or a subset of boards can be read without reading the whole session.
+
+    Finished sessions can be moved to compressed files in `archive_path` (see
+    :class:`blitz.data.archive.SessionArchiver`), in which case their data is read from the archive.
+
+    While a session is logged a :class:`blitz.data.summary.SessionSummary` is kept up to date with the frames
+    from each board and the range of each channel.  It is stored in the *summary* metadata field when the
+    session stops and sent to clients with the session list.  A :class:`blitz.data.summary.LatestValues` table
+    holds the newest frame from each board and the newest value of each channel for status requests.
+
+    Redundant frames can be dropped before they are stored by a :class:`blitz.data.compression.FrameCompressor`.
+    The summary and latest values still include every logged frame, and the summary records the compression
+    ratio achieved for the session.  Bursts of frames around events can be captured without compression by a
+    :class:`blitz.data.burst.BurstCapture`, and are recorded as segments in the session summary.
+
+    The session list has a version which increases each time a session is created, stopped or deleted, and each
+    session records the version of its last change, so that clients can fetch only the sessions which have
+    changed since their copy of the list (see :meth:`build_session_list_changes`).
+
+    The implementation used by the server is chosen with the "database_backend" setting, see
+    :data:`DATABASE_BACKENDS`.  Implementations must provide every abstract method, so an incomplete
+    implementation cannot be created.
     """
 
-    __data = redis.StrictRedis()
+    __metaclass__ = ABCMeta
+
     session_id = -1
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self):
-        """
-        Initialises a new instance of a DatabaseServer
-        """
-        self.logger.debug("DatabaseServer __init__")
-        self.session_id = self.__get_session_id()
-        self.__last_session_length = -1
+    def __init__(self, packed=False, frames_per_element=1, archive_path=None, decoder=None, compressor=None,
+                 bursts=None, summary_channels=True):
+        """
+        Initialises the session state shared by all DatabaseServer implementations
+
+        :param packed: if True frames are stored as packed bytes instead of hex strings (default False)
+        :param frames_per_element: the maximum number of packed frames from a single poll to store in
+            each element (default 1)
+        :param archive_path: the directory holding archived sessions, or None if sessions are not archived
+        :param decoder: the :class:`blitz.data.summary.BoardDecoder` which decodes each logged frame once for
+            the session summary and the compressor, or None to only count the frames from each board
+        :param compressor: the :class:`blitz.data.compression.FrameCompressor` used to drop redundant frames,
+            or None to store every frame
+        :param bursts: the :class:`blitz.data.burst.BurstCapture` which evaluates burst triggers, or None if
+            bursts are not captured.  It must use the same compressor
+        :param summary_channels: True to calculate channel statistics for the session summary if there is a
+            decoder (default True)
+        """
+        self.packed = packed
+        self.frames_per_element = max(1, frames_per_element)
+        self.archive_path = archive_path
+        self.decoder = decoder
+        self.compressor = compressor
+        self.bursts = bursts
+        self.summary_channels = summary_channels
+        self._session_boards = set()
+        self._summary = None
+        self._index = None
+        self._session_lock = threading.RLock()
+        self.latest = LatestValues(decoder)
+
+    @classmethod
+    def from_config(cls, config, threads=1):
+        """
+        Creates a DatabaseServer using the database settings in the server configuration
+
+        :param config: the server :class:`blitz.server.Config`
+        :param threads: the number of threads which will share the DatabaseServer
+        :returns: a new DatabaseServer
+        """
+        return cls(**cls._config_settings(config, threads))
+
+    @classmethod
+    def _config_settings(cls, config, threads):
+        """
+        Gets the constructor arguments for the DatabaseServer from the server configuration.  Implementations
+        extend this with their own settings
+
+        :param config: the server :class:`blitz.server.Config`
+        :param threads: the number of threads which will share the DatabaseServer
+        :returns: a dictionary of keyword arguments
+        """
+        # archive into the "archive" folder in the application path unless another path is given
+        archive_path = None
+        if config["archive_sessions"]:
+            archive_path = config["archive_path"] or os.path.join(config["application_path"], "archive")
+
+        # frames are only decoded for the features which need them, so one decoder is shared by all of them
+        decoder = BoardDecoder()
+
+        compressor = None
+        if config["compression_channels"]:
+            compressor = FrameCompressor(decoder, config["compression_channels"])
+
+        bursts = None
+        if config["burst_triggers"]:
+            bursts = BurstCapture(decoder, [create_trigger(x) for x in config["burst_triggers"]],
+                                  compressor, config["burst_pre_frames"], config["burst_post_seconds"],
+                                  config["burst_period"])
+
+        return {
+            "packed": config["database_packed"],
+            "frames_per_element": config["database_frames_per_element"],
+            "archive_path": archive_path,
+            "decoder": decoder,
+            "compressor": compressor,
+            "bursts": bursts,
+            "summary_channels": config["summary_channels"]
+        }
+
+    def add_threads(self, count=1):
+        """
+        Reserves the resources for threads which will use the DatabaseServer, and is called where each thread is
+        created.  The default implementation does nothing
+
+        :param count: the number of threads (default 1)
+        """
+        pass
 
     def start_session(self):
         """
-        Starts a new session, creating the required session_N variables
+        Starts a new session, atomically allocating a session ID and creating the session metadata
 
         :returns: the ID of the newly created session
         """
-        self.__data.incr("session_id")
-        self.session_id = self.__get_session_id()
-        self.__data.lpush("sessions", self.session_id)
-        self.__data.set("session_" + str(self.session_id) + "_start", blitz_timestamp())
-        self.__last_session_length = -1
-        return self.__get_session_id()
+        with self._session_lock:
+            self.session_id = int(self._create_session(blitz_timestamp()))
+            self._update_version(self.session_id)
+            self._session_boards = set()
+            self._summary = SessionSummary(self.decoder if self.summary_channels else None)
+            self._index = TimeIndex()
+            self.latest.clear()
+            if self.compressor is not None:
+                self.compressor.reset()
+            if self.bursts is not None:
+                self.bursts.reset()
+            self._reset_status()
+            return self.session_id
 
     def stop_session(self):
         """
@@ -423,24 +809,33 @@ class DatabaseServer(object):
 
         :returns: nothing
         """
-        self.__data.set("session_" + str(self.session_id) + "_end", blitz_timestamp())
-        self.session_id = -1
-        self.__last_session_length = -1
+        with self._session_lock:
+            session_id = self.session_id
 
-    def __get_session_id(self):
-        sess_id = self.__data.get("session_id")
-        return int(sess_id) if sess_id is not None else -1
+            # store the last frames held back by the burst capture and compressor
+            if self.bursts is not None:
+                self.store_frames(self.bursts.flush())
+                if self._summary is not None:
+                    self._summary.segments = list(self.bursts.segments)
+            elif self.compressor is not None:
+                self.store_frames(self.compressor.flush())
 
-    def get_ten_from_session(self):
-        """
-        Gets the last ten readings from the logging session
+            self._end_session(session_id, blitz_timestamp())
 
-        :returns: the list of raw serial messages
-        """
-        session_str = "session_" + str(self.session_id)
-        result = self.__data.lrange(session_str, 0, 9)  # numbers are inclusive
-        result.reverse()
-        return result
+            # a session resumed after a restart only has a partial summary and index, so neither is stored
+            if self._summary is not None:
+                self._store_summary(session_id, self._summary.to_json())
+            if self._index is not None:
+                self._store_index(session_id, self._index.to_json())
+            self._update_version(session_id)
+
+            self.session_id = -1
+            self._session_boards = set()
+            self._summary = None
+            self._index = None
+            self._reset_status()
+
+        sigs.session_stopped.send(session_id)
 
     def queue(self, message):
         """
@@ -454,10 +849,138 @@ class DatabaseServer(object):
         if self.session_id == -1:
             self.logger.warning("Attempted to save a logged variable with no session running: %s" % message)
             return
-        session_str = "session_%s" % self.session_id
-        self.__data.lpush(session_str, message)
+        self.queue_many([message])
         return message
 
+    def queue_many(self, messages):
+        """
+        Queues several messages against the current session in a single write, so that a burst of frames
+        (for instance a board emptying its buffer on TRANSMIT) costs one round trip rather than one
+        per frame.  If no session is being run then it logs a warning and does nothing.
+
+        The acquisition threads may queue messages at the same time, so the session state is only changed while
+        holding the session lock, which start_session and stop_session also hold.
+
+        :param messages: the list of messages to push onto the session data, oldest first
+        :returns: the list of messages that were queued
+        """
+        if not messages:
+            return []
+
+        with self._session_lock:
+            # only log against current session
+            if self.session_id == -1:
+                self.logger.warning("Attempted to save %s logged variables with no session running" % len(messages))
+                return []
+
+            messages = self.prepare_frames(messages)
+            self.store_frames(messages)
+            return messages
+
+    def prepare_frames(self, messages):
+        """
+        Adds logged messages to the latest values and the session summary, then passes them through the burst
+        capture and compressor.  Writers which retry failed writes call this once and retry :meth:`store_frames`,
+        so that the messages are only counted once.
+
+        Each message is decoded at most once.  Every message is decoded if the summary, the burst triggers or the
+        compressor use channel values, otherwise only the newest message from each board is decoded for the latest values
+
+        :param messages: the list of logged messages, oldest first
+        :returns: the list of messages to store, oldest first
+        """
+        with self._session_lock:
+            variables = None
+            if self._decodes_frames():
+                variables = [self.decoder.decode(x) for x in messages]
+
+            self.latest.add_many(messages, variables)
+            if self._summary is not None:
+                self._summary.add_many(messages, variables)
+
+            if self.bursts is not None:
+                return self.bursts.process(messages, variables)
+            if self.compressor is not None:
+                return self.compressor.compress(messages, variables)
+            return messages
+
+    def _decodes_frames(self):
+        """
+        :returns: True if logged frames are decoded for the session summary, the burst capture or the compressor
+        """
+        if self.decoder is None:
+            return False
+        if self._summary is not None and self._summary.decoder is not None:
+            return True
+        if self.bursts is not None:
+            return self.bursts.uses_channels
+        return self.compressor is not None and bool(self.compressor.channels)
+
+    def store_frames(self, messages):
+        """
+        Stores messages against the current session and counts them in the session index and summary once
+        they have been stored
+
+        :param messages: the list of messages to store, oldest first
+        """
+        if not messages:
+            return
+
+        with self._session_lock:
+            boards = set([x[0:2] for x in messages])
+            new_boards = not boards.issubset(self._session_boards)
+            stored_boards = set(self._session_boards)
+            self._session_boards.update(boards)
+
+            try:
+                self._store_messages(self.session_id, messages, new_boards)
+            except Exception:
+                # the board list is written again when the messages are retried
+                self._session_boards = stored_boards
+                raise
+
+            # the index positions follow the order the messages were stored in
+            if self._index is not None:
+                self._index.add_many(messages)
+            if self._summary is not None:
+                self._summary.add_stored(len(messages))
+
+    def _encode_messages(self, messages):
+        """
+        Converts messages into the elements to store, packing them if required
+
+        :param messages: the hex encoded messages, oldest first
+        :returns: the list of elements to store, oldest first
+        """
+        if not self.packed:
+            return messages
+
+        elements = []
+        for i in range(0, len(messages), self.frames_per_element):
+            batch = messages[i:i + self.frames_per_element]
+            packed = pack_hex_frames(batch)
+
+            # frames that are not valid hex are stored as they were received
+            if packed is None:
+                elements += batch
+            else:
+                elements.append(packed)
+
+        return elements
+
+    @staticmethod
+    def _decode_elements(elements):
+        """
+        Converts stored elements back into hex encoded messages
+
+        :param elements: the stored elements, oldest first
+        :returns: the list of hex encoded messages, oldest first
+        """
+        messages = []
+        for element in elements:
+            messages += unpack_hex_frames(element)
+        return messages
+
     def get_all_from_session(self, session_id):
         """
         Gets all messages logged during the given session ID
@@ -465,34 +988,145 @@ class DatabaseServer(object):
         :param session_id: the ID of the session to return information for
         :returns: the readings from the session
         """
-        session_str = "session_" + str(session_id)
-        result = self.__data.lrange(session_str, 0, -1)
-        result.reverse()
-        return result
+        archive = self.open_archive(session_id)
+        if archive is not None:
+            return archive.read_all()
+        return self._read_session(session_id)
 
-    def get_latest_from_session(self, session_id):
+    def iterate_session(self, session_id, window=1000, start=None, end=None, boards=None, offset=0):
         """
-        Gets the most recent logged variable from the database and returns it as
-        a raw message string.
+        A generator which yields the messages logged during the given session in lists of (approximately)
+        `window` messages, oldest first, so that large sessions can be processed without reading them into
+        memory in one go.  Messages added during iteration do not move the window
 
-        :param session_id: The id of the session to return the top variable from
+        The messages can be filtered by board timestamp and board ID.  Only the parts of the session which the
+        session's :class:`blitz.data.index.TimeIndex` shows may hold matching messages are read, or the whole
+        session is read and filtered if it has no index.
 
-        :returns: A string containing the last raw serial message received from a board in this session
+        :param session_id: the ID of the session to read
+        :param window: the number of stored elements to read in each request (default 1000)
+        :param start: the first board timestamp to include in milliseconds (default None - no lower limit)
+        :param end: the last board timestamp to include in milliseconds (default None - no upper limit)
+        :param boards: a list of upper case hex board IDs to include (default None - every board)
+        :param offset: the number of matching messages to skip, for instance because they have already been
+            downloaded (default 0)
         """
-        session_str = "session_" + str(session_id)
+        if start is None and end is None and boards is None:
+            for frames in self.__iterate_session(session_id, window, offset):
+                yield frames
+            return
 
-        # Work out if we have taken any new readings since the last status update
-        num_readings = self.__data.llen(session_str)
+        matches = frame_filter(start, end, boards)
+        index = self.get_session_index(session_id)
 
-        if num_readings == self.__last_session_length:
-            # do not return a reading more than once
-            return ""
+        if index is None:
+            parts = self.__iterate_session(session_id, window)
         else:
-            self.__last_session_length = num_readings
+            parts = self.__iterate_positions(session_id, window, index.find(start, end, boards))
 
-        # get and return the last message from the database
-        result = self.__data.lrange(session_str, 0, 0)
-        return "" if len(result) == 0 else result[0]
+        for frames in parts:
+            frames = [x for x in frames if matches(x)]
+            skipped, frames = frames[:offset], frames[offset:]
+            offset -= len(skipped)
+            if frames:
+                yield frames
+
+    def __iterate_positions(self, session_id, window, positions):
+        """
+        A generator which yields the messages in the given parts of a session, in lists of up to `window` messages
+
+        :param positions: a list of (position, number of messages) tuples
+        """
+        for position, count in positions:
+            for offset in range(position, position + count, window):
+                frames = self.read_frames(session_id, offset, min(window, position + count - offset))
+                if not frames:
+                    break
+                yield frames
+
+    def __iterate_session(self, session_id, window, offset=0):
+        archive = self.open_archive(session_id)
+        if archive is not None:
+            for frames in archive.iterate_chunks(offset):
+                yield frames
+            return
+
+        for frames in self._iterate_session(session_id, window) if not offset else \
+                self._iterate_from(session_id, window, offset):
+            yield frames
+
+    def read_frames(self, session_id, position, count):
+        """
+        Reads messages by their position in the session
+
+        :param session_id: the ID of the session to read
+        :param position: the position of the first message to read (0 is the oldest message)
+        :param count: the maximum number of messages to read
+        :returns: the list of messages, oldest first
+        """
+        archive = self.open_archive(session_id)
+        if archive is not None:
+            return archive.read_frames(position, count)
+        return self._read_frames(session_id, position, count)
+
+    def get_session_index(self, session_id):
+        """
+        Gets the time index of a session
+
+        :param session_id: the ID of the session
+        :returns: the :class:`blitz.data.index.TimeIndex`, or None if the session has no index
+        """
+        if str(session_id) == str(self.session_id):
+            return self._index
+
+        index = self._read_index(session_id)
+        return None if index is None else TimeIndex.from_json(index)
+
+    def count_frames(self, session_id, start=None, end=None, boards=None):
+        """
+        Counts the stored messages in a session which may match the filters of :meth:`iterate_session`.  When
+        filters are given this is the number of messages in the parts of the session which the session index
+        shows may hold matching messages, so it is an upper bound
+
+        :param session_id: the ID of the session
+        :returns: the number of messages
+        """
+        index = self.get_session_index(session_id)
+        if index is None:
+            return int(self.get_session_metadata(session_id).get("count", 0))
+        return sum([x[1] for x in index.find(start, end, boards)])
+
+    def archive_file(self, session_id):
+        """
+        Gets the path of the archive file for the given session
+
+        :param session_id: the ID of the session
+        :returns: the path to the archive file or None if sessions are not archived
+        """
+        if self.archive_path is None:
+            return None
+        return os.path.join(self.archive_path, "session_%s.blz" % session_id)
+
+    def is_archived(self, session_id):
+        """
+        Checks if the given session has been written to an archive file
+
+        :param session_id: the ID of the session
+        :returns: True if the session has an archive file
+        """
+        path = self.archive_file(session_id)
+        return path is not None and os.path.exists(path)
+
+    def open_archive(self, session_id):
+        """
+        Opens the archive for the given session
+
+        :param session_id: the ID of the session
+        :returns: the :class:`blitz.data.archive.SessionArchive` or None if the session is not archived
+        """
+        if not self.is_archived(session_id):
+            return None
+        return SessionArchive(self.archive_file(session_id))
 
     def delete_session(self, session_id):
         """
@@ -502,49 +1136,1222 @@ class DatabaseServer(object):
         :parma session_id: the session ID to delete
         :returns: nothing
         """
-        session_str = "session_" + str(session_id)
-        self.__data.lrem("sessions", 1, session_id)
-        self.__data.delete(session_str + "_start")
-        self.__data.delete(session_str + "_end")
-        self.__data.delete(session_str)
+        self._delete_session(session_id)
+        self._update_version(session_id, True)
 
-    def available_sessions(self):
+        if self.is_archived(session_id):
+            os.remove(self.archive_file(session_id))
+
+    def build_session_list_changes(self, since=0, limit=None):
         """
-        Gets all the available session from the database as a list
+        Gets the sessions which have changed since a version of the session list, oldest change first.  The
+        whole list is sent if `since` is 0, or if it is newer than the current version (for instance after the
+        database was flushed).  The session being logged changes without a new version, so it is included in the
+        last page of every request.
 
-        :returns: a list of available sessions or an empty list if there are none
+        :param since: the version of the session list held by the client (default 0 - no session list)
+        :param limit: the largest number of changes to return, or None for no limit.  If there are more changes
+            the returned version is the version of the last change returned, so the next page can be requested
+        :returns: a tuple of (version, True if this is the whole list, True if there are more changes, the list
+            of added or changed sessions in the format used by :meth:`build_client_session_list`, the list of
+            deleted session IDs)
         """
-        result = self.__data.lrange("sessions", 0, -1)
-        return [] if result is None else result
+        version = self.session_list_version()
+        full = since <= 0 or since > version
+        changes = self._session_versions(0 if full else since)
+        if full:
+            changes = [x for x in changes if not x[2]]
 
-    def flush(self):
+        more = limit is not None and len(changes) > limit
+        if more:
+            changes = changes[:limit]
+            version = changes[-1][0]
+
+        changed = [x[1] for x in changes if not x[2]]
+        if not more and self.session_id >= 0 and self.session_id not in changed:
+            changed.append(self.session_id)
+
+        sessions = self.build_client_session_list(changed) if changed else []
+        return version, full, more, sessions, [x[1] for x in changes if x[2]]
+
+    @abstractmethod
+    def session_list_version(self):
         """
-        Cleans out the database
+        :returns: the current version of the session list, or 0 if no sessions have been logged
+        """
+        raise NotImplementedError()
 
-        .. warning::
-            USE WITH CAUTION - this will irrevocably destroy all logged session data
+    @abstractmethod
+    def _update_version(self, session_id, deleted=False):
+        """
+        Increments the session list version and records it as the version of a changed or deleted session
 
-        :returns: nothing
+        :param session_id: the ID of the session which has changed
+        :param deleted: True if the session was deleted (default False)
         """
-        self.__data.flushdb()
+        raise NotImplementedError()
 
-    def build_client_session_list(self):
+    @abstractmethod
+    def _session_versions(self, since):
         """
-        Builds a list of session information in the format::
+        Gets the sessions which have changed since a version of the session list
 
-            [
-                [ID, start timestamp, end timestamp, number of readings]
-                ...
-            ]
+        :param since: the version of the session list
+        :returns: a list of (version, session ID, True if deleted) tuples, oldest change first
+        """
+        raise NotImplementedError()
 
-        :returns: the list of sessions
+    @abstractmethod
+    def _create_session(self, timestamp):
         """
-        sessions = self.available_sessions()
-        result = []
-        for session in sessions:
-            session_start = self.__data.get("session_" + str(session) + "_start")
-            session_end = self.__data.get("session_" + str(session) + "_end")
-            session_count = self.__data.llen("session_" + str(session))
-            result.append("%s %s %s %s" % (session, session_start, session_end, session_count))
+        Allocates a new session ID and creates the session metadata, in a single atomic operation
 
-        return result
+        :param timestamp: the session start timestamp
+        :returns: the new session ID
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _end_session(self, session_id, timestamp):
+        """
+        Records the end timestamp in the session metadata
+
+        :param session_id: the session which has stopped
+        :param timestamp: the session end timestamp
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _store_summary(self, session_id, summary):
+        """
+        Stores the session summary in the session metadata
+
+        :param session_id: the session which has stopped
+        :param summary: the summary as a JSON string
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _store_index(self, session_id, index):
+        """
+        Stores the time index of a session when it stops
+
+        :param session_id: the ID of the session
+        :param index: the index as a JSON string
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _read_index(self, session_id):
+        """
+        Reads the stored time index of a session
+
+        :param session_id: the ID of the session
+        :returns: the index as a JSON string, or None if the session has no index
+        """
+        raise NotImplementedError()
+
+    def _reset_status(self):
+        """
+        Resets any state used by get_latest_from_session when a session starts or stops
+        """
+        pass
+
+    @abstractmethod
+    def _store_messages(self, session_id, messages, new_boards):
+        """
+        Stores the messages and updates the session count (and board list if `new_boards` is True)
+
+        :param session_id: the session to store the messages against
+        :param messages: the hex encoded messages, oldest first
+        :param new_boards: True if the messages are from a board which had not yet logged in this session
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _read_session(self, session_id):
+        """
+        Reads all messages in a session which has not been archived, oldest first
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def _iterate_session(self, session_id, window):
+        """
+        A generator yielding the messages in a session which has not been archived, oldest first
+        """
+        raise NotImplementedError()
+
+    def _iterate_from(self, session_id, window, position):
+        """
+        A generator which yields the stored messages from the given position in the session onwards.  The default
+        implementation skips through the session, implementations override it where the storage can be read by
+        position
+        """
+        for frames in self._iterate_session(session_id, window):
+            if position < len(frames):
+                yield frames[position:]
+            position = max(0, position - len(frames))
+
+    def _iterate_by_position(self, session_id, window, position):
+        """
+        Implements :meth:`_iterate_from` with repeated calls to :meth:`_read_frames`, for implementations which
+        can read by position
+        """
+        while True:
+            frames = self._read_frames(session_id, position, window)
+            if not frames:
+                break
+            yield frames
+            position += len(frames)
+            if len(frames) < window:
+                break
+
+    def _read_frames(self, session_id, position, count):
+        """
+        Reads stored messages by their position in the session.  The default implementation iterates through the
+        session, implementations override it where the storage can be read by position
+
+        :returns: the list of messages, oldest first
+        """
+        result = []
+        read = 0
+
+        for frames in self._iterate_session(session_id, max(count, 1000)):
+            if read + len(frames) > position:
+                result += frames[max(0, position - read):]
+            read += len(frames)
+            if len(result) >= count:
+                break
+
+        return result[:count]
+
+    @abstractmethod
+    def _delete_session(self, session_id):
+        """
+        Deletes the session data and metadata from the database
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_ten_from_session(self):
+        """
+        Gets the last ten readings from the logging session
+
+        :returns: the list of raw serial messages
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_latest_from_session(self, session_id):
+        """
+        Gets the most recent logged variable from the database and returns it as
+        a raw message string.
+
+        :param session_id: The id of the session to return the top variable from
+
+        :returns: A string containing the last raw serial message received from a board in this session,
+            or an empty string if no message has been received since the last call
+        """
+        raise NotImplementedError()
+
+    def get_latest_frames(self):
+        """
+        Gets the newest frame logged by each board in the current session
+
+        :returns: a list of raw serial messages, one per board, ordered by board ID
+        """
+        return self.latest.frames()
+
+    def get_latest_values(self):
+        """
+        Gets the newest value of each decoded channel in the current session
+
+        :returns: a dictionary of values by variable name
+        """
+        return self.latest.values()
+
+    @abstractmethod
+    def evict_session(self, session_id):
+        """
+        Removes the data for a session from the database once it has been archived.  The session metadata is
+        retained
+
+        :param session_id: the ID of the session to evict
+        :returns: nothing
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def available_sessions(self):
+        """
+        Gets all the available session from the database as a list, newest first
+
+        :returns: a list of session IDs (as strings) or an empty list if there are none
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def flush(self):
+        """
+        Cleans out the database
+
+        .. warning::
+            USE WITH CAUTION - this will irrevocably destroy all logged session data
+
+        :returns: nothing
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def build_client_session_list(self, session_ids=None):
+        """
+        Builds a list of session information, newest first, in the format::
+
+            [
+                "ID START_TIMESTAMP END_TIMESTAMP NUMBER_OF_READINGS [SUMMARY]"
+                ...
+            ]
+
+        where SUMMARY is the JSON session summary (see :class:`blitz.data.summary.SessionSummary`), which is
+        omitted for sessions that are running or have no summary
+
+        :param session_ids: the IDs of the sessions to include (default None - every session)
+        :returns: the list of sessions
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_session_metadata(self, session_id):
+        """
+        Gets the metadata for the given session
+
+        :param session_id: the ID of the session to get metadata for
+        :returns: a dictionary with string start, end, count and boards values and a summary value once the
+            session has stopped (empty if the session has no metadata)
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def store_session_preview(self, session_id, preview):
+        """
+        Stores the decimated preview of a session (see :class:`blitz.data.summary.SessionPreview`)
+
+        :param session_id: the ID of the session
+        :param preview: the preview as a JSON string
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def get_session_preview(self, session_id):
+        """
+        Gets the stored preview of a session
+
+        :param session_id: the ID of the session
+        :returns: the preview as a JSON string, or None if no preview has been stored
+        """
+        raise NotImplementedError()
+
+
+class RedisDatabaseServer(DatabaseServer):
+    """
+    A DatabaseServer which stores sessions in redis - retains several documents:
+
+    - **session_id**  the id of the most recent session
+    - **sessions**  a list of session in the database
+    - **session_N_meta**  a hash of metadata for session N (see :class:`DatabaseServer`)
+    - **session_N**  a queue of raw session data for session_id N
+    - **session_N_preview**  the decimated preview of session N, once it has been built
+    - **session_N_index**  the time index of session N, once it has stopped
+    - **session_list_version**  the version of the session list
+    - **session_versions**  a sorted set of session IDs, scored by the version of their last change
+    - **deleted_sessions**  a sorted set of deleted session IDs, scored by the version they were deleted in
+
+    Sessions logged before the metadata hash was introduced used separate **session_N_start** and
+    **session_N_end** keys, these are still read when building the session list.
+    """
+
+    _data = None
+
+    # atomically allocates a session id, adds it to the session list and creates the metadata hash
+    # KEYS: session counter, session list   ARGV: start timestamp
+    START_SESSION_SCRIPT = """
+        local session_id = redis.call('INCR', KEYS[1])
+        redis.call('LPUSH', KEYS[2], session_id)
+        redis.call('HMSET', 'session_' .. session_id .. '_meta',
+            'start', ARGV[1], 'end', 'None', 'count', 0, 'boards', '')
+        return session_id
+    """
+
+    # builds the "ID START END COUNT" session list in a single round trip, falling back to the
+    # legacy session_N_start / session_N_end keys for sessions without a metadata hash
+    # KEYS: session list   ARGV: the session ids to include, or nothing for every session
+    SESSION_LIST_SCRIPT = """
+        local sessions = ARGV
+        if #sessions == 0 then
+            sessions = redis.call('LRANGE', KEYS[1], 0, -1)
+        end
+        local result = {}
+        for i, session_id in ipairs(sessions) do
+            local prefix = 'session_' .. session_id
+            local meta = redis.call('HMGET', prefix .. '_meta', 'start', 'end', 'count', 'summary')
+            if not meta[1] then
+                meta[1] = redis.call('GET', prefix .. '_start')
+                meta[2] = redis.call('GET', prefix .. '_end')
+                meta[3] = redis.call('LLEN', prefix)
+            end
+            result[i] = session_id .. ' ' .. tostring(meta[1] or 'None') .. ' ' ..
+                tostring(meta[2] or 'None') .. ' ' .. tostring(meta[3] or 0)
+            if meta[4] then
+                result[i] = result[i] .. ' ' .. meta[4]
+            end
+        end
+        return result
+    """
+
+    # increments the session list version and moves a session to the sorted set for its change
+    # KEYS: version counter, sorted set to add the session to, sorted set to remove it from   ARGV: session id
+    VERSION_SCRIPT = """
+        local version = redis.call('INCR', KEYS[1])
+        redis.call('ZADD', KEYS[2], version, ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        return version
+    """
+
+    # deletes the data of an archived session, first creating the metadata hash of a legacy session from its
+    # session_N_start / session_N_end keys and the length of its data so it is still listed with its count
+    # KEYS: session data, metadata hash, legacy start key, legacy end key
+    EVICT_SESSION_SCRIPT = """
+        if redis.call('HEXISTS', KEYS[2], 'start') == 0 then
+            redis.call('HMSET', KEYS[2], 'start', redis.call('GET', KEYS[3]) or 'None',
+                'end', redis.call('GET', KEYS[4]) or 'None', 'count', redis.call('LLEN', KEYS[1]))
+        end
+        return redis.call('DEL', KEYS[1])
+    """
+
+    # versions the sessions logged before the session list was versioned, oldest first
+    # KEYS: session list, version counter, session versions
+    UPGRADE_VERSIONS_SCRIPT = """
+        if redis.call('EXISTS', KEYS[2]) == 1 then
+            return 0
+        end
+        local sessions = redis.call('LRANGE', KEYS[1], 0, -1)
+        for i = #sessions, 1, -1 do
+            redis.call('ZADD', KEYS[3], redis.call('INCR', KEYS[2]), sessions[i])
+        end
+        return #sessions
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, unix_socket_path=None, max_connections=None,
+                 grow_pool=False, **kwargs):
+        """
+        Initialises a new instance of a RedisDatabaseServer with its own redis connection pool
+
+        :param host: the host name of the redis server (default "localhost")
+        :param port: the port of the redis server (default 6379)
+        :param db: the redis database index to use (default 0)
+        :param unix_socket_path: the path to the redis unix domain socket. If given this is used instead of host
+            and port which gives lower latency when redis is on the same machine (default None)
+        :param max_connections: the maximum number of connections in the pool, which should be at least the number
+            of threads using the DatabaseServer (default None - unlimited)
+        :param grow_pool: if True the pool limit is raised by :meth:`add_threads` as each thread which uses the
+            DatabaseServer is created (default False)
+        :param kwargs: the storage settings passed to :class:`DatabaseServer`
+
+        :raises redis.ConnectionError: if the redis server cannot be reached
+        """
+        self.logger.debug("RedisDatabaseServer __init__")
+        super(RedisDatabaseServer, self).__init__(**kwargs)
+
+        if unix_socket_path:
+            self.logger.info("DatabaseServer connecting to redis at %s (db %s)" % (unix_socket_path, db))
+            pool = redis.ConnectionPool(connection_class=redis.UnixDomainSocketConnection, path=unix_socket_path,
+                                        db=db, max_connections=max_connections)
+        else:
+            self.logger.info("DatabaseServer connecting to redis at %s:%s (db %s)" % (host, port, db))
+            pool = redis.ConnectionPool(host=host, port=port, db=db, max_connections=max_connections)
+
+        self.__pool = pool
+        self.__grow_pool = grow_pool and max_connections is not None
+        self._data = redis.StrictRedis(connection_pool=pool)
+        self.__start_session_script = self._data.register_script(self.START_SESSION_SCRIPT)
+        self.__session_list_script = self._data.register_script(self.SESSION_LIST_SCRIPT)
+        self.__version_script = self._data.register_script(self.VERSION_SCRIPT)
+        self.__evict_session_script = self._data.register_script(self.EVICT_SESSION_SCRIPT)
+        self._data.register_script(self.UPGRADE_VERSIONS_SCRIPT)(
+            keys=["sessions", "session_list_version", "session_versions"])
+        self.session_id = self.__get_session_id()
+        self._last_session_length = -1
+
+    @classmethod
+    def _config_settings(cls, config, threads):
+        """
+        Adds the redis connection settings to the DatabaseServer settings.  If the "database_max_connections"
+        setting is not given the connection pool starts with a connection for each of the given threads and grows
+        as more threads are added (see :meth:`add_threads`)
+        """
+        settings = super(RedisDatabaseServer, cls)._config_settings(config, threads)
+        settings.update({
+            "host": config["database_host"],
+            "port": config["database_port"],
+            "db": config["database_index"],
+            "unix_socket_path": config["database_socket"],
+            "max_connections": config["database_max_connections"] or threads,
+            "grow_pool": not config["database_max_connections"]
+        })
+        return settings
+
+    def add_threads(self, count=1):
+        """
+        Raises the connection pool limit by a connection for each new thread, as the pool raises a ConnectionError
+        rather than waiting when every connection is in use.  A limit set by the "database_max_connections"
+        setting is not changed
+
+        :param count: the number of threads (default 1)
+        """
+        if self.__grow_pool:
+            self.__pool.max_connections += count
+
+    @staticmethod
+    def _meta_key(session_id):
+        return "session_%s_meta" % session_id
+
+    @staticmethod
+    def _session_key(session_id):
+        return "session_%s" % session_id
+
+    @staticmethod
+    def _preview_key(session_id):
+        return "session_%s_preview" % session_id
+
+    @staticmethod
+    def _index_key(session_id):
+        return "session_%s_index" % session_id
+
+    def __get_session_id(self):
+        # the counter holds the last session started, which is only resumed if it was not stopped
+        sess_id = self._data.get("session_id")
+        if sess_id is None or self._data.hget(self._meta_key(sess_id), "end") != "None":
+            return -1
+        return int(sess_id)
+
+    def _create_session(self, timestamp):
+        return self.__start_session_script(keys=["session_id", "sessions"], args=[timestamp])
+
+    def _end_session(self, session_id, timestamp):
+        self._data.hset(self._meta_key(session_id), "end", timestamp)
+
+    def _store_summary(self, session_id, summary):
+        self._data.hset(self._meta_key(session_id), "summary", summary)
+
+    def _store_index(self, session_id, index):
+        self._data.set(self._index_key(session_id), index)
+
+    def _read_index(self, session_id):
+        return self._data.get(self._index_key(session_id))
+
+    def _reset_status(self):
+        self._last_session_length = -1
+
+    def session_list_version(self):
+        version = self._data.get("session_list_version")
+        return int(version) if version is not None else 0
+
+    def _update_version(self, session_id, deleted=False):
+        keys = ["session_versions", "deleted_sessions"]
+        if deleted:
+            keys.reverse()
+        self.__version_script(keys=["session_list_version"] + keys, args=[session_id])
+
+    def _session_versions(self, since):
+        pipe = self._data.pipeline(transaction=False)
+        pipe.zrangebyscore("session_versions", "(%s" % since, "+inf", withscores=True)
+        pipe.zrangebyscore("deleted_sessions", "(%s" % since, "+inf", withscores=True)
+        changed, deleted = pipe.execute()
+
+        return sorted([(int(x[1]), int(x[0]), False) for x in changed] +
+                      [(int(x[1]), int(x[0]), True) for x in deleted])
+
+    def get_ten_from_session(self):
+        """
+        Gets the last ten readings from the logging session
+
+        :returns: the list of raw serial messages
+        """
+        session_str = "session_" + str(self.session_id)
+        result = self._data.lrange(session_str, 0, 9)  # numbers are inclusive
+        result.reverse()
+        return self._decode_elements(result)[-10:]
+
+    def _store_messages(self, session_id, messages, new_boards):
+        """
+        Pushes the data with a single variadic LPUSH and updates the metadata in the same round trip
+        """
+        meta_str = self._meta_key(session_id)
+
+        pipe = self._data.pipeline(transaction=False)
+        self._push_messages(pipe, session_id, messages)
+        pipe.hincrby(meta_str, "count", len(messages))
+
+        if new_boards:
+            pipe.hset(meta_str, "boards", " ".join(sorted(self._session_boards)))
+
+        pipe.execute()
+
+    def _push_messages(self, pipe, session_id, messages):
+        """
+        Adds the commands required to store the given messages to a pipeline.  Can be overridden by
+        DatabaseServers which store session data in a different structure
+
+        :param pipe: the redis pipeline to add commands to
+        :param session_id: the session to store the messages against
+        :param messages: the messages to store, oldest first
+        """
+        pipe.lpush(self._session_key(session_id), *self._encode_messages(messages))
+
+    def _read_session(self, session_id):
+        session_str = "session_" + str(session_id)
+        result = self._data.lrange(session_str, 0, -1)
+        result.reverse()
+        return self._decode_elements(result)
+
+    def _iterate_session(self, session_id, window):
+        # the list is read from its tail, so messages added during iteration do not move the window
+        session_str = self._session_key(session_id)
+        read = 0
+        while True:
+            # negative indices count back from the oldest element, which is at the end of the list
+            elements = self._data.lrange(session_str, -(read + window), -(read + 1))
+            if not elements:
+                break
+            elements.reverse()
+            yield self._decode_elements(elements)
+            read += len(elements)
+            if len(elements) < window:
+                break
+
+    def _read_frames(self, session_id, position, count):
+        if self.frames_per_element != 1:
+            return super(RedisDatabaseServer, self)._read_frames(session_id, position, count)
+
+        # with one frame in each element the frames can be read directly from the tail of the list
+        elements = self._data.lrange(self._session_key(session_id), -(position + count), -(position + 1))
+        elements.reverse()
+        return self._decode_elements(elements)
+
+    def _iterate_from(self, session_id, window, position):
+        if self.frames_per_element != 1:
+            return super(RedisDatabaseServer, self)._iterate_from(session_id, window, position)
+        return self._iterate_by_position(session_id, window, position)
+
+    def evict_session(self, session_id):
+        """
+        Removes the data for a session from redis once it has been archived.  The session metadata is retained,
+        and is created for sessions logged before the metadata hash was introduced
+
+        :param session_id: the ID of the session to evict
+        :returns: nothing
+        """
+        session_str = "session_" + str(session_id)
+        self.__evict_session_script(keys=[self._session_key(session_id), self._meta_key(session_id),
+                                          session_str + "_start", session_str + "_end"])
+
+    def get_latest_from_session(self, session_id):
+        """
+        Gets the most recent logged variable from the database and returns it as
+        a raw message string.
+
+        :param session_id: The id of the session to return the top variable from
+
+        :returns: A string containing the last raw serial message received from a board in this session
+        """
+        session_str = "session_" + str(session_id)
+
+        # Work out if we have taken any new readings since the last status update
+        num_readings = self._data.llen(session_str)
+
+        if num_readings == self._last_session_length:
+            # do not return a reading more than once
+            return ""
+        else:
+            self._last_session_length = num_readings
+
+        # get and return the last message from the database
+        result = self._data.lrange(session_str, 0, 0)
+        return "" if len(result) == 0 else self._decode_elements(result)[-1]
+
+    def _delete_session(self, session_id):
+        session_str = "session_" + str(session_id)
+        pipe = self._data.pipeline(transaction=False)
+        pipe.lrem("sessions", 1, session_id)
+        pipe.delete(session_str + "_start", session_str + "_end", self._meta_key(session_id),
+                    self._session_key(session_id), self._preview_key(session_id), self._index_key(session_id))
+        pipe.execute()
+
+    def available_sessions(self):
+        """
+        Gets all the available session from the database as a list
+
+        :returns: a list of available sessions or an empty list if there are none
+        """
+        result = self._data.lrange("sessions", 0, -1)
+        return [] if result is None else result
+
+    def flush(self):
+        """
+        Cleans out the database
+
+        .. warning::
+            USE WITH CAUTION - this will irrevocably destroy all logged session data
+
+        :returns: nothing
+        """
+        self._data.flushdb()
+
+    def build_client_session_list(self, session_ids=None):
+        """
+        Builds a list of session information in the format::
+
+            [
+                "ID START_TIMESTAMP END_TIMESTAMP NUMBER_OF_READINGS [SUMMARY]"
+                ...
+            ]
+
+        The list is built by a server side script so only one round trip to redis is required
+
+        :param session_ids: the IDs of the sessions to include (default None - every session)
+        :returns: the list of sessions
+        """
+        return self.__session_list_script(keys=["sessions"], args=session_ids or [])
+
+    def get_session_metadata(self, session_id):
+        """
+        Gets the metadata hash for the given session
+
+        :param session_id: the ID of the session to get metadata for
+        :returns: a dictionary with start, end, count, boards and (once stopped) summary keys (empty if the
+            session has no metadata)
+        """
+        return self._data.hgetall(self._meta_key(session_id))
+
+    def store_session_preview(self, session_id, preview):
+        """
+        Stores the decimated preview of a session in its own key, so the metadata hash remains small
+
+        :param session_id: the ID of the session
+        :param preview: the preview as a JSON string
+        """
+        self._data.set(self._preview_key(session_id), preview)
+
+    def get_session_preview(self, session_id):
+        """
+        Gets the stored preview of a session
+
+        :param session_id: the ID of the session
+        :returns: the preview as a JSON string, or None if no preview has been stored
+        """
+        return self._data.get(self._preview_key(session_id))
+
+
+class StreamDatabaseServer(RedisDatabaseServer):
+    """
+    A RedisDatabaseServer which stores session data in a redis stream (**session_N_stream**) rather than a list.
+    Stream IDs are derived from the frame timestamp in the form ``TIMESTAMP-SEQUENCE`` so that frames can be
+    read by time using XRANGE, or tailed from a given ID.  Streams can optionally be trimmed to an approximate
+    maximum length.  Requires redis 5.0 or later.
+    """
+
+    def __init__(self, maxlen=None, **kwargs):
+        """
+        Initialises a new StreamDatabaseServer
+
+        :param maxlen: if given, the approximate maximum number of frames to retain in each session stream
+        :param kwargs: the connection settings passed to :class:`RedisDatabaseServer`
+        """
+        super(StreamDatabaseServer, self).__init__(**kwargs)
+        self.maxlen = maxlen
+        self.__last_id = None
+        self.__last_status_id = None
+
+    @classmethod
+    def _config_settings(cls, config, threads):
+        """
+        Adds the "database_stream_maxlen" setting to the redis settings
+        """
+        settings = super(StreamDatabaseServer, cls)._config_settings(config, threads)
+        settings["maxlen"] = config["database_stream_maxlen"]
+        return settings
+
+    @staticmethod
+    def _session_key(session_id):
+        return "session_%s_stream" % session_id
+
+    @staticmethod
+    def next_stream_id(timestamp, last_id):
+        """
+        Works out the stream ID for a frame.  Stream IDs must increase, so frames with a timestamp before the
+        last ID (for instance from a different board) are stored against the last timestamp
+
+        :param timestamp: the frame timestamp in milliseconds, or None if the frame has no timestamp
+        :param last_id: the last ID added to the stream as a (timestamp, sequence) tuple
+        :returns: the next ID as a (timestamp, sequence) tuple
+        """
+        if timestamp is None or timestamp <= last_id[0]:
+            return last_id[0], last_id[1] + 1
+        return timestamp, 1
+
+    @staticmethod
+    def parse_stream_id(stream_id):
+        """
+        Converts a "TIMESTAMP-SEQUENCE" stream ID into a (timestamp, sequence) tuple
+        """
+        parts = stream_id.split("-")
+        return int(parts[0]), int(parts[1])
+
+    def _create_session(self, timestamp):
+        self.__last_id = (0, 0)
+        return super(StreamDatabaseServer, self)._create_session(timestamp)
+
+    def _reset_status(self):
+        self.__last_status_id = None
+
+    def _push_messages(self, pipe, session_id, messages):
+        """
+        Appends the messages to the session stream with XADD
+        """
+        key = self._session_key(session_id)
+        trim = ["MAXLEN", "~", self.maxlen] if self.maxlen else []
+
+        if self.__last_id is None:
+            # a session resumed after a restart continues from the last entry in its stream
+            last = self._data.execute_command("XREVRANGE", key, "+", "-", "COUNT", 1)
+            self.__last_id = self.parse_stream_id(last[0][0]) if last else (0, 0)
+
+        for message in messages:
+            self.__last_id = self.next_stream_id(frame_timestamp(message), self.__last_id)
+            value = (pack_hex_frames([message]) or message) if self.packed else message
+            args = ["XADD", key] + trim + ["%s-%s" % self.__last_id, "f", value]
+            pipe.execute_command(*args)
+
+    def __read(self, command, session_id, start, end, count=None):
+        """
+        Runs an XRANGE or XREVRANGE command, returning a list of (stream id, message) tuples
+        """
+        args = [command, self._session_key(session_id), start, end]
+        if count is not None:
+            args += ["COUNT", count]
+        result = self._data.execute_command(*args)
+        return [(x[0], unpack_hex_frames(x[1][1])[0]) for x in result] if result else []
+
+    def get_ten_from_session(self):
+        """
+        Gets the last ten readings from the logging session
+
+        :returns: the list of raw serial messages
+        """
+        result = self.__read("XREVRANGE", self.session_id, "+", "-", 10)
+        result.reverse()
+        return [x[1] for x in result]
+
+    def _read_session(self, session_id):
+        return [x[1] for x in self.__read("XRANGE", session_id, "-", "+")]
+
+    def _iterate_session(self, session_id, window):
+        last_id = "0-0"
+        while True:
+            frames, last_id = self.get_since_from_session(session_id, last_id, window)
+            if not frames:
+                break
+            yield frames
+            if len(frames) < window:
+                break
+
+    def _read_frames(self, session_id, position, count):
+        # stream entries cannot be read by position, so the session is iterated
+        return DatabaseServer._read_frames(self, session_id, position, count)
+
+    def _iterate_from(self, session_id, window, position):
+        return DatabaseServer._iterate_from(self, session_id, window, position)
+
+    def get_range_from_session(self, session_id, start, end):
+        """
+        Gets the messages logged between the two frame timestamps (inclusive)
+
+        :param session_id: the ID of the session to return information for
+        :param start: the earliest timestamp to return in milliseconds
+        :param end: the latest timestamp to return in milliseconds
+        :returns: the list of raw messages
+        """
+        return [x[1] for x in self.__read("XRANGE", session_id, start, end)]
+
+    def get_since_from_session(self, session_id, last_id, count=None):
+        """
+        Gets the messages added to the session stream after the given stream ID, allowing a
+        session to be tailed
+
+        :param session_id: the ID of the session to return information for
+        :param last_id: the last stream ID that was read, e.g. "1500-2" (use "0-0" to read from the start)
+        :param count: the maximum number of messages to return (default None - all messages)
+        :returns: a tuple of (list of raw messages, last stream ID read)
+        """
+        ts, seq = self.parse_stream_id(last_id)
+        result = self.__read("XRANGE", session_id, "%s-%s" % (ts, seq + 1), "+", count)
+        if not result:
+            return [], last_id
+        return [x[1] for x in result], result[-1][0]
+
+    def get_latest_from_session(self, session_id):
+        """
+        Gets the most recent logged variable from the database and returns it as
+        a raw message string.
+
+        :param session_id: The id of the session to return the top variable from
+
+        :returns: A string containing the last raw serial message received from a board in this session,
+            or an empty string if no message has been received since the last call
+        """
+        result = self.__read("XREVRANGE", session_id, "+", "-", 1)
+
+        if not result or result[0][0] == self.__last_status_id:
+            # do not return a reading more than once
+            return ""
+
+        self.__last_status_id = result[0][0]
+        return result[0][1]
+
+
+class EmbeddedDatabaseServer(DatabaseServer):
+    """
+    A DatabaseServer which stores sessions in an embedded SQLite database file, so that the server can run on
+    small devices without a redis server.  The database has three tables:
+
+    - **sessions** the session metadata (see :class:`DatabaseServer`), with session IDs that are never reused
+    - **frames** the stored elements of every session, in the order they were logged
+    - **deleted_sessions** the session list version each deleted session was deleted in
+
+    The connection is shared by all threads using the DatabaseServer and access is serialised with a lock.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            started INTEGER NOT NULL,
+            stopped INTEGER,
+            count INTEGER NOT NULL DEFAULT 0,
+            boards TEXT NOT NULL DEFAULT '',
+            summary TEXT,
+            preview TEXT,
+            time_index TEXT,
+            version INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS frames (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS frames_session ON frames (session_id, id);
+        CREATE TABLE IF NOT EXISTS deleted_sessions (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    # columns added to the sessions table after the first release, which are added to older database files
+    ADDED_COLUMNS = (("summary", "TEXT"), ("preview", "TEXT"), ("time_index", "TEXT"), ("version", "INTEGER"))
+
+    def __init__(self, path=":memory:", **kwargs):
+        """
+        Opens (or creates) the embedded database
+
+        :param path: the path to the SQLite database file (default ":memory:" - an in memory database which is
+            discarded when the server stops)
+        :param kwargs: the storage settings passed to :class:`DatabaseServer`
+        """
+        self.logger.debug("EmbeddedDatabaseServer __init__")
+        super(EmbeddedDatabaseServer, self).__init__(**kwargs)
+
+        self.logger.info("DatabaseServer using embedded database at %s" % path)
+        self.path = path
+        self.__lock = threading.RLock()
+        self._data = sqlite3.connect(path, check_same_thread=False)
+        self._data.text_factory = str
+
+        # write ahead logging allows readers while the acquisition thread is writing and only
+        # syncs at checkpoints, rather than on every committed poll
+        self._data.execute("PRAGMA journal_mode=WAL")
+        self._data.execute("PRAGMA synchronous=NORMAL")
+        self._data.executescript(self.SCHEMA)
+        self.__upgrade_schema()
+
+        self.session_id = self.__get_session_id()
+        self._last_frame_id = -1
+
+    @classmethod
+    def _config_settings(cls, config, threads):
+        """
+        Adds the "database_path" setting to the DatabaseServer settings, which defaults to "blitz_server.db"
+        in the application path
+        """
+        settings = super(EmbeddedDatabaseServer, cls)._config_settings(config, threads)
+        settings["path"] = config["database_path"] or os.path.join(config["application_path"], "blitz_server.db")
+        return settings
+
+    def __execute(self, query, parameters=(), commit=False):
+        """
+        Runs a query while holding the connection lock
+
+        :returns: the list of result rows
+        """
+        with self.__lock:
+            result = self._data.execute(query, parameters).fetchall()
+            if commit:
+                self._data.commit()
+        return result
+
+    def __upgrade_schema(self):
+        columns = [x[1] for x in self.__execute("PRAGMA table_info(sessions)")]
+        for column, column_type in self.ADDED_COLUMNS:
+            if column not in columns:
+                self.logger.info("Adding %s column to the embedded database sessions table" % column)
+                self.__execute("ALTER TABLE sessions ADD COLUMN %s %s" % (column, column_type), commit=True)
+
+        # the IDs of older sessions are unique and increasing, so they are used as their versions
+        if "version" not in columns:
+            self.__execute("UPDATE sessions SET version = id", commit=True)
+
+    def __get_session_id(self):
+        # resume logging to a session which was not stopped before the server exited
+        result = self.__execute("SELECT id FROM sessions WHERE stopped IS NULL ORDER BY id DESC LIMIT 1")
+        return result[0][0] if result else -1
+
+    def _create_session(self, timestamp):
+        with self.__lock:
+            cursor = self._data.execute("INSERT INTO sessions (started) VALUES (?)", (timestamp,))
+            self._data.commit()
+        return cursor.lastrowid
+
+    def _end_session(self, session_id, timestamp):
+        self.__execute("UPDATE sessions SET stopped = ? WHERE id = ?", (timestamp, session_id), True)
+
+    def _store_summary(self, session_id, summary):
+        self.__execute("UPDATE sessions SET summary = ? WHERE id = ?", (summary, session_id), True)
+
+    def _store_index(self, session_id, index):
+        self.__execute("UPDATE sessions SET time_index = ? WHERE id = ?", (index, session_id), True)
+
+    def _read_index(self, session_id):
+        result = self.__execute("SELECT time_index FROM sessions WHERE id = ?", (session_id,))
+        return result[0][0] if result else None
+
+    def _reset_status(self):
+        self._last_frame_id = -1
+
+    def session_list_version(self):
+        result = self.__execute("SELECT MAX(version) FROM (SELECT version FROM sessions UNION ALL "
+                                "SELECT version FROM deleted_sessions)")
+        return result[0][0] or 0
+
+    def _update_version(self, session_id, deleted=False):
+        with self.__lock:
+            version = self.session_list_version() + 1
+            if deleted:
+                self._data.execute("INSERT OR REPLACE INTO deleted_sessions (id, version) VALUES (?, ?)",
+                                   (session_id, version))
+            else:
+                self._data.execute("UPDATE sessions SET version = ? WHERE id = ?", (version, session_id))
+            self._data.commit()
+
+    def _session_versions(self, since):
+        result = self.__execute("SELECT version, id, 0 FROM sessions WHERE version > ? UNION ALL "
+                                "SELECT version, id, 1 FROM deleted_sessions WHERE version > ? ORDER BY 1",
+                                (since, since))
+        return [(x[0], x[1], bool(x[2])) for x in result]
+
+    def _store_messages(self, session_id, messages, new_boards):
+        """
+        Inserts the data and updates the metadata in a single transaction
+        """
+        rows = [(session_id, sqlite3.Binary(x)) for x in self._encode_messages(messages)]
+
+        with self.__lock:
+            self._data.executemany("INSERT INTO frames (session_id, data) VALUES (?, ?)", rows)
+            self._data.execute("UPDATE sessions SET count = count + ? WHERE id = ?", (len(messages), session_id))
+            if new_boards:
+                self._data.execute("UPDATE sessions SET boards = ? WHERE id = ?",
+                                   (" ".join(sorted(self._session_boards)), session_id))
+            self._data.commit()
+
+    def __read_elements(self, session_id, after_id, count):
+        """
+        Reads up to `count` stored elements with a row ID greater than `after_id`, oldest first
+
+        :returns: a list of (row id, element) tuples
+        """
+        result = self.__execute("SELECT id, data FROM frames WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+                                (session_id, after_id, count))
+        return [(x[0], str(x[1])) for x in result]
+
+    def get_ten_from_session(self):
+        """
+        Gets the last ten readings from the logging session
+
+        :returns: the list of raw serial messages
+        """
+        result = self.__execute("SELECT data FROM frames WHERE session_id = ? ORDER BY id DESC LIMIT 10",
+                                (self.session_id,))
+        result.reverse()
+        return self._decode_elements([str(x[0]) for x in result])[-10:]
+
+    def _read_session(self, session_id):
+        result = self.__execute("SELECT data FROM frames WHERE session_id = ? ORDER BY id", (session_id,))
+        return self._decode_elements([str(x[0]) for x in result])
+
+    def _iterate_session(self, session_id, window):
+        # read by row ID so messages added during iteration do not move the window
+        last_id = -1
+        while True:
+            elements = self.__read_elements(session_id, last_id, window)
+            if not elements:
+                break
+            yield self._decode_elements([x[1] for x in elements])
+            last_id = elements[-1][0]
+            if len(elements) < window:
+                break
+
+    def _read_frames(self, session_id, position, count):
+        if self.frames_per_element != 1:
+            return super(EmbeddedDatabaseServer, self)._read_frames(session_id, position, count)
+
+        result = self.__execute("SELECT data FROM frames WHERE session_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                                (session_id, count, position))
+        return self._decode_elements([str(x[0]) for x in result])
+
+    def _iterate_from(self, session_id, window, position):
+        if self.frames_per_element != 1:
+            return super(EmbeddedDatabaseServer, self)._iterate_from(session_id, window, position)
+        return self._iterate_by_position(session_id, window, position)
+
+    def evict_session(self, session_id):
+        """
+        Removes the data for a session from the database once it has been archived.  The session metadata is
+        retained
+
+        :param session_id: the ID of the session to evict
+        :returns: nothing
+        """
+        self.__execute("DELETE FROM frames WHERE session_id = ?", (session_id,), True)
+
+    def get_latest_from_session(self, session_id):
+        """
+        Gets the most recent logged variable from the database and returns it as
+        a raw message string.
+
+        :param session_id: The id of the session to return the top variable from
+
+        :returns: A string containing the last raw serial message received from a board in this session,
+            or an empty string if no message has been received since the last call
+        """
+        result = self.__execute("SELECT id, data FROM frames WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+                                (session_id,))
+
+        if not result or result[0][0] == self._last_frame_id:
+            # do not return a reading more than once
+            return ""
+
+        self._last_frame_id = result[0][0]
+        return self._decode_elements([str(result[0][1])])[-1]
+
+    def _delete_session(self, session_id):
+        with self.__lock:
+            self._data.execute("DELETE FROM frames WHERE session_id = ?", (session_id,))
+            self._data.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._data.commit()
+
+    def available_sessions(self):
+        """
+        Gets all the available session from the database as a list, newest first
+
+        :returns: a list of session IDs (as strings) or an empty list if there are none
+        """
+        return [str(x[0]) for x in self.__execute("SELECT id FROM sessions ORDER BY id DESC")]
+
+    def flush(self):
+        """
+        Cleans out the database, including the session ID counter
+
+        .. warning::
+            USE WITH CAUTION - this will irrevocably destroy all logged session data
+
+        :returns: nothing
+        """
+        with self.__lock:
+            self._data.execute("DELETE FROM frames")
+            self._data.execute("DELETE FROM sessions")
+            self._data.execute("DELETE FROM deleted_sessions")
+            self._data.execute("DELETE FROM sqlite_sequence")
+            self._data.commit()
+        self.session_id = -1
+
+    def build_client_session_list(self, session_ids=None):
+        """
+        Builds a list of session information, newest first, in the format::
+
+            [
+                "ID START_TIMESTAMP END_TIMESTAMP NUMBER_OF_READINGS [SUMMARY]"
+                ...
+            ]
+
+        :param session_ids: the IDs of the sessions to include (default None - every session)
+        :returns: the list of sessions
+        """
+        if session_ids:
+            result = self.__execute("SELECT id, started, stopped, count, summary FROM sessions WHERE id IN (%s) "
+                                    "ORDER BY id DESC" % ",".join(["?"] * len(session_ids)), tuple(session_ids))
+        else:
+            result = self.__execute("SELECT id, started, stopped, count, summary FROM sessions ORDER BY id DESC")
+        return ["%s %s %s %s" % x[:4] + ("" if x[4] is None else " " + x[4]) for x in result]
+
+    def get_session_metadata(self, session_id):
+        """
+        Gets the metadata for the given session
+
+        :param session_id: the ID of the session to get metadata for
+        :returns: a dictionary with start, end, count, boards and (once stopped) summary keys (empty if the
+            session does not exist)
+        """
+        result = self.__execute("SELECT started, stopped, count, boards, summary FROM sessions WHERE id = ?",
+                                (session_id,))
+        if not result:
+            return {}
+
+        meta = dict(zip(["start", "end", "count", "boards"], [str(x) for x in result[0][:4]]))
+        if result[0][4] is not None:
+            meta["summary"] = result[0][4]
+        return meta
+
+    def store_session_preview(self, session_id, preview):
+        """
+        Stores the decimated preview of a session
+
+        :param session_id: the ID of the session
+        :param preview: the preview as a JSON string
+        """
+        self.__execute("UPDATE sessions SET preview = ? WHERE id = ?", (preview, session_id), True)
+
+    def get_session_preview(self, session_id):
+        """
+        Gets the stored preview of a session
+
+        :param session_id: the ID of the session
+        :returns: the preview as a JSON string, or None if no preview has been stored
+        """
+        result = self.__execute("SELECT preview FROM sessions WHERE id = ?", (session_id,))
+        return result[0][0] if result else None
+
+
+#: The DatabaseServer implementations which can be selected with the "database_backend" server setting
+DATABASE_BACKENDS = {
+    "list": RedisDatabaseServer,
+    "stream": StreamDatabaseServer,
+    "embedded": EmbeddedDatabaseServer
+}
@@ -0,0 +1,270 @@
+__author__ = 'Will Hart'
+
+import math
+import threading
+import time
+
+
+class DownloadCursor(object):
+    """
+    Reads a session download from storage in fixed size chunks as each chunk is requested by the client, so the
+    memory used by the server is constant regardless of the size of the session.  The cursor reads from an
+    iterable of lists of frames, such as :meth:`blitz.data.database.DatabaseServer.iterate_session`, and holds at
+    most one window of frames and one chunk ahead of the client.
+    """
+
+    CHUNK_FRAMES = 100
+
+    # the largest number of frames sent in a single reply, however many chunks the client grants
+    MAX_REPLY_FRAMES = 5000
+
+    def __init__(self, windows, chunk_frames=None):
+        """
+        Creates the cursor.  Nothing is read until the first chunk is requested
+
+        :param windows: an iterable of lists of hex encoded frames, oldest first
+        :param chunk_frames: the number of frames in each chunk (default CHUNK_FRAMES, at most MAX_REPLY_FRAMES)
+        """
+        self.chunk_frames = min(chunk_frames or self.CHUNK_FRAMES, self.MAX_REPLY_FRAMES)
+        self.sent = 0
+        self.__windows = iter(windows)
+        self.__buffer = []
+        self.__exhausted = False
+
+    @property
+    def finished(self):
+        """
+        True once every frame has been read from the cursor
+        """
+        self.__fill()
+        return not self.__buffer
+
+    def next_chunk(self):
+        """
+        Reads the next chunk of frames
+
+        :returns: a list of up to `chunk_frames` frames, or an empty list if every frame has been read
+        """
+        self.__fill()
+        chunk, self.__buffer = self.__buffer[:self.chunk_frames], self.__buffer[self.chunk_frames:]
+        self.sent += len(chunk)
+        return chunk
+
+    def next_chunks(self, window):
+        """
+        Reads the chunks granted by the client for the next reply
+
+        :param window: the number of chunks granted, which is limited so a reply holds at most MAX_REPLY_FRAMES
+        :returns: a list of up to `window` chunks of frames joined together, or an empty list if every frame
+            has been read
+        """
+        window = max(1, min(window, self.MAX_REPLY_FRAMES // self.chunk_frames))
+        result = []
+
+        for i in range(0, window):
+            chunk = self.next_chunk()
+            if not chunk:
+                break
+            result += chunk
+
+        return result
+
+    def close(self):
+        """
+        Stops reading, for instance when the client abandons the download
+        """
+        if hasattr(self.__windows, "close"):
+            self.__windows.close()
+        self.__buffer = []
+        self.__exhausted = True
+
+    def __fill(self):
+        while not self.__exhausted and len(self.__buffer) < self.chunk_frames:
+            try:
+                self.__buffer += next(self.__windows)
+            except StopIteration:
+                self.__exhausted = True
+
+
+class DownloadWindow(object):
+    """
+    Chooses the number of chunks the client grants the server for each reply during a download.  Each reply
+    costs one round trip, so the window is sized from the measured round trip time (RTT) and throughput to keep
+    the time spent waiting on round trips to about ``1 / (1 + RTT_MULTIPLE)`` of the transfer:
+
+    - the RTT is the shortest time taken for any reply
+    - the throughput is a moving average of the frames per second received after the RTT is taken away
+    - the window doubles after each reply until the throughput can be measured
+    """
+
+    MAX_WINDOW = 64
+    RTT_MULTIPLE = 4.0
+
+    def __init__(self, chunk_frames=None, max_window=None):
+        """
+        :param chunk_frames: the number of frames in each chunk (default DownloadCursor.CHUNK_FRAMES)
+        :param max_window: the largest window to grant (default MAX_WINDOW)
+        """
+        self.chunk_frames = chunk_frames or DownloadCursor.CHUNK_FRAMES
+        self.max_window = max_window or self.MAX_WINDOW
+        self.window = 1
+        self.rtt = None
+        self.throughput = None
+        self.frames = 0
+        self.elapsed = 0.0
+        self.wire_bytes = 0
+        self.raw_bytes = 0
+
+    def reply_received(self, frames, elapsed, wire_bytes=0, raw_bytes=0):
+        """
+        Updates the window after a reply is received
+
+        :param frames: the number of frames in the reply
+        :param elapsed: the time from sending the request to receiving the reply in seconds
+        :param wire_bytes: the size of the reply as it was sent, which is smaller than the raw size if the
+            reply was compressed
+        :param raw_bytes: the size of the reply once decompressed
+        :returns: the new window
+        """
+        self.frames += frames
+        self.elapsed += elapsed
+        self.wire_bytes += wire_bytes
+        self.raw_bytes += raw_bytes
+        self.rtt = elapsed if self.rtt is None else min(self.rtt, elapsed)
+
+        transfer = elapsed - self.rtt
+        if frames and transfer > 0:
+            rate = frames / transfer
+            self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+
+        if self.throughput is None:
+            window = self.window * 2
+        else:
+            window = int(math.ceil(self.throughput * self.rtt * self.RTT_MULTIPLE / self.chunk_frames))
+
+        self.window = max(1, min(window, self.max_window))
+        return self.window
+
+    def average_rate(self):
+        """
+        :returns: the average number of frames received per second over the whole download
+        """
+        return self.frames / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class RateLimiter(object):
+    """
+    A token bucket which limits the rate data is sent at.  The bucket holds up to `burst` bytes and fills at
+    `rate` bytes per second, and a reply waits until the bucket holds enough bytes for it.  Replies larger than
+    the bucket wait until it is full and then empty it, so large replies are sent at the same average rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Creates the rate limiter with a full bucket
+
+        :param rate: the average rate in bytes per second
+        :param burst: the size of the bucket in bytes (default one second at the average rate)
+        :raises ValueError: if the rate is not positive
+        """
+        if rate <= 0:
+            raise ValueError("The download rate limit must be positive")
+
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.__tokens = self.burst
+        self.__updated = None
+
+    def delay(self, size, now=None):
+        """
+        Takes a reply from the bucket
+
+        :param size: the size of the reply in bytes
+        :param now: the current time in seconds (default time.time())
+        :returns: the number of seconds to wait before sending the reply
+        """
+        now = time.time() if now is None else now
+        if self.__updated is not None:
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+        needed = min(size, self.burst)
+        wait = max(0.0, (needed - self.__tokens) / self.rate)
+
+        # the bucket fills while waiting, and the reply is taken from it once it is sent
+        self.__tokens = self.__tokens + wait * self.rate - size
+        self.__updated = now + wait
+        return wait
+
+    def wait(self, size):
+        """
+        Sleeps until a reply can be sent
+
+        :param size: the size of the reply in bytes
+        """
+        wait = self.delay(size)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class DownloadQueue(object):
+    """
+    The sessions waiting to be downloaded by the client.  A REQ socket only has one request in flight, so the
+    sessions are downloaded one after another, oldest first.  The queue is shared by the UI and TCP threads
+    """
+
+    def __init__(self):
+        self.current = None
+        self.__pending = []
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__pending) + (0 if self.current is None else 1)
+
+    def add(self, session_ids):
+        """
+        Queues sessions for download.  Sessions which are already queued or downloading are ignored
+
+        :param session_ids: the list of session IDs to download
+        :returns: the number of sessions which were queued
+        """
+        with self.__lock:
+            added = [x for x in session_ids if x != self.current and x not in self.__pending]
+            self.__pending += added
+            return len(added)
+
+    def next(self):
+        """
+        Takes the next session to download from the queue, unless a session is already downloading
+
+        :returns: the session ID to download, or None if a download is in progress or the queue is empty
+        """
+        with self.__lock:
+            if self.current is not None or not self.__pending:
+                return None
+
+            self.current = self.__pending.pop(0)
+            return self.current
+
+    def finished(self, session_id):
+        """
+        Marks a download as finished
+
+        :param session_id: the ID of the session which stopped downloading
+        :returns: True if the session was downloaded from the queue
+        """
+        with self.__lock:
+            if session_id != self.current:
+                return False
+
+            self.current = None
+            return True
+
+    def clear(self):
+        """
+        Empties the queue, for instance when the connection to the logger is closed
+        """
+        with self.__lock:
+            self.current = None
+            self.__pending = []
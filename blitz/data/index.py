@@ -0,0 +1,134 @@
+__author__ = 'Will Hart'
+
+import json
+
+from blitz.utilities import frame_timestamp
+
+
+class TimeIndex(object):
+    """
+    A sparse index of a session, which maps board timestamps to positions in the session so that a time window
+    or a subset of boards can be read without reading the whole session.  The stored frames are divided into
+    blocks of BLOCK_FRAMES frames, and for each block the index holds the position of its first frame, the
+    number of frames and the earliest and latest timestamp from each board.  Each board has its own clock, so the
+    timestamps are kept per board.
+
+    The index is serialised as compact JSON in the format::
+
+        [[POSITION, FRAMES, {"08": [EARLIEST TIMESTAMP, LATEST TIMESTAMP], ...}], ...]
+
+    where the timestamps are null if the frames from a board in the block have no timestamp.
+    """
+
+    BLOCK_FRAMES = 1000
+
+    def __init__(self, blocks=None, block_frames=None):
+        """
+        Creates an index
+
+        :param blocks: the index blocks, or None for an empty index
+        :param block_frames: the number of frames in each block (default BLOCK_FRAMES)
+        """
+        self.blocks = blocks or []
+        self.block_frames = block_frames or self.BLOCK_FRAMES
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Loads an index which was serialised with :meth:`to_json`
+
+        :param data: the JSON string
+        :returns: the index
+        """
+        return cls(json.loads(data))
+
+    def to_json(self):
+        """
+        :returns: the index as compact JSON
+        """
+        return json.dumps(self.blocks, separators=(",", ":"), sort_keys=True)
+
+    def __len__(self):
+        if not self.blocks:
+            return 0
+        return self.blocks[-1][0] + self.blocks[-1][1]
+
+    def add_many(self, frames):
+        """
+        Adds stored frames to the index
+
+        :param frames: the list of hex encoded frames, in the order they were stored
+        """
+        for frame in frames:
+            if not self.blocks or self.blocks[-1][1] >= self.block_frames:
+                self.blocks.append([len(self), 0, {}])
+
+            block = self.blocks[-1]
+            block[1] += 1
+
+            # frames without a timestamp only match when there is no time window
+            timestamp = frame_timestamp(frame)
+            board_range = block[2].get(frame[0:2])
+
+            if board_range is None or board_range[0] is None:
+                block[2][frame[0:2]] = [timestamp, timestamp]
+            elif timestamp is not None:
+                board_range[0] = min(board_range[0], timestamp)
+                board_range[1] = max(board_range[1], timestamp)
+
+    def find(self, start=None, end=None, boards=None):
+        """
+        Finds the parts of the session which may hold frames matching the filters
+
+        :param start: the first board timestamp to include in milliseconds, or None to start from the first frame
+        :param end: the last board timestamp to include in milliseconds, or None to read to the last frame
+        :param boards: a list of upper case hex board IDs to include, or None to include every board
+        :returns: a list of (position, number of frames) tuples, with adjacent blocks merged
+        """
+        result = []
+
+        for position, frames, board_ranges in self.blocks:
+            if not self.__matches(board_ranges, start, end, boards):
+                continue
+
+            if result and result[-1][0] + result[-1][1] == position:
+                result[-1] = (result[-1][0], result[-1][1] + frames)
+            else:
+                result.append((position, frames))
+
+        return result
+
+    @staticmethod
+    def __matches(board_ranges, start, end, boards):
+        for board_id, (earliest, latest) in board_ranges.iteritems():
+            if boards is not None and board_id.upper() not in boards:
+                continue
+            if earliest is None and (start is not None or end is not None):
+                continue
+            if (start is None or latest >= start) and (end is None or earliest <= end):
+                return True
+        return False
+
+
+def frame_filter(start=None, end=None, boards=None):
+    """
+    Creates a function which checks if a frame matches the time window and board filters
+
+    :param start: the first board timestamp to include in milliseconds, or None for no lower limit
+    :param end: the last board timestamp to include in milliseconds, or None for no upper limit
+    :param boards: a list of upper case hex board IDs to include, or None to include every board
+    :returns: a function which takes a hex encoded frame and returns True if the frame matches
+    """
+    def matches(frame):
+        if boards is not None and frame[0:2].upper() not in boards:
+            return False
+
+        if start is None and end is None:
+            return True
+
+        timestamp = frame_timestamp(frame)
+        if timestamp is None:
+            return False
+        return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+
+    return matches
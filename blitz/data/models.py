@@ -68,7 +68,10 @@ class Reading(SQL_BASE):
 
 class Session(SQL_BASE):
     """
-    A model class for representing logging session
+    A model class for representing logging session.  The `resolution` is None if the full session has been
+    downloaded, or the DOWNLOAD options (e.g. "POINTS=2000") if the downloaded copy was decimated or filtered.
+    Downloading the full session again replaces the copy and clears the resolution.  The number of frames
+    received is kept in `downloaded`, so that a download can be resumed from where it stopped
     """
     __tablename__ = 'session'
 
@@ -78,6 +81,39 @@ class Session(SQL_BASE):
     timeStarted = Column(Integer)
     timeStopped = Column(Integer)
     numberOfReadings = Column(Integer)
+    summary = Column(String)
+    resolution = Column(String)
+    downloaded = Column(Integer, default=0)
+
+    def get_summary(self):
+        """
+        Gets the summary statistics calculated by the server when the session stopped
+
+        :returns: a dictionary with "boards" frame counts and "channels" min/max/mean/count statistics (see
+            :class:`blitz.data.summary.SessionSummary`), or None if the server sent no summary
+        """
+        return None if self.summary is None else json.loads(self.summary)
+
+    def is_complete(self):
+        """
+        :returns: True if the downloaded copy of the session is the full session, False if it was decimated
+            or filtered when it was downloaded
+        """
+        return not self.resolution
+
+    def describe_boards(self):
+        """
+        :returns: a short description of the number of frames logged by each board and the compression ratio
+            if frames were dropped by the server, e.g. "08: 1200, 09: 40 (4.0x)"
+        """
+        summary = self.get_summary()
+        if not summary:
+            return ""
+
+        result = ", ".join(["%s: %s" % (k, v) for k, v in sorted(summary["boards"].items())])
+        if "compression" in summary:
+            result += " (%sx)" % summary["compression"]["ratio"]
+        return result
 
     def to_dict(self):
         """
@@ -91,7 +127,10 @@ class Session(SQL_BASE):
             "available": self.available,
             "timeStarted": 0.0 if self.timeStarted == "None" else float(self.timeStarted),
             "timeStopped": 0.0 if self.timeStopped == "None" else float(self.timeStopped),
-            "numberOfReadings": self.numberOfReadings
+            "numberOfReadings": self.numberOfReadings,
+            "summary": self.get_summary(),
+            "resolution": self.resolution,
+            "downloaded": self.downloaded or 0
         }
 
     def __str__(self):
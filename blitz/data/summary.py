@@ -0,0 +1,524 @@
+__author__ = 'Will Hart'
+
+import json
+import logging
+import Queue
+import threading
+
+from blitz.communications.signals import session_stopped
+from blitz.utilities import frame_timestamp
+
+
+class BoardDecoder(object):
+    """
+    Decodes raw frames into named variables on the server using the expansion board schemas, so that
+    statistics can be calculated without the client downloading the session.
+
+    Board instances hold the last message they parsed, so each thread decodes with its own instances of the
+    board classes rather than the registered plugins, and decoding does not send the data_line_processed signal
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, boards=None):
+        """
+        Creates the decoder
+
+        :param boards: a dictionary of expansion boards by numeric board ID, which are only used for their
+            types.  If None the registered expansion board plugins are used
+        """
+        if boards is None:
+            from blitz.communications.boards import BaseExpansionBoard
+            boards = dict([(x.id, x) for x in BaseExpansionBoard.plugins if x.id >= 0])
+
+        self.boards = boards
+        self.__local = threading.local()
+
+    def decode(self, frame):
+        """
+        Decodes a frame using the schema of the board that sent it
+
+        :param frame: the hex encoded frame
+        :returns: a dictionary of variable names and values, or None if the frame cannot be decoded
+        """
+        try:
+            board = self.__board(int(frame[0:2], 16))
+        except (KeyError, ValueError):
+            return None
+
+        try:
+            board.parse_message(frame, notify=False)
+            return board.get_variables()
+        except Exception:
+            return None
+
+    def __board(self, board_id):
+        """
+        :returns: the calling thread's instance of the board with the given ID
+        :raises KeyError: if there is no board with the given ID
+        """
+        boards = getattr(self.__local, "boards", None)
+        if boards is None:
+            boards = self.__local.boards = {}
+
+        board = boards.get(board_id)
+        if board is None:
+            board = boards[board_id] = type(self.boards[board_id])()
+        return board
+
+
+class SessionSummary(object):
+    """
+    Summary statistics for a logging session which are updated incrementally as frames are logged:
+
+    - the number of frames from each board
+    - the minimum, maximum and mean of each channel decoded by the :class:`BoardDecoder`
+    - the number of frames stored and the compression ratio, if some frames were not stored
+    - the segments of the session captured as bursts (see :class:`blitz.data.burst.BurstCapture`), if any
+
+    The summary is serialised as compact JSON in the format::
+
+        {
+            "boards": {"08": 1200, ...},
+            "channels": {"adc_channel_one": {"min": 0, "max": 1023, "mean": 512.4, "count": 1200}, ...},
+            "compression": {"frames": 1200, "stored": 300, "ratio": 4.0},
+            "segments": [{"trigger": "adc_channel_one rising", "start": {"08": 1500}, "end": {"08": 6500}, ...}]
+        }
+    """
+
+    def __init__(self, decoder=None):
+        """
+        Creates an empty summary
+
+        :param decoder: the :class:`BoardDecoder` used to calculate channel statistics, or None to only
+            count frames
+        """
+        self.decoder = decoder
+        self.boards = {}
+        self.channels = {}
+        self.frames = 0
+        self.stored = None
+        self.segments = []
+
+    def add_many(self, frames, variables=None):
+        """
+        Adds frames to the summary
+
+        :param frames: a list of hex encoded frames
+        :param variables: the decoded variables of each frame, or None to decode the frames with the decoder
+        """
+        self.frames += len(frames)
+
+        for i, frame in enumerate(frames):
+            board_id = frame[0:2]
+            self.boards[board_id] = self.boards.get(board_id, 0) + 1
+
+            if self.decoder is None:
+                continue
+
+            values = self.decoder.decode(frame) if variables is None else variables[i]
+            if not values:
+                continue
+
+            for key, value in values.iteritems():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+
+                # [min, max, sum, count]
+                stats = self.channels.get(key)
+                if stats is None:
+                    self.channels[key] = [value, value, value, 1]
+                else:
+                    stats[0] = min(stats[0], value)
+                    stats[1] = max(stats[1], value)
+                    stats[2] += value
+                    stats[3] += 1
+
+    def add_stored(self, count):
+        """
+        Counts frames which were stored, after any compression.  The compression ratio is only reported once
+        stored frames are counted
+
+        :param count: the number of frames stored
+        """
+        self.stored = (self.stored or 0) + count
+
+    def to_dict(self):
+        """
+        :returns: the summary as a dictionary
+        """
+        result = {
+            "boards": self.boards,
+            "channels": dict([(k, {"min": v[0], "max": v[1], "mean": v[2] / v[3], "count": v[3]})
+                              for k, v in self.channels.iteritems()])
+        }
+
+        if self.stored is not None and self.stored < self.frames:
+            result["compression"] = {
+                "frames": self.frames,
+                "stored": self.stored,
+                "ratio": round(float(self.frames) / max(1, self.stored), 2)
+            }
+
+        if self.segments:
+            result["segments"] = self.segments
+
+        return result
+
+    def to_json(self):
+        """
+        :returns: the summary as compact JSON without spaces, so it can be sent as one field of the session list
+        """
+        return json.dumps(self.to_dict(), separators=(",", ":"), sort_keys=True)
+
+
+class LatestValues(object):
+    """
+    An in-memory table of the most recent frame logged by each board and the most recent value of each channel
+    decoded by the :class:`BoardDecoder`, which is updated as frames are logged so that status requests can be
+    answered without reading the session.  The table can be read and written from different threads.
+    """
+
+    def __init__(self, decoder=None):
+        """
+        Creates an empty table
+
+        :param decoder: the :class:`BoardDecoder` used to decode channel values, or None to only hold frames
+        """
+        self.decoder = decoder
+        self.__frames = {}
+        self.__values = {}
+        self.__lock = threading.Lock()
+
+    def add_many(self, frames, variables=None):
+        """
+        Updates the table with logged frames.  Only the newest frame from each board is decoded
+
+        :param frames: a list of hex encoded frames, oldest first
+        :param variables: the decoded variables of each frame, or None to decode the frames with the decoder
+        """
+        newest = {}
+        for i, frame in enumerate(frames):
+            newest[frame[0:2]] = i
+
+        values = {}
+        if self.decoder is not None:
+            for i in newest.itervalues():
+                values.update((self.decoder.decode(frames[i]) if variables is None else variables[i]) or {})
+
+        with self.__lock:
+            self.__frames.update([(k, frames[v]) for k, v in newest.iteritems()])
+            self.__values.update(values)
+
+    def frames(self):
+        """
+        :returns: the newest frame from each board, ordered by board ID
+        """
+        with self.__lock:
+            return [self.__frames[x] for x in sorted(self.__frames.keys())]
+
+    def values(self):
+        """
+        :returns: a dictionary of the newest value of each channel by variable name
+        """
+        with self.__lock:
+            return dict(self.__values)
+
+    def clear(self):
+        """
+        Empties the table, for instance when a new session starts
+        """
+        with self.__lock:
+            self.__frames = {}
+            self.__values = {}
+
+
+class SessionPreview(object):
+    """
+    A fixed size, min/max decimated copy of every channel in a session which can be sent to the client in place
+    of the full session.  Frames are divided by position into `buckets` equal buckets and the minimum and maximum
+    of each channel is kept for each bucket, so spikes are still visible in the preview.
+
+    The preview is serialised as compact JSON in the format::
+
+        {
+            "frames": 250000,
+            "buckets": 1000,
+            "channels": {"adc_channel_one": [[BUCKET START TIME, MIN, MAX], ...], ...}
+        }
+
+    where the bucket start time is the timestamp of the first frame in the bucket in milliseconds
+    """
+
+    BUCKETS = 1000
+
+    def __init__(self, decoder, number_of_frames, buckets=None):
+        """
+        Creates an empty preview
+
+        :param decoder: the :class:`BoardDecoder` used to decode frames
+        :param number_of_frames: the number of frames in the session, used to size the buckets
+        :param buckets: the number of buckets for each channel (default BUCKETS)
+        """
+        self.decoder = decoder
+        self.number_of_frames = max(1, number_of_frames)
+        self.buckets = buckets or self.BUCKETS
+        self.channels = {}
+        self.__current = {}
+        self.__index = 0
+
+    def add_many(self, frames):
+        """
+        Adds frames to the preview, in the order they were logged
+
+        :param frames: a list of hex encoded frames
+        """
+        for frame in frames:
+            bucket = self.__index * self.buckets // self.number_of_frames
+            self.__index += 1
+
+            variables = self.decoder.decode(frame)
+            if not variables:
+                continue
+
+            for key, value in variables.iteritems():
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+
+                # [bucket, start time, min, max]
+                current = self.__current.get(key)
+                if current is None or current[0] != bucket:
+                    if current is not None:
+                        self.channels.setdefault(key, []).append(current[1:])
+                    self.__current[key] = [bucket, frame_timestamp(frame), value, value]
+                else:
+                    current[2] = min(current[2], value)
+                    current[3] = max(current[3], value)
+
+    def to_dict(self):
+        """
+        :returns: the preview as a dictionary
+        """
+        channels = dict([(k, list(v)) for k, v in self.channels.iteritems()])
+        for key, current in self.__current.iteritems():
+            channels.setdefault(key, []).append(current[1:])
+
+        return {"frames": self.__index, "buckets": self.buckets, "channels": channels}
+
+    def to_json(self):
+        """
+        :returns: the preview as compact JSON
+        """
+        return json.dumps(self.to_dict(), separators=(",", ":"), sort_keys=True)
+
+
+class FrameDecimator(object):
+    """
+    Reduces the resolution of a session as it is downloaded, so that long sessions can be inspected without
+    transferring every frame.  Each board is decimated separately, either by:
+
+    - *step* - keeping every `step`-th frame from the board
+    - *points* - dividing the frames by position into ``points // 2`` equal buckets and keeping the frames which
+      hold the minimum and maximum of each channel in the bucket, so each channel has about `points` values and
+      spikes are still downloaded.  The first frame from a board in each bucket is kept if the board's frames
+      cannot be decoded
+
+    The frames which are kept are returned unchanged, in the order they were logged.
+    """
+
+    def __init__(self, decoder, step=None, points=None, number_of_frames=0):
+        """
+        Creates the decimator
+
+        :param decoder: the :class:`BoardDecoder` used to decode frames for min/max buckets
+        :param step: keep every `step`-th frame from each board (default None - use `points`)
+        :param points: the target number of values of each channel (default None - use `step`)
+        :param number_of_frames: the number of frames which will be decimated, used to size the buckets
+        :raises ValueError: if neither or both of `step` and `points` are given
+        """
+        if (step is None) == (points is None):
+            raise ValueError("Either step or points must be given to decimate a session")
+
+        self.decoder = decoder
+        self.step = step
+        self.buckets = None if points is None else max(1, points // 2)
+        self.number_of_frames = max(1, number_of_frames)
+        self.__counts = {}
+        self.__bucket = 0
+        self.__kept = {}
+        self.__index = 0
+
+    def decimate(self, frames):
+        """
+        Decimates frames in the order they were logged
+
+        :param frames: a list of hex encoded frames
+        :returns: the list of frames to send, oldest first.  Frames in the current bucket are held back until a
+            later frame starts a new bucket or :meth:`flush` is called
+        """
+        if self.step is not None:
+            return [x for x in frames if self.__next_count(x[0:2]) % self.step == 0]
+
+        result = []
+        for frame in frames:
+            bucket = self.__index * self.buckets // self.number_of_frames
+            self.__index += 1
+
+            if bucket != self.__bucket:
+                result += self.flush()
+                self.__bucket = bucket
+
+            self.__add(self.__index, frame)
+
+        return result
+
+    def flush(self):
+        """
+        Releases the frames kept from the current bucket
+
+        :returns: the list of frames, oldest first
+        """
+        positions = {}
+        for board_kept in self.__kept.values():
+            for kept in board_kept.values():
+                positions[kept[0]] = kept[1]
+
+        self.__kept = {}
+        return [positions[x] for x in sorted(positions.keys())]
+
+    def __next_count(self, board_id):
+        count = self.__counts.get(board_id, 0)
+        self.__counts[board_id] = count + 1
+        return count
+
+    def __add(self, position, frame):
+        """
+        Keeps a frame if it holds the minimum or maximum of any channel from its board in the current bucket
+        """
+        board_kept = self.__kept.setdefault(frame[0:2], {})
+        variables = self.decoder.decode(frame) or {}
+
+        for key, value in variables.iteritems():
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+
+            minimum = board_kept.get(("min", key))
+            if minimum is None or value < minimum[2]:
+                board_kept[("min", key)] = (position, frame, value)
+
+            maximum = board_kept.get(("max", key))
+            if maximum is None or value > maximum[2]:
+                board_kept[("max", key)] = (position, frame, value)
+
+        if not board_kept:
+            board_kept["first"] = (position, frame)
+
+
+class PreviewBuilder(object):
+    """
+    Builds a :class:`SessionPreview` for each session on a background thread when the session stops, and stores
+    it with the session in the DatabaseServer so it can be sent to clients without reading the session again
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, database, decoder=None, buckets=None):
+        """
+        Creates the builder and starts its background thread
+
+        :param database: the DatabaseServer to build previews for
+        :param decoder: the :class:`BoardDecoder` used to decode frames (default - a decoder for the registered
+            expansion boards)
+        :param buckets: the number of buckets in each preview (default SessionPreview.BUCKETS)
+        """
+        self.database = database
+        self.decoder = decoder or BoardDecoder()
+        self.buckets = buckets
+        self.__queue = Queue.Queue()
+        self.__pending = set()
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+
+        database.add_threads()
+        self.__thread = threading.Thread(target=self.run, args=[self.__stop_event])
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        session_stopped.connect(self.session_stopped)
+
+    def session_stopped(self, session_id):
+        """
+        Queues the stopped session to have its preview built
+
+        :param session_id: the session which stopped
+        """
+        self.request_preview(session_id)
+
+    def request_preview(self, session_id):
+        """
+        Queues a session to have its preview built, for instance a session which stopped before previews were
+        available.  A session which is already queued is not queued again
+
+        :param session_id: the ID of the session
+        """
+        with self.__lock:
+            if str(session_id) in self.__pending:
+                return
+            self.__pending.add(str(session_id))
+        self.__queue.put(session_id)
+
+    def build_preview(self, session_id):
+        """
+        Builds and stores the preview for a session
+
+        :param session_id: the ID of the session
+        :returns: the preview as a JSON string
+        """
+        meta = self.database.get_session_metadata(session_id)
+        number_of_frames = int(meta.get("count", 0))
+
+        preview = SessionPreview(self.decoder, number_of_frames, self.buckets)
+        for frames in self.database.iterate_session(session_id):
+            preview.add_many(frames)
+
+        result = preview.to_json()
+        self.database.store_session_preview(session_id, result)
+        self.logger.info("Built preview of %s frames for session %s" % (number_of_frames, session_id))
+        return result
+
+    def run(self, stop_event):
+        """
+        The builder thread, which builds previews for queued sessions until the stop_event is set
+        """
+        self.logger.debug("Preview builder started")
+
+        while not stop_event.is_set():
+            try:
+                session_id = self.__queue.get(True, 0.5)
+            except Queue.Empty:
+                continue
+
+            try:
+                self.build_preview(session_id)
+            except Exception as e:
+                self.logger.error("Unable to build preview for session %s" % session_id)
+                self.logger.error(e)
+
+            with self.__lock:
+                self.__pending.discard(str(session_id))
+
+        self.logger.debug("Preview builder stopped")
+
+    def stop(self):
+        """
+        Stops the builder thread
+        """
+        session_stopped.disconnect(self.session_stopped)
+        self.__stop_event.set()
+        self.__thread.join()
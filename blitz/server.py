@@ -3,12 +3,19 @@ __author__ = 'Will Hart'
 import json
 import logging
 import os
+from redis import ConnectionError
 
 from blitz.constants import CommunicationCodes
 from blitz.communications.netscanner import NetScannerManager
 from blitz.communications.rs232 import SerialManager
 import blitz.communications.signals as sigs
+from blitz.communications.server_states import ServerChannelIdleState
 from blitz.communications.tcp import TcpBase
+from blitz.data.archive import SessionArchiver
+from blitz.data.buffer import BufferedDatabaseServer, FrameRingBuffer
+from blitz.data.database import DATABASE_BACKENDS
+from blitz.data.download import DownloadCursor, RateLimiter
+from blitz.data.summary import BoardDecoder, FrameDecimator, PreviewBuilder
 
 
 class Config(object):
@@ -27,7 +34,32 @@ class Config(object):
         self.settings = {
             "application_path": os.path.dirname(__file__),
             "tcp_port": 8999,
+            "tcp_asynchronous": False,
+            "download_port": 9000,
+            "download_rate_limit": 250000,
+            "database_host": "localhost",
             "database_port": 6379,
+            "database_socket": None,
+            "database_index": 0,
+            "database_max_connections": None,
+            "database_backend": "list",
+            "database_path": None,
+            "database_stream_maxlen": None,
+            "database_packed": False,
+            "database_frames_per_element": 1,
+            "buffer_frames": 4096,
+            "buffer_slot_size": 512,
+            "buffer_path": None,
+            "summary_channels": False,
+            "preview_buckets": 1000,
+            "compression_channels": {},
+            "burst_triggers": [],
+            "burst_pre_frames": 50,
+            "burst_post_seconds": 5.0,
+            "burst_period": 0.05,
+            "archive_sessions": False,
+            "archive_path": None,
+            "archive_hot_sessions": 3,
             "debug": True,
             "use_netscanner": False
         }
@@ -122,15 +154,38 @@ class ApplicationServer(object):
         # load configuration
         self.config = Config()
 
+        # create the database. Each thread which uses it is added where the thread is created
+        database = self.create_database()
+
+        # move old sessions out of the database into archive files
+        self.archiver = None
+        if database is not None and database.archive_path is not None:
+            self.archiver = SessionArchiver(database, self.config["archive_hot_sessions"])
+
+        # build decimated previews of sessions when they stop
+        self.previews = None
+        if database is not None:
+            self.previews = PreviewBuilder(database, database.decoder, self.config["preview_buckets"])
+
+        # log through a shared memory ring buffer so acquisition does not wait for the database
+        if database is not None and self.config["buffer_frames"]:
+            ring_buffer = FrameRingBuffer(self.config["buffer_frames"], self.config["buffer_slot_size"],
+                                          self.config["buffer_path"])
+            database = BufferedDatabaseServer(database, ring_buffer)
+
         # TODO: Implement plugin interface
         # create a serial server
-        self.serial_server = SerialManager.Instance()
+        if database is not None:
+            database.add_threads()
+        self.serial_server = SerialManager.Instance(database)
         self.logger.info("Initialised serial manager")
 
         # TODO: Implement plugin interface
         # create a NetScanner server
         if (self.config['use_netscanner']):
             db = self.serial_server.database
+            if db is not None:
+                db.add_threads(2)
             self.netscanner = [
                 NetScannerManager(db, self.config['netscanner_one_ip'], "0A"),
                 NetScannerManager(db, self.config['netscanner_two_ip'], "0B")
@@ -140,23 +195,72 @@ class ApplicationServer(object):
         sigs.client_requested_session_list.connect(self.update_session_list)
         sigs.server_status_request.connect(self.serve_client_status)
         sigs.client_requested_download.connect(self.serve_client_download)
+        sigs.client_requested_preview.connect(self.serve_client_preview)
         sigs.board_list_requested.connect(self.send_connected_boards)
 
-        # start the TCP server
-        self.tcp = TcpBase(port=self.config["tcp_port"])
+        # start the TCP server, whose state machine thread reads from the database
+        if database is not None:
+            database.add_threads()
+        self.tcp = TcpBase(port=self.config["tcp_port"], asynchronous=self.config["tcp_asynchronous"])
         self.tcp.create_server()
         self.is_running = True
         self.logger.info("Started TCP on port %s" % self.config["tcp_port"])
 
-    def update_session_list(self, args):
+        # start the download channel, which serves downloads while the main channel is logging
+        self.download_tcp = None
+        if self.config["download_port"]:
+            if database is not None:
+                database.add_threads()
+            self.download_tcp = TcpBase(
+                port=self.config["download_port"], asynchronous=self.config["tcp_asynchronous"])
+            if self.config["download_rate_limit"]:
+                self.download_tcp.rate_limiter = RateLimiter(self.config["download_rate_limit"])
+            self.download_tcp.create_server(ServerChannelIdleState)
+            self.logger.info("Started download channel on port %s" % self.config["download_port"])
+
+    def create_database(self):
+        """
+        Creates the DatabaseServer from the configuration
+
+        :returns: the DatabaseServer, or None if the database could not be reached
+        """
+        try:
+            backend = DATABASE_BACKENDS[self.config["database_backend"]]
+        except KeyError:
+            self.logger.critical("Unknown database backend '%s'" % self.config["database_backend"])
+            return None
+
+        try:
+            return backend.from_config(self.config)
+        except ConnectionError as e:
+            self.logger.critical("ConnectionError when attempting to start the DatabaseServer!")
+            self.logger.critical(e)
+        return None
+
+    def update_session_list(self, options=None):
         """
-        Sends the client the list of logged sessions
+        Sends the client the list of logged sessions.  If the request had SESSION_LIST_OPTIONS only the sessions
+        which changed since the client's version of the list are sent, after a header in the format::
+
+            VERSION <version> [FULL] [MORE]
+
+        and followed by a ``DELETED <id>`` line for each deleted session
+
+        :param options: a dictionary of SESSION_LIST_OPTIONS by lower case key, or None to send the whole list
         """
         self.logger.debug("Server sending out updated session list")
 
         if self.serial_server.database is None:
             self.logger.warn("Unable to generate session list - no database")
             self.tcp.send(CommunicationCodes.Negative)
+        elif options is not None:
+            version, full, more, sessions, deleted = self.serial_server.database.build_session_list_changes(
+                options.get("since", 0), options.get("limit"))
+            header = CommunicationCodes.with_options(
+                CommunicationCodes.composite(CommunicationCodes.Version, version), {"full": full, "more": more})
+            lines = [header] + sessions + [CommunicationCodes.composite(CommunicationCodes.Deleted, x) for x in deleted]
+            self.tcp.send("\n".join(lines) + "\n" + CommunicationCodes.Negative)
+            self.logger.debug("Session list changes since version %s queued for sending" % options.get("since", 0))
         else:
             sessions = self.serial_server.database.build_client_session_list()
             sessions_string = "\n".join([x for x in sessions])
@@ -166,21 +270,81 @@ class ApplicationServer(object):
 
     def serve_client_status(self, args):
         """
-        Sends the client the last serial message received from a board
+        Sends the client the newest serial message received from each board in the current session, one per
+        line.  Sends an empty message if no boards have logged yet
+        """
+        self.tcp.send("\n".join(self.serial_server.database.get_latest_frames()))
 
-        # TODO - improve to send the last serial message from each connected given board in serial_mapping
+    def serve_client_download(self, session_id, options=None, tcp=None):
+        """
+        Sends the client the data from a session, filtered by the START, END and BOARD download options and
+        decimated by the STEP or POINTS download options if given.  The first OFFSET matching frames are skipped,
+        so an interrupted download can be resumed.  The session is read in windows as each chunk
+        is requested by the client, in chunks of CHUNK frames (see :class:`blitz.data.download.DownloadCursor`)
+
+        :param session_id: the ID of the session to download
+        :param options: a dictionary of DOWNLOAD_OPTIONS by lower case key (default None - the whole session)
+        :param tcp: the TcpBase the download was requested on (default the main channel)
         """
-        message = self.serial_server.database.get_latest_from_session(self.serial_server.database.session_id)
-        self.tcp.send(message)
+        options = options or {}
+        (tcp or self.tcp).send(DownloadCursor(self.read_download(session_id, options), options.get("chunk")))
 
-    def serve_client_download(self, session_id):
-        # get all the session data from the database
-        session_data = self.serial_server.database.get_all_from_session(session_id)
+    def read_download(self, session_id, options):
+        """
+        A generator which reads the frames to download from the database in windows
 
-        # split into rows of 100 readings then pass to the state manager for dispatch
-        # todo set the '100' value to a constant
-        split_session_data = [session_data[i:i + 100] for i in range(0, len(session_data), 100)]
-        self.tcp.send(split_session_data)
+        :param session_id: the ID of the session to download
+        :param options: a dictionary of DOWNLOAD_OPTIONS by lower case key
+        """
+        filters = {"start": options.get("start"), "end": options.get("end"), "boards": options.get("board")}
+        decimator = self.create_decimator(session_id, options, filters)
+
+        offset = options.get("offset", 0)
+        for frames in self.serial_server.database.iterate_session(session_id, offset=offset, **filters):
+            yield frames if decimator is None else decimator.decimate(frames)
+
+        if decimator is not None:
+            yield decimator.flush()
+
+    def create_decimator(self, session_id, options, filters):
+        """
+        Creates the FrameDecimator for a reduced resolution download
+
+        :param session_id: the ID of the session being downloaded
+        :param options: a dictionary of DOWNLOAD_OPTIONS by lower case key
+        :param filters: the keyword arguments used to filter the session
+        :returns: the FrameDecimator, or None if the STEP and POINTS options were not given
+        """
+        if options.get("step") is None and options.get("points") is None:
+            return None
+
+        if options.get("step") is not None:
+            return FrameDecimator(None, step=options["step"])
+
+        decoder = self.previews.decoder if self.previews is not None else BoardDecoder()
+        number_of_frames = self.serial_server.database.count_frames(session_id, **filters)
+        return FrameDecimator(decoder, points=options["points"], number_of_frames=number_of_frames)
+
+    def serve_client_preview(self, session_id):
+        """
+        Sends the client the decimated preview of a session as JSON.  Sends NACK if there is no preview, and
+        queues the preview to be built if the session stopped before previews were available, so the client can
+        request it again once it is ready
+        """
+        database = self.serial_server.database
+        if database is None or str(session_id) == str(database.session_id):
+            self.tcp.send(CommunicationCodes.Negative)
+            return
+
+        preview = database.get_session_preview(session_id)
+        if preview is None and database.get_session_metadata(session_id):
+            # reading the whole session would hold up every other request, so it is built in the background
+            self.previews.request_preview(session_id)
+
+        if preview is None:
+            self.tcp.send(CommunicationCodes.Negative)
+        else:
+            self.tcp.send(preview + "\n" + CommunicationCodes.Negative)
 
     def send_connected_boards(self, args=None):
         """
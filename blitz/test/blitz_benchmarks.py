@@ -0,0 +1,102 @@
+"""
+Throughput benchmarks for the server side data store.  These require a Redis server running
+on localhost and are not run as part of the unit tests.  Run them with::
+
+    python -m blitz.test.blitz_benchmarks
+"""
+
+__author__ = 'Will Hart'
+
+import time
+
+from blitz.data.database import RedisDatabaseServer
+from blitz.utilities import generate_tcp_server_fixtures
+
+FRAMES_PER_POLL = 50
+NUMBER_OF_POLLS = 200
+MEMORY_FRAMES = 100000
+
+
+def generate_polls(frames_per_poll=FRAMES_PER_POLL, number_of_polls=NUMBER_OF_POLLS):
+    """
+    Generates a list of polls, each containing a list of hex encoded frames
+    """
+    frame = generate_tcp_server_fixtures().hex
+    return [[frame] * frames_per_poll for i in range(number_of_polls)]
+
+
+def run_session(db, polls, batched):
+    """
+    Queues the given polls in a new session and returns the elapsed time in seconds.
+    The session is deleted afterwards so the benchmark leaves no data behind
+    """
+    session_id = db.start_session()
+    start = time.time()
+
+    for poll in polls:
+        if batched:
+            db.queue_many(poll)
+        else:
+            for frame in poll:
+                db.queue(frame)
+
+    elapsed = time.time() - start
+    db.stop_session()
+    db.delete_session(session_id)
+    return elapsed
+
+
+def benchmark_queue():
+    """
+    Compares queueing frames one at a time with queueing each poll using queue_many
+    """
+    db = RedisDatabaseServer()
+    polls = generate_polls()
+    frames = sum([len(x) for x in polls])
+
+    single = run_session(db, polls, False)
+    batched = run_session(db, polls, True)
+
+    print "Queued %s frames in polls of %s" % (frames, FRAMES_PER_POLL)
+    print "    queue:      %8.3f s  %10.0f frames/s" % (single, frames / single)
+    print "    queue_many: %8.3f s  %10.0f frames/s" % (batched, frames / batched)
+    print "    speed up:   %8.1fx" % (single / batched)
+
+
+def measure_memory(db, frames):
+    """
+    Queues the given frames in a new session and returns the increase in redis memory in bytes.
+    The session is deleted afterwards so the benchmark leaves no data behind
+    """
+    before = db._data.info()["used_memory"]
+    session_id = db.start_session()
+
+    for i in range(0, len(frames), FRAMES_PER_POLL):
+        db.queue_many(frames[i:i + FRAMES_PER_POLL])
+
+    used = db._data.info()["used_memory"] - before
+    db.stop_session()
+    db.delete_session(session_id)
+    return used
+
+
+def benchmark_memory():
+    """
+    Reports the redis memory used per million frames for hex and packed storage
+    """
+    db = RedisDatabaseServer()
+    frames = [generate_tcp_server_fixtures().hex for i in range(MEMORY_FRAMES)]
+    scale = 1000000.0 / MEMORY_FRAMES / (1024 * 1024)
+
+    print "Redis memory per million frames"
+    for packed, frames_per_element in [(False, 1), (True, 1), (True, 10), (True, FRAMES_PER_POLL)]:
+        db.packed = packed
+        db.frames_per_element = frames_per_element
+        used = measure_memory(db, frames)
+        print "    %-6s %3s frames/element: %8.1f MB" % (
+            "packed" if packed else "hex", frames_per_element, used * scale)
+
+
+if __name__ == "__main__":
+    benchmark_queue()
+    benchmark_memory()
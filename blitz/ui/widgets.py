@@ -107,6 +107,33 @@ class BlitzLoggingWidget(Qt.QWidget):
             self.axis.legend(loc='upper left')
             self.canvas.draw()
 
+    def plot_preview(self, session_id, preview):
+        """
+        Plots the decimated preview of a session as a min/max band for each channel.  The preview is not added
+        to the data container, so it is replaced by the full session data when that is viewed
+
+        :param session_id: the ID of the session being previewed
+        :param preview: the preview dictionary (see :class:`blitz.data.summary.SessionPreview`)
+        """
+        self.axis.cla()
+        self.__lines = {}
+        self.axis.set_title("Preview of session %s (%s frames)" % (session_id, preview["frames"]))
+        self.axis.set_xlabel("Time Logged (s)")
+        self.axis.set_ylabel("Value")
+
+        for name in sorted(preview["channels"].keys()):
+            buckets = preview["channels"][name]
+            x = [b[0] / 1000.0 for b in buckets]
+            y_min = [b[1] for b in buckets]
+            y_max = [b[2] for b in buckets]
+
+            line, = self.axis.plot(x, y_max, '-', linewidth=0.5, label=name.replace("_", " ").title())
+            self.axis.fill_between(x, y_min, y_max, color=line.get_color(), alpha=0.3)
+
+        if preview["channels"]:
+            self.axis.legend(loc='upper left')
+        self.canvas.draw()
+
     def clear_graphs(self):
         """
         Clears the graphs in the logging display
@@ -167,6 +194,19 @@ class BlitzTableView(Qt.QWidget):
 
         self.variable_table.setHorizontalHeaderLabels(self.__headers)
 
+    def append_data(self, data):
+        """
+        Appends rows to the end of the table without clearing the existing rows
+
+        :param data: the 2d list of rows to add
+        """
+        start = self.variable_table.rowCount()
+        self.variable_table.setRowCount(start + len(data))
+
+        for i, row in enumerate(data):
+            for j, val in enumerate(row):
+                self.variable_table.setItem(start + i, j, Qt.QTableWidgetItem("{0}".format(val)))
+
 
 class BlitzSessionTabPane(BlitzTableView):
     """
@@ -187,12 +227,25 @@ class BlitzSessionTabPane(BlitzTableView):
         self.download_button.clicked.connect(self.download_session)
         self.download_button.setEnabled(False)
 
+        # button for downloading every session which has not been downloaded
+        self.download_missing_button = Qt.QPushButton(Qt.QIcon('blitz/static/img/desktop_download.png'),
+                                                      "Download All", self)
+        self.download_missing_button.setFlat(True)
+        self.download_missing_button.clicked.connect(self.download_missing_sessions)
+        self.download_missing_button.setEnabled(False)
+
         # button for saving sessions
         self.save_button = Qt.QPushButton(Qt.QIcon('blitz/static/img/desktop_save.png'),"Export", self)
         self.save_button.setFlat(True)
         self.save_button.clicked.connect(self.save_session)
         self.save_button.setEnabled(False)
 
+        # button for previewing sessions without downloading them
+        self.preview_button = Qt.QPushButton(Qt.QIcon('blitz/static/img/desktop_graph_large.png'), "Preview", self)
+        self.preview_button.setFlat(True)
+        self.preview_button.clicked.connect(self.preview_session)
+        self.preview_button.setEnabled(False)
+
         # button for viewing session plots
         self.view_series_button = Qt.QPushButton(Qt.QIcon('blitz/static/img/desktop_graph_large.png'),"View", self)
         self.view_series_button.setFlat(True)
@@ -208,15 +261,18 @@ class BlitzSessionTabPane(BlitzTableView):
         Sets a flag indicating whether the logger is currently connected
         """
         self.__connected = connected
+        self.download_missing_button.setEnabled(connected)
 
     def build_layout(self):
         # revised grid
         self.grid = Qt.QGridLayout()
-        self.grid.addWidget(self.variable_table, 0, 0, 5, 5)
+        self.grid.addWidget(self.variable_table, 0, 0, 6, 5)
         self.grid.addWidget(self.download_button, 0, 5)
-        self.grid.addWidget(self.save_button, 1, 5)
-        self.grid.addWidget(self.view_series_button, 2, 5)
-        self.grid.addWidget(self.delete_session_button, 3, 5)
+        self.grid.addWidget(self.download_missing_button, 1, 5)
+        self.grid.addWidget(self.save_button, 2, 5)
+        self.grid.addWidget(self.view_series_button, 3, 5)
+        self.grid.addWidget(self.delete_session_button, 4, 5)
+        self.grid.addWidget(self.preview_button, 5, 5)
         self.setLayout(self.grid)
 
     def selection_changed(self):
@@ -226,6 +282,7 @@ class BlitzSessionTabPane(BlitzTableView):
         # update GUI
         self.save_button.setEnabled(self.__selected_id >= 0 and (items[0].text() == "X" or self.__connected))
         self.download_button.setEnabled(self.__selected_id >= 0 and self.__connected)
+        self.preview_button.setEnabled(self.__selected_id >= 0 and self.__connected)
         # self.view_series_button.setEnabled(self.__selected_id >= 0)
         # self.delete_session_button.setEnabled(self.__selected_id >= 0)
 
@@ -234,6 +291,18 @@ class BlitzSessionTabPane(BlitzTableView):
             return
         self.trigger_session_download(self.__selected_id)
 
+    def download_missing_sessions(self):
+        """
+        Downloads every session which has not been downloaded in the background
+        """
+        sigs.client_requested_missing_sessions.send()
+
+    def preview_session(self):
+        if self.__selected_id < 0:
+            return
+        sigs.process_started.send("Downloading session preview")
+        sigs.client_requested_preview.send(self.__selected_id)
+
     @staticmethod
     def trigger_session_download(session_id):
         """
@@ -24,6 +24,9 @@ class GUISignalEmitter(QtCore.QObject):
     logging_started = QtCore.Signal()
     logging_stopped = QtCore.Signal()
     boards_updated = QtCore.Signal(dict)
+    sessions_loaded = QtCore.Signal(list)
+    cache_loaded = QtCore.Signal(list)
+    preview_received = QtCore.Signal(int, dict)
 
     def __init__(self):
         super(GUISignalEmitter, self).__init__()
@@ -34,6 +37,9 @@ class GUISignalEmitter(QtCore.QObject):
         sigs.logging_started.connect(self.trigger_logging_started)
         sigs.logging_stopped.connect(self.trigger_logging_stopped)
         sigs.board_list_processed.connect(self.trigger_boards_updated)
+        sigs.client_sessions_loaded.connect(self.trigger_sessions_loaded)
+        sigs.client_cache_loaded.connect(self.trigger_cache_loaded)
+        sigs.preview_received.connect(self.trigger_preview_received)
 
     def trigger_connection_lost(self, args):
         self.tcp_lost.emit()
@@ -56,6 +62,16 @@ class GUISignalEmitter(QtCore.QObject):
     def trigger_boards_updated(self, boards):
         self.boards_updated.emit(boards)
 
+    def trigger_sessions_loaded(self, sessions):
+        self.sessions_loaded.emit(sessions)
+
+    def trigger_cache_loaded(self, cached_items):
+        self.cache_loaded.emit(cached_items)
+
+    def trigger_preview_received(self, args):
+        session_id, preview = args
+        self.preview_received.emit(session_id, preview)
+
 
 class MainBlitzApplication(ApplicationClient):
 
@@ -69,6 +85,9 @@ class MainBlitzApplication(ApplicationClient):
         self.gui_application.setStyle("plastique")
         self.gui_application.window = MainBlitzWindow(self)
         self.gui_application.setWindowIcon(Qt.QIcon('blitz/static/img/blitz.png'))
+
+        # now the window is shown, load the session list and cache in the background
+        self.hydrate_async()
         sys.exit(self.gui_application.exec_())
 
     def update_interface(self, data, replace_existing=False):
@@ -106,10 +125,16 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         self.__signaller.logging_started.connect(self.logging_started_ui_update)
         self.__signaller.logging_stopped.connect(self.logging_stopped_ui_update)
         self.__signaller.boards_updated.connect(self.update_connected_boards)
+        self.__signaller.sessions_loaded.connect(self.append_sessions)
+        self.__signaller.cache_loaded.connect(self.load_cached_data)
+        self.__signaller.preview_received.connect(self.show_preview)
 
         # create a data context for managing data
         self.__container = DataContainer()
 
+        # True once the whole session list has been shown, after which batches loaded at start up are ignored
+        self.__session_list_replaced = False
+
         self.application = app
 
         self.initialise_window()
@@ -280,11 +305,10 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         self.plot_widget = BlitzLoggingWidget(self.__container)
         self.variable_widget = BlitzTableView(["Variable", "Value"])
         self.variable_widget.build_layout()
-        self.session_list_widget = BlitzSessionTabPane(["", "ID", "Readings", "Date"], self.application)
+        self.session_list_widget = BlitzSessionTabPane(["", "ID", "Readings", "Date", "Boards"], self.application)
         self.session_list_widget.build_layout()
         self.board_list_widget = BlitzTableView(["ID", "Description"])
         self.board_list_widget.build_layout()
-        self.update_session_list()
 
         # tabbed widget for session and variable
         self.__tab_widget = Qt.QTabWidget()
@@ -366,9 +390,50 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
         # update the variable view from the container
         self.variable_widget.set_data(self.__container.get_latest(named=True))
 
+    def load_cached_data(self, cached_items):
+        """
+        Plots the cached data loaded from the local database in the background on start up
+
+        :param cached_items: a list of cached variables in the format returned by BoardManager.parse_message
+        """
+        self.application.update_interface(cached_items)
+
+    def show_preview(self, session_id, preview):
+        """
+        Plots a session preview received from the logger
+
+        :param session_id: the ID of the previewed session
+        :param preview: the preview dictionary
+        """
+        self.plot_widget.plot_preview(session_id, preview)
+        self.status_bar.showMessage("Showing a preview of session %s, download the session to view all data" %
+                                    session_id)
+
     def update_session_list(self):
         # first get the list of sessions
         raw_sessions = self.application.data.all(Session)
+        self.session_list_widget.set_data(self.build_session_rows(raw_sessions))
+        self.__session_list_replaced = True
+
+    def append_sessions(self, raw_sessions):
+        """
+        Appends a batch of sessions to the session list, used when the session list is loaded incrementally.
+        Batches which arrive after the whole list has been shown are ignored, as they are already in the list
+
+        :param raw_sessions: a list of Session objects to add to the session list
+        """
+        if self.__session_list_replaced:
+            return
+        self.session_list_widget.append_data(self.build_session_rows(raw_sessions))
+
+    @staticmethod
+    def build_session_rows(raw_sessions):
+        """
+        Converts a list of Session objects into rows for display in the session list
+
+        :param raw_sessions: the Session objects to convert
+        :returns: a list of [available, ID, readings, date, boards] rows
+        """
         sessions = []
 
         for sess in raw_sessions:
@@ -378,10 +443,11 @@ class MainBlitzWindow(Qt.QMainWindow, BlitzGuiMixin):
                 "X" if sess.available else "",
                 sess.ref_id,
                 sess.numberOfReadings,
-                dt
+                dt,
+                sess.describe_boards()
             ])
 
-        self.session_list_widget.set_data(sessions)
+        return sessions
 
     def set_motor_position(self):
         """
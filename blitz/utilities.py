@@ -1,5 +1,6 @@
 __author__ = 'Will Hart'
 
+import binascii
 from datetime import datetime
 from math import ceil
 import time
@@ -32,6 +33,83 @@ def blitz_strftimestamp(timestamp):
     return datetime.fromtimestamp(timestamp / 1000).strftime('%Y-%m-%d %H:%M:%S')
 
 
+#: The first byte of a packed frame string, which can never appear at the start of a hex encoded frame
+PACKED_FRAME_MARKER = "\x02"
+
+#: The first byte of a string packed by earlier versions, whose frames are unpacked as upper case hex
+UPPER_CASE_PACKED_FRAME_MARKER = "\x01"
+
+#: Set in the length byte of a packed frame which was lower case hex
+LOWER_CASE_FLAG = 0x80
+
+
+def pack_hex_frames(frames):
+    """
+    Packs a list of hex encoded frames into a single binary string made up of PACKED_FRAME_MARKER
+    followed by a one byte length and the raw bytes of each frame.  This is roughly half the size
+    of the hex encoded frames.  The case of each frame is recorded in the LOWER_CASE_FLAG bit of its
+    length, so frames unpack exactly as they were received.
+
+    :param frames: the list of hex encoded frames to pack
+    :returns: the packed string, or None if any of the frames is not valid hex, mixes upper and lower
+        case or is longer than 127 bytes
+    """
+    parts = [PACKED_FRAME_MARKER]
+
+    for frame in frames:
+        try:
+            raw = binascii.unhexlify(frame)
+        except (TypeError, binascii.Error):
+            return None
+
+        lower = frame != frame.upper()
+        if len(raw) >= LOWER_CASE_FLAG or (lower and frame != frame.lower()):
+            return None
+
+        parts.append(chr(len(raw) | (LOWER_CASE_FLAG if lower else 0)) + raw)
+
+    return "".join(parts)
+
+
+def unpack_hex_frames(packed):
+    """
+    Unpacks a string created by pack_hex_frames into a list of hex encoded frames in the case they were
+    packed in.  Strings which were not packed are returned unchanged as a single frame
+
+    :param packed: the packed string
+    :returns: a list of hex encoded frames
+    """
+    if not packed or packed[0] not in (PACKED_FRAME_MARKER, UPPER_CASE_PACKED_FRAME_MARKER):
+        return [packed]
+
+    legacy = packed[0] == UPPER_CASE_PACKED_FRAME_MARKER
+    frames = []
+    idx = 1
+    while idx < len(packed):
+        header = ord(packed[idx])
+        lower = not legacy and header & LOWER_CASE_FLAG
+        length = header if legacy else header & ~LOWER_CASE_FLAG
+
+        frame = binascii.hexlify(packed[idx + 1:idx + 1 + length])
+        frames.append(frame if lower else frame.upper())
+        idx += length + 1
+
+    return frames
+
+
+def frame_timestamp(frame):
+    """
+    Gets the timestamp from a raw hex encoded frame (bits 16 to 48 of the message)
+
+    :param frame: the hex encoded frame
+    :returns: the integer timestamp in milliseconds or None if it could not be parsed
+    """
+    try:
+        return int(frame[4:12], 16)
+    except ValueError:
+        return None
+
+
 def generate_tcp_server_fixtures():
     """
     Generate a random reading at the given datetime for a BlitzBasic board